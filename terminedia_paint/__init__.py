@@ -1,23 +1,31 @@
+import argparse
 import asyncio
+import os
 import time
 import random
 from ast import literal_eval
 from collections.abc import Sequence
-from itertools import product
+from contextlib import nullcontext
+from itertools import cycle, product
 from math import ceil
 from pathlib import Path
 
 import sys, traceback
 
-from PIL import Image
-
 import terminedia as TM
 from terminedia import V2
 from terminedia.input import KeyCodes
-from terminedia.transformers.library import box_transformers
 from terminedia.values import EMPTY
 from terminedia.widgets import WidgetCancelled
 
+from terminedia_paint import latency
+from terminedia_paint.canvas import Canvas, Viewport
+from terminedia_paint.damage import DamageTracker
+from terminedia_paint.fill import SpanFill
+from terminedia_paint.journal import DEFAULT_MAX_BYTES, UndoJournal
+from terminedia_paint.strokes import StrokeBuffer, polyline_points
+from terminedia_paint.subcells import LAYOUTS, BitPlane
+
 __version__ = "0.1.1"
 
 """
@@ -74,6 +82,20 @@ class SimplePaintTool:
         else:
             self.draw.reset(pos)
 
+    def set_points(self, points):
+        op = self.draw.reset if self.erase else self.draw.set
+        # bit planes write the changed characters once, at the end
+        with getattr(self.draw, "plane", None) or nullcontext():
+            for pos in points:
+                op(pos)
+
+    def scroll(self, delta):
+        """Called when the drawing moves by 'delta' on the screen"""
+        if self.last_set:
+            self.last_set = V2(self.last_set) + delta
+        if getattr(self, "one_to_last_click", None):
+            self.one_to_last_click = V2(self.one_to_last_click) + delta
+
     def handle_key(self, key):
 
         if key == " ":
@@ -115,6 +137,8 @@ class PathTypeTool(SimplePaintTool):
         self.tick = 0
         self.last_direction_change = -2
         self.mode = "line"
+        self.path_graph = {}
+        self.path_cells = set()
 
     def start(self):
         super().start()
@@ -141,6 +165,8 @@ class PathTypeTool(SimplePaintTool):
         for cursor in self.cursores or (self.parent.pos,):
             self.rendered.append((cursor, self.shape[cursor].value))
             self.shape.text[self.text_plane][cursor] = key
+            if key != TM.values.FULL_BLOCK:
+                self.path_cells.discard(cursor)
         self.advance_cursores()
 
     def advance_cursores(self):
@@ -152,15 +178,12 @@ class PathTypeTool(SimplePaintTool):
                 # the two cursores sub-list strategy is to avoid duplicating the cursores in
                 # a stepped corner in a single line: that is, if there is at least one straight path,
                 # that one is taken and diagonals are ignored. if there are only diagonals, those are taken
-                new_cursores_diag = []
-                new_cursores_straight = []
-                for delta in map(V2, product((-1, 0, 1),(-1, 0, 1))):
-                    if delta == (0, 0):
-                        continue
-                    new_pos = cursor + delta
-                    if self.shape[new_pos].value == TM.values.FULL_BLOCK:
-                        (new_cursores_straight if 0 in delta else new_cursores_diag).append(new_pos)
-                new_cursores.update(new_cursores_straight or new_cursores_diag)
+                straight, diagonal = self.path_graph.get(cursor, ((), ()))
+                path_cells = self.path_cells
+                new_cursores.update(
+                    [pos for pos in straight if pos in path_cells] or
+                    [pos for pos in diagonal if pos in path_cells]
+                )
 
         self.cursores = list(new_cursores)
 
@@ -169,14 +192,83 @@ class PathTypeTool(SimplePaintTool):
             return
         position, previous_char = self.rendered.pop()
         self.shape[position] = previous_char
+        if previous_char == TM.values.FULL_BLOCK and position in self.path_graph:
+            self.path_cells.add(position)
         self.cursores = [position]
 
+    def build_path_graph(self, pos):
+        """Labels the FULL_BLOCK region connected to 'pos', and indexes its neighbours
+
+        Each position in the region maps to its straight and diagonal neighbours
+        in the same region, so that advancing the cursores takes no
+        reads from the shape. 'path_cells' holds the positions still not typed over.
+        """
+        rect = self.shape.rect
+        get_raw = self.shape.get_raw
+        deltas = [V2(delta) for delta in product((-1, 0, 1), (-1, 0, 1)) if delta != (0, 0)]
+
+        pos = V2(pos)
+        is_path = {pos: True}
+        graph = {}
+        pending = [pos]
+        while pending:
+            cell = pending.pop()
+            straight, diagonal = [], []
+            for delta in deltas:
+                new_pos = cell + delta
+                if new_pos not in is_path:
+                    is_path[new_pos] = new_pos in rect and get_raw(new_pos)[0] == TM.values.FULL_BLOCK
+                    if is_path[new_pos]:
+                        pending.append(new_pos)
+                if is_path[new_pos]:
+                    (straight if 0 in delta else diagonal).append(new_pos)
+            graph[cell] = (tuple(straight), tuple(diagonal))
+        self.path_graph = graph
+        self.path_cells = set(graph)
+
+    def scroll(self, delta):
+        super().scroll(delta)
+        self.cursores = [cursor + delta for cursor in self.cursores]
+        self.rendered = [(pos + delta, char) for pos, char in getattr(self, "rendered", ())]
+        # the path moves along: cells already typed over stay out of 'path_cells',
+        # and backspace can still give them back
+        self.path_graph = {
+            pos + delta: (tuple(cell + delta for cell in straight), tuple(cell + delta for cell in diagonal))
+            for pos, (straight, diagonal) in self.path_graph.items()
+        }
+        self.path_cells = {pos + delta for pos in self.path_cells}
+
     def toggle_point(self, pos):
         self.cursores = [pos,]
         if self.shape[pos].value == TM.values.FULL_BLOCK:
             self.mode = "path"
+            self.build_path_graph(pos)
         else:
             self.mode = "line"
+            self.path_graph = {}
+            self.path_cells = set()
+
+
+class Tools(dict):
+    """Painting tools, created when first used
+
+    Only the tools created so far are in the dict: iterating over it
+    does not build the others.
+    """
+
+    def __init__(self, parent, factories):
+        super().__init__()
+        self.parent = parent
+        self.factories = factories
+
+    def __missing__(self, name):
+        parent = self.parent
+        tool = self[name] = self.factories[name](parent, parent.sc.shape)
+        # drawing at the current resolution, as if it had been there when it was set
+        drawable = getattr(parent, "drawable", None)
+        if drawable is not None:
+            tool.reset(drawable.draw)
+        return tool
 
 
 resolutions = {
@@ -193,20 +285,59 @@ POINTER_CHAR = "*"
 class Painter():
     active_widgets = []
 
-    def __init__(self):
-        self.sc = TM.Screen()
-        self.sc.shape.undo_active = True
+    def __init__(
+        self, undo_memory=DEFAULT_MAX_BYTES, ansi_colors="truecolor", screen=None, trace=None, palette="truecolor",
+        autosave=False, broadcast=None
+    ):
+        self.sc = screen or TM.Screen()
         self.pointer = TM.Sprite(TM.shape((1,1)))
         # self.pointer.transformers.append(PaintCursorTransformer)
         self.sc.shape.sprites.add(self.pointer)
+        self.dither = False
+        self.filling = None
+        self.damage = DamageTracker(self.sc)
+        self.viewport = Viewport(self.sc.shape, Canvas())
+        self.journal = UndoJournal(self.sc.shape, max_bytes=undo_memory, viewport=self.viewport)
+        self.strokes = StrokeBuffer()
+        # sub-cell resolutions drawn through bit planes, created when first used
+        self.bit_planes = {}
+        self.animation = None
+        self.playing = None
+        self.layers = None
+        self.ansi_colors = ansi_colors
+        # colors pasted or picked are reduced to this terminal palette
+        self.palette = palette
+        # the Autosave is only created when the app runs
+        self.autosave_enabled = autosave
+        self.autosave = None
+        self._recovery = None
+        self.broadcaster = None
+        if broadcast:
+            from terminedia_paint.broadcast import Broadcaster
+            # binds right away: an address in use is reported before the screen is taken over
+            self.broadcaster = Broadcaster(self.sc.shape, broadcast)
+        # latency tracing wraps the handlers, and the frame rendering set up by DamageTracker
+        self.tracer = latency.instrument(self, trace) if trace else None
         TM.context.fps = 20
 
+    @property
+    def canvas(self):
+        """The canvas being drawn on: that of the active layer"""
+        return self.viewport.canvas
+
     def event_setup(self):
         TM.events.Subscription(TM.events.KeyPress, self.key_dispatcher)
         TM.events.Subscription(TM.events.MouseClick, self.mouse_click)
         TM.events.Subscription(TM.events.MouseDoubleClick, self.mouse_double_click)
         TM.events.Subscription(TM.events.MouseRelease, self.mouse_release)
         TM.events.Subscription(TM.events.MouseMove, self.mouse_move)
+        TM.events.Subscription(TM.events.Tick, self.flush_stroke)
+        TM.events.Subscription(TM.events.Tick, self.journal.tick)
+        if self.broadcaster:
+            TM.events.Subscription(TM.events.Tick, self.broadcaster.tick)
+        if self.menu is None:
+            self._first_tick = TM.utils.get_current_tick() + 1
+            self._menu_subscription = TM.events.Subscription(TM.events.Tick, self._build_menu_later)
 
     def tool_setup(self):
         self.global_shortcuts = {
@@ -219,6 +350,8 @@ class Painter():
             "b": (self.pick_background, "Background Color"),
             "l": (self.pick_character, "Pick Char"),
             "i": (self.insert_image, "Paste Image"),
+            "^d": (self.toggle_dither, "Toggle image dither"),
+            "P": (self.pick_palette, "Color palette"),
             "t": (self.typing_tool, "Typing Tool"),
             "1": (lambda e=None: setattr(self, "resolution", 1), "Draw with full chars"),
             "2": (lambda e=None: setattr(self, "resolution", 2), "Draw with 1/2 blocks"),
@@ -228,19 +361,61 @@ class Painter():
             "e": ((lambda e=None: setattr(self, "active_tool", self.tools["erase"])), "Erase"),
             "p": ((lambda e=None: setattr(self, "active_tool", self.tools["paint"])), "Paint"),
             "F": ((lambda e=None: self.sc.draw.fill()), "Fill Image"),
-            "f": ((lambda e=None: self.drawable.draw.floodfill(self.pos)), "Flood Fill"),
-            "^z":((lambda e=None: self.sc.shape.undo()), "Undo"),
-            "^y": ((lambda e=None: self.sc.shape.redo()), "Redo"),
+            "f": (self.flood_fill, "Flood Fill"),
+            "^z":((lambda e=None: self.journal.undo()), "Undo"),
+            "^y": ((lambda e=None: self.journal.redo()), "Redo"),
+            "D": (self.toggle_stats, "Frame stats"),
+            "a": ({
+                "n": (self.new_frame, "New frame"),
+                "d": (self.duplicate_frame, "Duplicate frame"),
+                "r": (self.remove_frame, "Remove frame"),
+                ",": ((lambda e=None: self.step_frame(-1)), "Previous frame"),
+                ".": ((lambda e=None: self.step_frame(1)), "Next frame"),
+                "o": (self.toggle_onion, "Onion skin"),
+                "p": (self.play, "Play"),
+                "w": (self.export_animation, "Export ANSI"),
+            }, "Animation"),
+            "L": ({
+                "n": (self.new_layer, "New layer"),
+                "r": (self.remove_layer, "Remove layer"),
+                ",": ((lambda e=None: self.select_layer(-1)), "Layer below"),
+                ".": ((lambda e=None: self.select_layer(1)), "Layer above"),
+                "-": ((lambda e=None: self.move_layer(-1)), "Move layer down"),
+                "+": ((lambda e=None: self.move_layer(1)), "Move layer up"),
+                "v": (self.toggle_layer, "Show/hide layer"),
+                "o": (self.layer_opacity, "Layer opacity"),
+                "k": (self.layer_key, "Transparency key"),
+            }, "Layers"),
+            "<PGUP>": ((lambda e=None: self.scroll((0, -(self.sc.size.y // 2)), follow=False)), "Scroll up"),
+            "<PGDOWN>": ((lambda e=None: self.scroll((0, self.sc.size.y // 2), follow=False)), "Scroll down"),
+            "<": ((lambda e=None: self.scroll((-(self.sc.size.x // 2), 0), follow=False)), "Scroll left"),
+            ">": ((lambda e=None: self.scroll((self.sc.size.x // 2, 0), follow=False)), "Scroll right"),
+            "<HOME>": ((lambda e=None: self.scroll(V2(0, 0) - self.viewport.origin, follow=False)), "Scroll to origin"),
             "h": ("toggle", "Toggle help"), #(self.toggle_help, "Toggle help"),
             "q": (self.quit, "Quit"),
         }
 
-        self.tools = {
-            "paint": SimplePaintTool(self, self.sc.shape),
-            "erase": SimpleEraseTool(self, self.sc.shape),
-            "typing": PathTypeTool(self, self.sc.shape),
-        }
-        self.menu = TM.widgets.ScreenMenu(self.sc, self.global_shortcuts, columns=3, focus_position=None)
+        self.tools = Tools(self, {
+            "paint": SimplePaintTool,
+            "erase": SimpleEraseTool,
+            "typing": PathTypeTool,
+        })
+        # rendering the menu takes longer than the whole first frame:
+        # it is built right after that, or on the first key pressed
+        self.menu = None
+
+    def build_menu(self):
+        if self.menu is None:
+            self.menu = TM.widgets.ScreenMenu(self.sc, self.global_shortcuts, columns=3, focus_position=None)
+        return self.menu
+
+    def _build_menu_later(self, event):
+        # the first Tick is dispatched in the same update that renders the first frame
+        if event.tick > self._first_tick:
+            self.build_menu()
+            self._menu_subscription.kill()
+            if self._recovery:
+                asyncio.create_task(self.offer_recovery())
 
     def state_reset(self, pos=None, dirty_status=False):
         self.resolution = 1
@@ -262,17 +437,105 @@ class Painter():
             self.tool_setup()
             self.event_setup()
             self.state_reset()
+            if self.autosave_enabled:
+                self.start_autosave()
 
-            asyncio.run(TM.terminedia_main(screen=self.sc))
-            # reached when a QuitLoop event is dispatched
+            clean_exit = False
+            try:
+                asyncio.run(TM.terminedia_main(screen=self.sc))
+                # reached when a QuitLoop event is dispatched
+                clean_exit = True
+            finally:
+                if self.tracer:
+                    self.tracer.close()
+                if self.broadcaster:
+                    self.broadcaster.close()
+                if self.autosave:
+                    # if anything went wrong, the files are left to be recovered
+                    self.autosave.close(discard=clean_exit)
+                if getattr(self, "_save_executor", None) is not None:
+                    # a save or export still running is finished before leaving
+                    self._save_executor.shutdown(wait=True)
+                    self._save_executor = None
             self.sc.commands.moveto(self.sc.size)
 
+    def start_autosave(self):
+        from terminedia_paint import autosave
+
+        orphans = autosave.find_orphans()
+        self._recovery = orphans[0] if orphans else None
+        self.autosave = autosave.Autosave(self.journal)
+
+    async def offer_recovery(self):
+        """Restores the drawing autosaved by a session that did not quit, if the user agrees"""
+        from terminedia_paint import autosave
+
+        paths, self._recovery = self._recovery, None
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(max(path.stat().st_mtime for path in paths if path.exists())))
+        answer = await self._input(f"Recover the drawing autosaved at {when}? (Y/n)", width=3)
+        if answer.lower() != "n":
+            drawing, codec = autosave.load(paths)
+            self._restore(drawing, codec)
+        autosave.remove(paths)
+
+    def _restore(self, drawing, codec):
+        """Draws the frames or layers given by `autosave.load`, after the current ones"""
+        animation = layers = None
+        for index, (cells, settings) in enumerate(drawing):
+            if settings is not None:
+                layers = self._layers()
+                if index:
+                    layers.add()
+                layers.active.name = settings["name"]
+            elif index:
+                animation = self._frames()
+                animation.add()
+            # a single action for each frame or layer: it can be undone
+            self.journal.begin()
+            try:
+                for pos, value in cells.items():
+                    self.viewport.set(pos, codec.decode(value))
+            finally:
+                self.journal.end()
+            if settings is not None:
+                layers.configure(settings["visible"], settings["opacity"], settings["key"])
+            if cells:
+                self.dirty = True
+        if animation is not None:
+            animation.go(0)
+            self._show_frame_number()
+        if layers is not None:
+            self._layers_changed()
 
     def key_dispatcher(self, event):
         key = event.key
+        self.end_stroke()
+        if self.menu is None:
+            # most shortcuts are handled by the menu: build it, and have the key dispatched again
+            self.build_menu()
+            TM.events.dispatch(event)
+            return
+        if self.filling:
+            if key == KeyCodes.ESC:
+                self.filling.cancel()
+            return
+        if self.playing:
+            # any key stops the playback
+            self.playing.cancel()
+            return
         width = 1
         if self.resolution == 1 and isinstance(self.sc.context.char, TM.unicode.Character) and self.sc.context.char.width=="W":
             width = 2
+        # moving past the screen edges scrolls the canvas
+        step = self.viewport.canvas.tile_size
+        if key == KeyCodes.RIGHT and self.pointer.pos.x >= self.sc.size.x - 1:
+            self.scroll((step.x, 0))
+        elif key == KeyCodes.LEFT and self.pointer.pos.x == 0:
+            self.scroll((-step.x, 0))
+        elif key == KeyCodes.DOWN and self.pointer.pos.y >= self.sc.size.y - 1:
+            self.scroll((0, step.y))
+        elif key == KeyCodes.UP and self.pointer.pos.y == 0:
+            self.scroll((0, -step.y))
         self.previous_pos = self.pos
         if key == KeyCodes.RIGHT and \
                 self.pos.x < self.drawable.size.x:
@@ -289,6 +552,27 @@ class Painter():
 
         self.active_tool.handle_key(key)
 
+    def scroll(self, delta, follow=True):
+        """Moves the viewport over the canvas by 'delta' cells
+
+        With 'follow', the pointer moves along, staying over the same drawing position.
+        """
+        if self.journal.depth or self.filling:
+            # no scrolling in the middle of a stroke or fill
+            return
+        old_origin = self.viewport.origin
+        self.viewport.scroll_to(old_origin + delta)
+        moved = self.viewport.origin - old_origin
+        if moved == (0, 0):
+            return
+        res = resolutions[self.resolution][1]
+        drawing_delta = V2(-moved.x / res.x, -moved.y / res.y).as_int
+        for tool in self.tools.values():
+            tool.scroll(drawing_delta)
+        if follow:
+            self.pointer.pos -= moved
+        self.last_painting_move = (-1, -1)
+
     @property
     def active_tool(self):
         return self._active_tool
@@ -305,9 +589,17 @@ class Painter():
             confirm = await self._input("Confirm quit without save? (y/N)", width=3)
             if confirm.lower() != "y":
                 return
+        elif getattr(self, "_saving", None):
+            # the app waits for it on the way out
+            confirm = await self._input("A save is in progress: quit when it is done? (y/N)", width=3)
+            if confirm.lower() != "y":
+                return
         TM.events.Event(TM.events.QuitLoop)
 
     def mouse_click(self, event):
+        self.end_stroke()
+        if self.filling:
+            return
         #if not TM.inkey() == "v":
         self.active_tool.one_to_last_click = self.active_tool.last_set
         self.active_tool.last_set = None
@@ -323,32 +615,53 @@ class Painter():
         self.sc.context.char = random.choice("#*!|><")
 
     def mouse_move(self, event):
-        if event.tick - getattr(self, "last_dragging_tick", 0) > 1:
+        self.pointer.pos = event.pos
+        if not event.buttons:
+            self.end_stroke()
+        elif not self.filling:
+            if not getattr(self, "_stroke", False):
+                # the whole stroke is undone at once
+                self._stroke = True
+                self.journal.begin()
+            # drawing takes place once per frame, in 'flush_stroke'
+            self.strokes.add(event.pos, event.tick)
+
+    def flush_stroke(self, event=None):
+        """Draws all drag positions collected since the last frame as a single polyline"""
+        if not self.strokes:
+            return
+        if self.strokes.first_tick - getattr(self, "last_dragging_tick", 0) > 1:
             self.drag_drawing = False
-        if event.buttons:
-            if getattr(self, "_undo_group", None) is None:
-                self._undo_group =  True
-                self.sc.shape.undo_group_start()
-            self.pointer.pos = event.pos
-            pos = self.pos
-            if self.last_painting_move == pos:
-                # Avoids acummulating several repeated paiting events on the same position -
-                # each of which generates one UNDO state.
-                # FIXME: have a terminedia public 'undo-group-start' to undo a full stroke at once.
-                return
-            self.active_tool.set_point(pos, interpolate=self.drag_drawing)
-            self.active_tool.last_set = pos
-            self.drag_drawing = True
-            self.last_dragging_tick = event.tick
-            self.dirty = True
-            self.last_painting_move = pos
-        else:
-            self.pointer.pos = event.pos
+        self.last_dragging_tick = self.strokes.last_tick
+        res = resolutions[self.resolution][1]
+        factor = 1 / res[0], 1 / res[1]
+        remainder = self._remainder_pos
+        points = [
+            (int(x * factor[0] + remainder[0]), int(y * factor[1] + remainder[1]))
+            for x, y in self.strokes.take()
+        ]
+        tool = self.active_tool
+        start = tool.last_set if self.drag_drawing and tool.last_set else None
+        tool.set_points(polyline_points(points, start=start))
+        tool.last_set = V2(points[-1])
+        self.drag_drawing = True
+        self.dirty = True
+        self.last_painting_move = tool.last_set
 
     def mouse_release(self, event):
-        if getattr(self, "_undo_group", None):
-            self.sc.shape.undo_group_end()
-            self._undo_group = None
+        self.end_stroke()
+
+    def end_stroke(self):
+        """Closes the mouse stroke in progress, if any
+
+        Besides on mouse release, this is called on any other mouse or key
+        event: a release happening outside the terminal is never seen, and
+        an open stroke would keep scrolling, frames and layers locked.
+        """
+        self.flush_stroke()
+        if getattr(self, "_stroke", False):
+            self.journal.end()
+            self._stroke = False
 
     async def _input(self, label, pos=(0,3), default="", width=30):
 
@@ -367,15 +680,19 @@ class Painter():
         return text
 
     async def load_image_as_shape(self, img_path):
+        from terminedia_paint.export import load_shape
+
         try:
             #self.sc.__exit__(None, None, None)
             #import os; os.system("reset")
-            shape = TM.shape(img_path)
+            shape = load_shape(img_path)
         except (OSError, NotImplementedError):
 
             await self._message(f"Can't open file {img_path}")
             return
-        self.sc.draw.blit(self.pos, shape)
+        from terminedia_paint.palette import quantize_shape
+
+        self.paste(quantize_shape(shape, self.palette))
 
 
     async def insert_image(self, event=None):
@@ -385,35 +702,468 @@ class Painter():
         pure text (without markup, for the time being) and shape "snapshot" files
         """
 
+        from terminedia_paint import ansiparse, tilefile
+
         img_path = await self._input("Load image:")
         if not img_path:
             return
-        try:
-            img_meta = Image.open(img_path)
-        except OSError:
-            await self.load_image_as_shape(img_path)
+        if tilefile.is_tile_file(img_path):
+            await self.paste_tile_file(img_path)
+            return
+        if ansiparse.is_ansi_file(img_path):
+            await self.paste_ansi_file(img_path)
             return
+        from PIL import Image
+        from terminedia_paint import clips
+
+        clip = clips.is_clip(img_path)
+        if not clip:
+            try:
+                img_meta = Image.open(img_path)
+            except OSError:
+                await self.load_image_as_shape(img_path)
+                return
 
         x, y = self.sc.size
-        size_txt = await self._input("Paste width in char blocks ({x}):", width=4)
+        size_txt = await self._input(f"Paste width in char blocks ({x}):", width=4)
         if not size_txt:
             width = x
         else:
             try:
                 width = int(size_txt)
             except ValueError:
+                width = 0
+            if width < 1:
                 await self._message(f"Invalid width {size_txt}")
                 return
 
-        proportion = width / img_meta.size[0]
-        height = int(img_meta.size[1] * proportion)
+        if clip:
+            await self.paste_clip(img_path, width)
+            return
+        self.paste_image(img_path, width)
+
+    def paste_image(self, img_path, width):
+        """Converts an image file at the current resolution and pastes it at the pointer"""
+        from terminedia_paint.imaging import image_to_shape
 
-        img = TM.shape(img_path, size=(width, height), promote=True, resolution="square")
-        self.sc.shape.draw.blit(self.pos, img)
+        img = image_to_shape(img_path, width, resolutions[self.resolution][0], dither=self.dither, colors=self.palette)
+        self.paste(img)
+
+    async def paste_clip(self, path, width):
+        """Pastes the frames of an animated image, video or image directory, each in a new animation frame
+
+        Frames are converted in worker processes, and only the cells that
+        differ from the previous frame are set.
+        """
+        from terminedia_paint import clips
+
+        animation = self._frames()
+        if animation is None:
+            return
+        viewport = self.viewport
+        left, top = viewport.to_canvas(self.pointer.pos)
+        frames = clips.convert(clips.iter_frames(path), width, resolutions[self.resolution][0], self.dither, self.palette)
+        changes = clips.deltas(frames)
+        decode = clips.CellDecoder()
+        loop = asyncio.get_running_loop()
+
+        async def paste_frames():
+            count = 0
+            # the conversion blocks waiting for the workers: it runs in a thread
+            while (frame := await loop.run_in_executor(None, next, changes, None)) is not None:
+                if count:
+                    self._duplicate_frame()
+                self.journal.begin()
+                try:
+                    for (x, y), value in frame:
+                        viewport.set((left + x, top + y), decode(value))
+                finally:
+                    self.journal.end()
+                count += 1
+                self._show_frame_number()
+
+        task = asyncio.create_task(paste_frames())
+        try:
+            await self._progress(f"Importing {path!r}", task)
+            task.result()
+        except OSError as error:
+            await self._message(str(error))
+        finally:
+            changes.close()
         self.dirty = True
 
+    async def paste_tile_file(self, path):
+        """Pastes a ".tpaint" drawing: only the tiles with content are decoded"""
+        from terminedia_paint import tilefile
+
+        try:
+            tile_file = tilefile.TileFile(path)
+        except (OSError, tilefile.FormatError):
+            await self._message(f"Can't open file {path}")
+            return
+        try:
+            with tile_file:
+                if len(tile_file.layers) > 1:
+                    await self.paste_tile_layers(tile_file)
+                    return
+                self.journal.begin()
+                try:
+                    tilefile.paste_tiles(self.viewport, self.viewport.to_canvas(self.pointer.pos), tile_file)
+                finally:
+                    self.journal.end()
+                    self.dirty = True
+        except tilefile.FormatError:
+            # tiles are only decoded now: a damaged one stops the paste half way
+            await self._message(f"Can't read all of {path}")
+
+    async def paste_tile_layers(self, tile_file):
+        """Adds the layers in a ".tpaint" file over the active one - this can't be undone"""
+        from terminedia_paint.canvas import EMPTY_CELL
+        from terminedia_paint.layers import Layer
+
+        layers = self._layers()
+        if layers is None:
+            return
+        left, top = self.viewport.to_canvas(self.pointer.pos)
+        canvas = self.canvas
+        try:
+            for index, settings in enumerate(tile_file.layers):
+                layer = Layer(settings["name"], Canvas(canvas.tile_size, canvas.codec), settings["visible"], settings["opacity"], settings["key"])
+                for key, tiles in tile_file.directory.items():
+                    if index not in tiles:
+                        continue
+                    for x, y, cell in tile_file.iter_cells(key, index):
+                        if cell != EMPTY_CELL:
+                            layer.canvas.set((left + x, top + y), cell)
+                layers.add(layer)
+                if self.autosave:
+                    self.autosave.dump(layer.id, layer.canvas)
+                await asyncio.sleep(0)
+        finally:
+            self._layers_changed()
+
+    async def paste_ansi_file(self, path):
+        """Pastes an ANSI art file, parsed a chunk per frame straight into the canvas"""
+        from terminedia_paint import ansiparse
+
+        from terminedia_paint.palette import quantize_color
+
+        viewport = self.viewport
+        left, top = viewport.to_canvas(self.pointer.pos)
+        colors = self.palette
+
+        def put(pos, cell):
+            if colors != "truecolor":
+                cell = (cell[0], quantize_color(cell[1], colors), quantize_color(cell[2], colors), cell[3])
+            viewport.set((left + pos[0], top + pos[1]), cell)
+
+        async def parse_steps():
+            for _ in ansiparse.parse_file(path, put):
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(parse_steps())
+        self.journal.begin()
+        try:
+            await self._progress(f"Loading {path!r}", task)
+            task.result()
+        except OSError:
+            await self._message(f"Can't open file {path}")
+            return
+        finally:
+            self.journal.end()
+        self.dirty = True
+
+    def paste(self, shape):
+        """Blits 'shape' at the pointer - it may extend beyond the screen"""
+        self.journal.begin()
+        try:
+            self.viewport.blit(self.viewport.to_canvas(self.pointer.pos), shape)
+        finally:
+            self.journal.end()
+        self.dirty = True
+
+    async def flood_fill(self, event=None):
+        """Scanline flood fill, run a slice per frame: <ESC> cancels it"""
+        if self.filling:
+            return
+        fill = self.filling = SpanFill(self.drawable, self.pos)
+
+        async def fill_steps():
+            while not fill.step():
+                await asyncio.sleep(0)
+
+        self.journal.begin()
+        try:
+            await self._progress("Filling - <ESC> cancels", asyncio.create_task(fill_steps()))
+        finally:
+            self.journal.end()
+            self.filling = None
+        if fill.filled:
+            self.dirty = True
+        status = "Fill cancelled after" if fill.cancelled else "Filled"
+        asyncio.create_task(self._message(f"{status} {fill.filled} pixels in {fill.elapsed:.2f}s"))
+
+    def _frames(self):
+        """The animation, created on first use - None while a stroke or fill is in progress"""
+        if self.journal.depth or self.filling:
+            return None
+        if self.layers is not None and len(self.layers) > 1:
+            asyncio.create_task(self._message("Animation frames can't have layers"))
+            return None
+        if self.playing:
+            self.playing.cancel()
+        if self.animation is None:
+            from terminedia_paint.animation import Animation
+            self.animation = Animation(self.viewport, self.journal, self.damage)
+            self._frame_label = TM.widgets.Label(self.sc, text=" " * 22, pos=(self.sc.size.x - 22, 0), focus_position=None)
+            # a focused widget would keep the menu from getting shortcuts
+            self._frame_label.focus = False
+        return self.animation
+
+    def _show_frame_number(self):
+        animation = self.animation
+        text = f"{'onion ' if animation.onion is not None else ''}frame {animation.index + 1}/{len(animation)}"
+        self._frame_label.text = f"{text:>22}"
+        self._log_order()
+
+    def _log_order(self):
+        """Tells autosave which frames or layers the drawing has"""
+        if not self.autosave:
+            return
+        animation, layers = self.animation, self.layers
+        if layers is not None and (animation is None or len(animation) == 1):
+            self.autosave.set_order({"layers": [
+                {"id": layer.id, "name": layer.name, "visible": layer.visible, "opacity": layer.opacity, "key": layer.key}
+                for layer in layers.layers
+            ]})
+        elif animation is not None:
+            self.autosave.set_order({"frames": [frame.id for frame in animation.frames]})
+
+    def _duplicate_frame(self):
+        animation = self.animation
+        source = animation.current
+        animation.duplicate()
+        if self.autosave:
+            # the new frame starts with what the other one has
+            self.autosave.copy(source.id, animation.current.id)
+
+    def new_frame(self, event=None):
+        if self._frames():
+            self.animation.add()
+            self._show_frame_number()
+
+    def duplicate_frame(self, event=None):
+        if self._frames():
+            self._duplicate_frame()
+            self._show_frame_number()
+
+    def remove_frame(self, event=None):
+        if self._frames():
+            self.animation.remove()
+            self._show_frame_number()
+
+    def step_frame(self, delta):
+        if self._frames():
+            self.animation.step(delta)
+            self._show_frame_number()
+
+    def toggle_onion(self, event=None):
+        if self._frames():
+            self.animation.toggle_onion(self.sc.shape)
+            self._show_frame_number()
+
+    async def play(self, event=None):
+        """Plays the frames in a loop at TM.context.fps, until a key is pressed"""
+        animation = self._frames()
+        if not animation or len(animation) < 2:
+            return
+
+        async def loop():
+            while True:
+                await asyncio.sleep(1 / TM.context.fps)
+                animation.step(1)
+                self._show_frame_number()
+
+        onion = animation.onion is not None
+        if onion:
+            animation.toggle_onion(self.sc.shape)
+        self.playing = asyncio.create_task(loop())
+        try:
+            await self.playing
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.playing = None
+            if onion:
+                animation.toggle_onion(self.sc.shape)
+
+    async def export_animation(self, event=None):
+        """Writes the frames as an ANSI animation, which only redraws the cells changed in each frame"""
+        animation = self._frames()
+        if not animation:
+            return
+        file_name = await self._input("Export animation to:", default=getattr(self, "animation_file_name", ""))
+        if not file_name:
+            return
+        self.animation_file_name = file_name
+        from concurrent.futures import ProcessPoolExecutor
+        from terminedia_paint.animation import write_ansi
+
+        if getattr(self, "_save_executor", None) is None:
+            self._save_executor = ProcessPoolExecutor(max_workers=1)
+        rows, updates = animation.export_data()
+        job = asyncio.get_running_loop().run_in_executor(
+            self._save_executor, write_ansi, rows, updates, file_name, self.ansi_colors
+        )
+        try:
+            await self._progress(f"Exporting {len(animation)} frames", job)
+            job.result()
+            asyncio.create_task(self._message(f"Exported {file_name!r}"))
+        except Exception as error:
+            await self._message(f"Error exporting {file_name!r}: {error}")
+
+    def _layers(self):
+        """The layer stack, created on first use - None while a stroke or fill is in progress"""
+        if self.journal.depth or self.filling:
+            return None
+        if self.animation is not None:
+            # both swap what the canvas holds: frames are only kept while there is a single layer
+            if len(self.animation) > 1:
+                asyncio.create_task(self._message("Animation frames can't have layers"))
+                return None
+            if self.animation.onion is not None:
+                self.animation.toggle_onion(self.sc.shape)
+            self.animation = None
+            self._frame_label.kill()
+            if self.layers is not None:
+                # the frame left is what the layer holds now
+                self.layers.active.id = self.journal.target
+        if self.layers is None:
+            from terminedia_paint.layers import LayerStack
+            self.layers = LayerStack(self.viewport, self.journal, self.damage)
+            self._layer_label = TM.widgets.Label(self.sc, text=" " * 22, pos=(self.sc.size.x - 22, 1), focus_position=None)
+            self._layer_label.focus = False
+        return self.layers
+
+    def _layers_changed(self):
+        layers = self.layers
+        layer = layers.active
+        text = f"{layer.name} ({layers.index + 1}/{len(layers)})"
+        if not layer.visible:
+            text = f"hidden {text}"
+        elif layer.opacity < 1:
+            text = f"{layer.opacity:.0%} {text}"
+        self._layer_label.text = f"{text:>22.22}"
+        if self.broadcaster:
+            # composited cells are not set on the shape, so they are not seen as changes
+            self.broadcaster.full = True
+        self.dirty = True
+        self._log_order()
+
+    def new_layer(self, event=None):
+        if self._layers():
+            self.layers.add()
+            self._layers_changed()
+
+    def remove_layer(self, event=None):
+        if self._layers():
+            self.layers.remove()
+            self._layers_changed()
+
+    def select_layer(self, delta):
+        layers = self._layers()
+        if layers and 0 <= layers.index + delta < len(layers):
+            layers.select(layers.index + delta)
+            self._layers_changed()
+
+    def move_layer(self, delta):
+        if self._layers():
+            self.layers.move(delta)
+            self._layers_changed()
+
+    def toggle_layer(self, event=None):
+        if self._layers():
+            self.layers.configure(visible=not self.layers.active.visible)
+            self._layers_changed()
+
+    async def layer_opacity(self, event=None):
+        layers = self._layers()
+        if not layers:
+            return
+        text = await self._input(f"Layer opacity, 0-100% ({layers.active.opacity:.0%}):", width=4)
+        if not text:
+            return
+        try:
+            opacity = float(text.strip().rstrip("%")) / 100
+        except ValueError:
+            await self._message(f"Invalid opacity {text}")
+            return
+        layers.configure(opacity=opacity)
+        self._layers_changed()
+
+    def layer_key(self, event=None):
+        """Makes the current background color transparent on the active layer - or back to opaque, if it already is"""
+        from terminedia_paint.cells import CellCodec
+
+        layers = self._layers()
+        if not layers:
+            return
+        color = self.sc.context.background
+        key = None if getattr(color, "special", None) else CellCodec.encode_color(color)
+        if key == layers.active.key:
+            key = None
+        layers.configure(key=key)
+        self._layers_changed()
+        asyncio.create_task(self._message(f"Transparency key: {'none' if key is None else f'#{key:06x}'}"))
+
+    def toggle_dither(self, event=None):
+        self.dither = not self.dither
+        asyncio.create_task(self._message(f"Image dithering {'on' if self.dither else 'off'}"))
+
+    async def pick_palette(self, event=None):
+        """Sets the palette colors are limited to, converting the drawing to it"""
+        options = {"truecolor": "truecolor", "256 colors": "256", "16 colors": "16"}
+        selector = TM.widgets.Selector(self.sc, options, pos=(0,0), border=True, cancellable=True)
+        try:
+            self.palette = await selector
+        except TM.widgets.WidgetCancelled:
+            return
+        self.reduce_colors()
+
+    def reduce_colors(self):
+        """Replaces all colors in the drawing, and the current ones, by the nearest in the palette"""
+        from terminedia_paint.palette import quantize_canvas, quantize_color
+
+        if self.palette == "truecolor":
+            return
+        self.viewport.sync()
+        if self.layers is not None:
+            # only the active layer can be converted through the journal: the others can't be undone
+            for layer in self.layers.layers:
+                if layer is self.layers.active:
+                    continue
+                for pos, value in quantize_canvas(layer.canvas, self.palette).items():
+                    layer.canvas.set_encoded(pos, value)
+                if self.autosave:
+                    self.autosave.dump(layer.id, layer.canvas)
+            self.layers.invalidate()
+        changes = quantize_canvas(self.canvas, self.palette)
+        self.journal.begin()
+        try:
+            for pos, value in changes.items():
+                self.viewport.set_encoded(pos, value)
+        finally:
+            self.journal.end()
+        context = self.sc.context
+        context.foreground = quantize_color(context.foreground, self.palette)
+        context.background = quantize_color(context.background, self.palette)
+        if changes:
+            self.dirty = True
+
     async def save(self, event=None):
-        img = TM.shape(self.sc.size)
+        if getattr(self, "_saving", None):
+            await self._message("A save is already in progress")
+            return
         file_name = getattr(self, "file_name", "")
         new_file_name = await self._input("Save file name:", default=file_name)
         if not new_file_name:
@@ -421,26 +1171,90 @@ class Painter():
             return
 
         self.file_name = new_file_name
+        job = self.save_job(self.file_name)
+        self.dirty = False
+        if getattr(self, "_save_executor", None) is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._save_executor = ProcessPoolExecutor(max_workers=1)
+        loop = asyncio.get_running_loop()
+        self._saving = loop.run_in_executor(self._save_executor, *job)
+        try:
+            await self._progress(f"SAVING {self.file_name!r}", self._saving)
+            self._saving.result()
+            asyncio.create_task(self._message(f"Saved {self.file_name!r}"))
+        except Exception as error:
+            self.dirty = True
+            await self._message(f"Error saving {self.file_name!r}: {error}")
+        finally:
+            self._saving = None
 
-        active_sprites = {sprite: sprite.active for sprite in self.sc.sprites}
-        for sprite in self.sc.sprites:
-            sprite.active = False
-        img.draw.blit((0, 0), self.sc.shape)
-        asyncio.create_task(self._message(f"SAVING {self.file_name!r}"))
-        await asyncio.sleep(0)
-        for sprite in self.sc.sprites:
-            if sprite in active_sprites:
-                sprite.active = active_sprites[sprite]
-        path = Path(self.file_name)
-        backend = path.suffix.strip(".").upper()
-        if backend not in ("HTML", "SNAPSHOT"):
-            backend = "ANSI"
-        img.render(output=path, backend=backend)
-        if backend == "ANSI":
-            with open(path, "at") as txt_file:
-                txt_file.write("\n")
+    def save_job(self, file_name):
+        """Returns a (function, *args) tuple which writes the drawing to 'file_name'
 
-        self.dirty = False
+        Only the raw cell data is copied here: encoding and writing the file
+        take place in another process, while the UI keeps running.
+        """
+        from terminedia_paint import tilefile
+        from terminedia_paint.export import save_grid, save_layer_grids
+
+        layers = self.layers
+        if layers is not None and not layers.plain:
+            if tilefile.is_tile_file(file_name):
+                canvas = self.canvas
+                return (tilefile.save_layers, layers.file_data(), list(canvas.codec.strings), canvas.tile_size, layers.size(), file_name)
+            # other formats get the layers composited
+            grids, settings = layers.snapshot()
+            return (save_layer_grids, grids, settings, file_name, None, self.ansi_colors)
+        if tilefile.is_tile_file(file_name):
+            # canvas tiles are saved as they are - no decoding needed
+            self.viewport.sync()
+            canvas = self.canvas
+            extent = canvas.extent
+            size = max(extent.x, self.sc.size.x), max(extent.y, self.sc.size.y)
+            tiles = {key: tile[:] for key, tile in canvas.tiles.items()}
+            return (tilefile.save_tiles, tiles, list(canvas.codec.strings), canvas.tile_size, size, file_name)
+        # copied as arrays, and decoded in the other process
+        return (save_grid, self.viewport.snapshot(), file_name, None, self.ansi_colors)
+
+    async def _progress(self, text, future):
+        """Shows 'text' with a spinner and elapsed time until 'future' is done"""
+        start = time.time()
+        width = len(text) + 9
+        msg = TM.widgets.Label(self.sc, text=f"{text:<{width}}", padding=2, border=True, pos=(self.sc.size.x // 2 - width // 2 - 1,3))
+        # Setting "msg.text" would add a new border around the label each time:
+        # update the text plane directly instead.
+        text_plane = msg.shape.text[msg.text_plane]
+        try:
+            for char in cycle("|/-\\"):
+                if future.done():
+                    return
+                text_plane[0, msg.text_line] = f"{text} {char} {time.time() - start:4.1f}s"
+                await asyncio.wait([future], timeout=0.1)
+        finally:
+            msg.kill()
+
+    def toggle_stats(self, event=None):
+        """Shows cells and bytes sent to the terminal per frame, and mouse events per stroke
+
+        With latency tracing on, input latency and frame time percentiles are shown too.
+        """
+        stats = getattr(self, "_stats", None)
+        if stats:
+            stats[0].kill()
+            stats[1].kill()
+            self._stats = None
+            return
+        width = self.sc.size.x - 4
+        label = TM.widgets.Label(self.sc, text=" " * width, pos=(0, 0))
+
+        def update(event):
+            if event.tick % TM.context.fps == 0:
+                text = f"{self.damage.summary} | {self.strokes.summary}"
+                if self.tracer:
+                    text = f"{self.tracer.summary} | {text}"
+                label.text = f"{text:<{width}.{width}}"
+
+        self._stats = (label, TM.events.Subscription(TM.events.Tick, update))
 
     async def _message(self, text):
         msg = TM.widgets.Label(self.sc, text=text, padding=2, border=True, pos=(self.sc.size.x // 2 - len(text) // 2 - 1,3))
@@ -469,25 +1283,80 @@ class Painter():
                 return
             char = char[0]
         elif char == "search":
-            search = await self._input("Unicode char name :", width=40)
-            if not search:
+            char = await self._search_character()
+            if not char:
                 return
 
-            options = TM.unicode.lookup(search)
+        self.sc.context.char = char
+
+    async def _search_character(self):
+        """Character search by name: results are updated as the query is typed.
+
+        <ENTER> moves to the results, which are paginated.
+        """
+        from terminedia_paint import charsearch
+
+        label = "Unicode char name :"
+        pos = V2(0, 3)
+        page_size = max(3, self.sc.size.y - self.build_menu().shape.size.y - pos.y - 6)
+        # load (or build) the index while the user types
+        loading = asyncio.get_running_loop().run_in_executor(None, charsearch.get_index)
+
+        label_w = TM.widgets.Label(self.sc, pos=pos, text=label)
+        entry = TM.widgets.Entry(self.sc, pos=pos + (len(label) + 1, 0), width=40, cancellable=True)
+        results = None
+        query = None
+        total = 0
+
+        def show(page):
+            nonlocal results
+            if results:
+                results.kill()
+            total, matches = charsearch.search(query, limit=page_size, offset=page * page_size)
+            options = [(f"{char} - {name[0:30]}", char) for char, name in matches]
+            if page:
+                options.insert(0, ("⏶ previous", ("page", page - 1)))
+            if total > (page + 1) * page_size:
+                options.append((f"⏷ more ({total - (page + 1) * page_size})", ("page", page + 1)))
             if not options:
-                self._message("Character not found")
-                return
-            if len(options) == 1:
-                char = options[0]
-            elif options:
-                options = {f"{str(option)} - {option.name[0:20]}": str(option) for option in options}
-                extended_selector = TM.widgets.Selector(self.sc, options, pos=(0,0), border=True, max_height=(self.sc.size.y - self.menu.shape.size.y - 2),  cancellable=True)
+                options = [("no match", None)]
+            results = TM.widgets.Selector(self.sc, options, pos=pos + (0, 2), border=True, align="left", cancellable=True)
+            return total
+
+        try:
+            while not entry.done:
+                if entry.value != query and loading.done():
+                    query = entry.value
+                    total = show(0)
+                    entry.focus = True
+                await asyncio.sleep(0.05)
+            if getattr(entry, "cancelled", False):
+                return None
+            await loading
+            if entry.value != query:
+                query = entry.value
+                total = show(0)
+            if not total:
+                if query:
+                    asyncio.create_task(self._message("Character not found"))
+                return None
+            if total == 1:
+                return results.value
+            results.focus = True
+            while True:
                 try:
-                    char = await extended_selector
+                    choice = await results
                 except WidgetCancelled:
-                    return
-
-        self.sc.context.char = char
+                    return None
+                if not isinstance(choice, tuple):
+                    return choice
+                show(choice[1])
+                results.focus = True
+        finally:
+            label_w.kill()
+            entry.kill()
+            if results:
+                results.kill()
 
 
     async def pick_color(self, event=None):
@@ -547,6 +1416,10 @@ class Painter():
 
             finally:
                 color_label.kill()
+        if self.palette != "truecolor":
+            from terminedia_paint.palette import quantize_color
+
+            color = quantize_color(color, self.palette)
         return color
 
     @property
@@ -574,6 +1447,12 @@ class Painter():
         pointer_draw.set(remainder_pos)
         # todo: change pointer char to the proper pixel in the proper resolution
 
+    def _bit_plane(self, name):
+        plane = self.bit_planes.get(name)
+        if plane is None:
+            plane = self.bit_planes[name] = BitPlane(self.sc.shape, name)
+        return plane
+
     @property
     def resolution(self):
         return self.__dict__["resolution"]
@@ -583,24 +1462,83 @@ class Painter():
         if value not in resolutions:
             return
         self._remainder_pos = 0, 0
-        self.drawable = drawable = self.sc.shape if value == 1 else getattr(self.sc.shape, resolutions[value][0])
+        name = resolutions[value][0]
+        if value == 1:
+            drawable = self.sc.shape
+        elif name in LAYOUTS:
+            drawable = self._bit_plane(name)
+        else:
+            drawable = getattr(self.sc.shape, name)
+        self.drawable = drawable
 
-        self.tools["paint"].reset(drawable.draw)
-        self.tools["erase"].reset(drawable.draw)
+        for name in ("paint", "erase"):
+            if name in self.tools:
+                self.tools[name].reset(drawable.draw)
         self.__dict__["resolution"] = value
         self.pointer.shape[0,0] = EMPTY if value != 1 else POINTER_CHAR
 
     async def typing_tool(self):
         self.resolution = 1
-        self.menu.enabled = False  # typing tool restores the menu on being exited via <ESC> press.
+        self.build_menu().enabled = False  # typing tool restores the menu on being exited via <ESC> press.
         self.active_tool = self.tools["typing"]
         asyncio.create_task(
             self._message("Entering typing tool: press <ESC> to exit!")
         )
 
 
-def run():
-    painter = Painter()
+def _parse_args(argv=None):
+    from terminedia_paint.ansi import COLOR_MODES
+    from terminedia_paint.export import positive_int
+
+    parser = argparse.ArgumentParser(
+        prog="terminedia-paint",
+        description="Draw ASCII and Unicode art interactively on the terminal"
+    )
+    parser.add_argument("--export", nargs="+", metavar="SRC",
+        help="Convert the given files without starting the interactive app")
+    parser.add_argument("--to", choices=["ansi", "html", "snapshot", "tpaint"], default="ansi",
+        help="Target format for --export (default: ansi)")
+    parser.add_argument("-o", "--output-dir", metavar="DIR",
+        help="Directory for exported files (default: next to each source)")
+    parser.add_argument("-j", "--jobs", type=positive_int, default=None,
+        help="Worker processes for --export (default: number of CPUs)")
+    parser.add_argument("--undo-memory", type=float, default=DEFAULT_MAX_BYTES / 2 ** 20, metavar="MB",
+        help="Memory cap for the undo history, in megabytes (default: %(default)g)")
+    parser.add_argument("--trace", metavar="FILE", default=os.environ.get(latency.ENV_VAR),
+        help=f"Write input latency traces to FILE, in Chrome trace format (or set ${latency.ENV_VAR})")
+    parser.add_argument("--colors", choices=COLOR_MODES, default="truecolor",
+        help="Colors used in ANSI files, for saving and --export (default: %(default)s)")
+    parser.add_argument("--no-autosave", dest="autosave", action="store_false",
+        help="Do not log changes for crash recovery")
+    parser.add_argument("--palette", choices=COLOR_MODES, default="truecolor",
+        help="Reduce colors of pasted images and picked colors to a terminal palette (default: %(default)s)")
+    parser.add_argument("--broadcast", metavar="ADDRESS",
+        help="Stream the drawing to viewers on a Unix socket path, or on TCP HOST:PORT or :PORT")
+    parser.add_argument("--view", metavar="ADDRESS",
+        help="Watch a drawing broadcast at ADDRESS, instead of painting")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = _parse_args(argv)
+    if args.export:
+        from terminedia_paint import export
+        failed = export.main(args.export, to=args.to, output_dir=args.output_dir, workers=args.jobs, colors=args.colors)
+        sys.exit(1 if failed else 0)
+    if args.view:
+        from terminedia_paint import broadcast
+        broadcast.view(args.view)
+        return
+    try:
+        painter = Painter(
+            undo_memory=int(args.undo_memory * 2 ** 20), ansi_colors=args.colors, trace=args.trace,
+            palette=args.palette, autosave=args.autosave, broadcast=args.broadcast
+        )
+    except OSError as error:
+        if not args.broadcast:
+            raise
+        print(f"Can't broadcast on {args.broadcast}: {error}", file=sys.stderr)
+        sys.exit(1)
     painter.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,416 @@
+"""Animation frames, stored as differences
+
+Each `Frame` keeps only the cells in which it differs from its base -
+the frame it was duplicated from - or from an empty canvas. Frames are
+copy-on-write: when a frame is edited, the previous values of the
+changed cells are copied down to the frames based on it first, so those
+don't change. Chains of frames are cut every KEYFRAME_DEPTH frames by
+storing a frame against the empty canvas.
+
+The canvas always holds the current frame. Edits are picked up when
+leaving it, comparing the canvas tiles to a copy of them made on
+entering, and switching frames only rewrites the cells that differ
+between the two frames. Each frame keeps its own undo history.
+
+ANSI animations are exported as the first frame in full, followed by
+the cells that change in each following frame. They can be played with
+
+    python -m terminedia_paint.animation FILE [--fps N]
+"""
+
+import argparse
+import sys
+import time
+from array import array
+
+import terminedia as TM
+from terminedia.values import EMPTY
+
+from terminedia_paint import ansi
+from terminedia_paint.canvas import EMPTY_CELL
+
+KEYFRAME_DEPTH = 64
+ONION_COLOR = TM.Color((96, 96, 96))
+
+
+class Frame:
+    """Cells differing from 'base' (another Frame, or None for an empty canvas)
+
+    Cells are {(x, y): encoded cell} in canvas coordinates.
+    """
+
+    def __init__(self, base=None, cells=None):
+        self.base = base
+        self.cells = cells or {}
+        self.children = []
+        # undo history, while another frame is shown, and autosave id (see `journal.UndoJournal`)
+        self.history = None
+        self.id = None
+        self.depth = base.depth + 1 if base else 0
+        if base:
+            base.children.append(self)
+
+    def get(self, pos, empty):
+        frame = self
+        while frame is not None:
+            value = frame.cells.get(pos)
+            if value is not None:
+                return value
+            frame = frame.base
+        return empty
+
+    def chain(self):
+        """This frame and all its bases"""
+        frame = self
+        while frame is not None:
+            yield frame
+            frame = frame.base
+
+    def update(self, changes, empty):
+        """Records 'changes' ({pos: encoded cell}) made to this frame"""
+        for child in self.children:
+            for pos in changes:
+                if pos not in child.cells:
+                    child.cells[pos] = self.get(pos, empty)
+        for pos, value in changes.items():
+            if value == (self.base.get(pos, empty) if self.base else empty):
+                self.cells.pop(pos, None)
+            else:
+                self.cells[pos] = value
+
+    def detach(self):
+        """Removes this frame from the chain: frames based on it are rebased on its base"""
+        base = self.base
+        for child in self.children:
+            for pos, value in self.cells.items():
+                child.cells.setdefault(pos, value)
+            child.base = base
+            if base:
+                base.children.append(child)
+        if base:
+            base.children.remove(self)
+        self.children = []
+
+    @property
+    def nbytes(self):
+        """Rough memory used by the stored cells"""
+        return sum(sys.getsizeof(pos) for pos in self.cells) + sys.getsizeof(self.cells)
+
+
+def diff_positions(frame1, frame2):
+    """Positions where the two frames may differ: cells stored in either
+    of them or in their bases, up to the first base they share
+    """
+    chain2 = list(frame2.chain())
+    in_chain2 = {id(frame) for frame in chain2}
+    positions = set()
+    common = None
+    for frame in frame1.chain():
+        if id(frame) in in_chain2:
+            common = frame
+            break
+        positions.update(frame.cells)
+    for frame in chain2:
+        if frame is common:
+            break
+        positions.update(frame.cells)
+    return positions
+
+
+class OnionSkin(TM.Transformer):
+    """Shows the cells of another frame, dimmed, where the screen is empty"""
+
+    def __init__(self, viewport):
+        self.viewport = viewport
+        # {canvas position: char}
+        self.cells = {}
+        super().__init__()
+
+    def _lookup(self, char, pos):
+        if char != EMPTY or not self.cells:
+            return None
+        origin = self.viewport.origin
+        return self.cells.get((pos[0] + origin.x, pos[1] + origin.y))
+
+    def char(self, char, pos):
+        onion = self._lookup(char, pos)
+        return char if onion is None else onion
+
+    def foreground(self, char, foreground, pos):
+        return foreground if self._lookup(char, pos) is None else ONION_COLOR
+
+
+class Animation:
+    """The list of frames of a drawing, over the canvas behind 'viewport'"""
+
+    def __init__(self, viewport, journal=None, damage=None):
+        self.viewport = viewport
+        self.canvas = viewport.canvas
+        self.journal = journal
+        self.damage = damage
+        self.empty = self.canvas.codec.encode(EMPTY_CELL)
+        # the current canvas contents become the first frame
+        self.frames = [Frame()]
+        if journal is not None:
+            self.frames[0].id = journal.target
+        self.index = 0
+        self._entered = {}
+        self._decoded = {}
+        self._interned = {}
+        self.onion = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def current(self):
+        return self.frames[self.index]
+
+    def decode(self, encoded):
+        value = self._decoded.get(encoded)
+        if value is None:
+            value = self._decoded[encoded] = tuple(self.canvas.codec.decode(encoded))
+        return value
+
+    def _changed_cells(self):
+        """{pos: encoded cell} for the canvas cells changed since the current frame was entered"""
+        canvas = self.canvas
+        tw, th = canvas.tile_size
+        empty_tile = canvas._empty_tile
+        interned = self._interned
+        changes = {}
+        for key in set(canvas.tiles) | set(self._entered):
+            tile = canvas.tiles.get(key, empty_tile)
+            old = self._entered.get(key, empty_tile)
+            if tile == old:
+                continue
+            row_size = tw * 4
+            for y in range(th):
+                start = y * row_size
+                if tile[start: start + row_size] == old[start: start + row_size]:
+                    continue
+                for x in range(tw):
+                    offset = start + x * 4
+                    cell = tuple(tile[offset: offset + 4])
+                    if cell != tuple(old[offset: offset + 4]):
+                        # frames share the tuples of cells with the same value
+                        changes[key[0] * tw + x, key[1] * th + y] = interned.setdefault(cell, cell)
+        return changes
+
+    def _snapshot(self, keys):
+        """Copies the canvas tiles 'keys', as they are when entering a frame"""
+        tiles = self.canvas.tiles
+        for key in keys:
+            if key in tiles:
+                self._entered[key] = array("I", tiles[key])
+            else:
+                self._entered.pop(key, None)
+
+    def commit(self):
+        """Stores the edits made to the current frame"""
+        self.viewport.sync()
+        changes = self._changed_cells()
+        if not changes:
+            return
+        self.current.update(changes, self.empty)
+        self._snapshot({self.canvas._locate(pos)[0] for pos in changes})
+
+    def _show(self, index):
+        """Rewrites the cells that differ between the current frame and frame 'index'"""
+        self.commit()
+        target = self.frames[index]
+        canvas = self.canvas
+        viewport = self.viewport
+        changed = []
+        for pos in diff_positions(self.current, target):
+            value = target.get(pos, self.empty)
+            if value != canvas.get_encoded(pos):
+                changed.append((pos, value))
+        journal = self.journal
+        if journal is None:
+            for pos, value in changed:
+                viewport.set(pos, self.decode(value))
+        else:
+            self._swap_history(target)
+            # the frame is shown, not drawn: nothing to undo
+            with journal.suspended():
+                for pos, value in changed:
+                    viewport.set(pos, self.decode(value))
+        viewport.sync()
+        self._snapshot({canvas._locate(pos)[0] for pos, _ in changed})
+        self.index = index
+        if self.onion is not None:
+            self.update_onion()
+
+    def _swap_history(self, target):
+        """Puts the undo history of frame 'target' in place of the current frame's"""
+        journal = self.journal
+        if target.id is None:
+            target.id = journal.new_target()
+        self.current.history = journal.swap_history(target.history, target.id)
+        target.history = None
+
+    def go(self, index):
+        """Moves to frame 'index' - wrapping around at either end"""
+        index %= len(self.frames)
+        if index != self.index:
+            self._show(index)
+
+    def step(self, delta=1):
+        self.go(self.index + delta)
+
+    def _insert(self, frame):
+        self.commit()
+        self.frames.insert(self.index + 1, frame)
+        self._show(self.index + 1)
+
+    def add(self):
+        """Inserts an empty frame after the current one, and moves to it"""
+        self._insert(Frame())
+
+    def duplicate(self):
+        """Inserts a copy of the current frame after it, and moves to it"""
+        self.commit()
+        source = self.current
+        if source.depth + 1 >= KEYFRAME_DEPTH:
+            frame = Frame(None, self.frame_cells(source))
+        else:
+            frame = Frame(source)
+        self.frames.insert(self.index + 1, frame)
+        if self.journal is not None:
+            self._swap_history(frame)
+        # same contents: nothing to redraw
+        self.index += 1
+        if self.onion is not None:
+            self.update_onion()
+
+    def remove(self):
+        """Deletes the current frame, moving to the previous one"""
+        if len(self.frames) == 1:
+            return False
+        frame = self.current
+        self._show(self.index - 1 if self.index else 1)
+        shown = self.current
+        self.frames.remove(frame)
+        self.index = self.frames.index(shown)
+        frame.detach()
+        if self.journal is not None:
+            self.journal.drop_history(frame.history)
+            frame.history = None
+        if self.onion is not None:
+            self.update_onion()
+        return True
+
+    def frame_cells(self, frame):
+        """{pos: encoded cell} for all non empty cells in 'frame'"""
+        positions = set()
+        for item in frame.chain():
+            positions.update(item.cells)
+        cells = {}
+        for pos in positions:
+            value = frame.get(pos, self.empty)
+            if value != self.empty:
+                cells[pos] = value
+        return cells
+
+    def toggle_onion(self, shape):
+        """Shows or hides the previous frame under the current one, on 'shape'"""
+        transformers = shape.context.transformers
+        if self.onion is None:
+            self.onion = OnionSkin(self.viewport)
+            transformers.append(self.onion)
+            self.update_onion()
+            return True
+        self._mark_onion()
+        transformers.remove(self.onion)
+        self.onion = None
+        return False
+
+    def update_onion(self):
+        """Onion cells: where the previous frame differs from the current one"""
+        self._mark_onion()
+        cells = self.onion.cells = {}
+        if self.index == 0:
+            return
+        previous = self.frames[self.index - 1]
+        for pos in diff_positions(previous, self.current):
+            value = previous.get(pos, self.empty)
+            if value != self.empty:
+                char = self.decode(value)[0]
+                if isinstance(char, str) and char != EMPTY:
+                    cells[pos] = char
+        self._mark_onion()
+
+    def _mark_onion(self):
+        if self.damage is None or not self.onion.cells:
+            return
+        viewport = self.viewport
+        for pos in self.onion.cells:
+            if viewport.visible(pos):
+                self.damage.mark(viewport.to_screen(pos))
+
+    def export_data(self):
+        """Picklable arguments for `write_ansi`: the first frame as rows of
+        cells, and the cells changed in each following frame
+        """
+        self.commit()
+        positions = set()
+        for frame in self.frames:
+            for item in frame.chain():
+                positions.update(item.cells)
+        width = max((pos[0] + 1 for pos in positions), default=0)
+        height = max((pos[1] + 1 for pos in positions), default=0)
+        first = self.frames[0]
+        decode = self.decode
+        rows = [[decode(first.get((x, y), self.empty)) for x in range(width)] for y in range(height)]
+        updates = []
+        for previous, frame in zip(self.frames, self.frames[1:]):
+            changes = []
+            for pos in diff_positions(previous, frame):
+                value = frame.get(pos, self.empty)
+                if value != previous.get(pos, self.empty):
+                    changes.append((pos, decode(value)))
+            changes.sort(key=lambda item: (item[0][1], item[0][0]))
+            updates.append(changes)
+        return rows, updates
+
+    @property
+    def nbytes(self):
+        return sum(frame.nbytes for frame in self.frames)
+
+
+def write_ansi(rows, updates, path, colors="truecolor"):
+    ansi.write_animation(rows, updates, path, colors)
+
+
+def play(path, fps=None, file=None):
+    """Plays an animation written by `write_ansi` on the terminal"""
+    file = file or sys.stdout
+    fps = fps or TM.context.fps
+    with open(path, encoding="utf-8") as source:
+        frames = source.read().split(ansi.FRAME_START)
+    file.write(frames[0] + ansi.CSI + "?25l")
+    try:
+        for frame in frames[1:]:
+            start = time.perf_counter()
+            file.write(ansi.FRAME_START + frame)
+            file.flush()
+            time.sleep(max(0, 1 / fps - (time.perf_counter() - start)))
+    finally:
+        file.write(ansi.CSI + "0m" + ansi.CSI + "?25h\n")
+        file.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m terminedia_paint.animation", description="Play an exported ANSI animation")
+    parser.add_argument("file")
+    parser.add_argument("--fps", type=float, default=None, help="Frames per second (default: %s)" % TM.context.fps)
+    args = parser.parse_args(argv)
+    try:
+        play(args.file, args.fps)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""Compact ANSI encoder for exported artwork
+
+Terminedia's ANSI renderer is made to update a live screen, and writes
+most color and effect codes again on every change, each in its own
+escape sequence. Exported files are meant to be `cat`-ed to a terminal,
+so here the current foreground, background and effects are tracked while
+encoding, and each cell only emits a single SGR sequence with what
+differs from the previous one - or a reset, if that is shorter.
+
+Runs of empty cells become cursor-forward moves, trailing ones are
+dropped, and rows are written to the file as they are encoded.
+
+Colors can be written as 24 bit "truecolor", or mapped to the nearest
+color in the 256 or 16 color palettes, for older terminals (through the
+lookup tables in `palette`).
+
+Animations are written as the first frame, followed by only the cells
+changed in each next frame, each run of them after a cursor move. Every
+frame starts with FRAME_START, so players can split the file on it.
+"""
+
+import gzip
+import io
+import sys
+import unicodedata
+from pathlib import Path
+
+import terminedia as TM
+from terminedia.terminal import effect_off_map, effect_on_map
+from terminedia.unicode import char_width
+from terminedia.unicode_transforms import translate_chars
+from terminedia.values import (
+    CONTINUATION, DEFAULT_BG, DEFAULT_FG, EMPTY, TERMINAL_EFFECTS, TRANSPARENT, UNICODE_EFFECTS
+)
+
+COLOR_MODES = ("truecolor", "256", "16")
+
+CSI = "\x1b["
+RESET = "0"
+FG_DEFAULT = "39"
+BG_DEFAULT = "49"
+FRAME_START = CSI + "H"
+
+# these show up even on a blank cell, which then can't be skipped over
+VISIBLE_ON_SPACE = TM.Effects(
+    TM.Effects.reverse | TM.Effects.underline | TM.Effects.double_underline | TM.Effects.crossed_out |
+    TM.Effects.overlined | TM.Effects.framed | TM.Effects.encircled
+)
+
+def color_256(rgb):
+    """Nearest xterm 256 color palette index, from the color cube or the grey ramp"""
+    # imported here: this module is loaded on startup, for COLOR_MODES, and palette pulls in NumPy
+    from terminedia_paint import palette
+
+    return palette.nearest(rgb, "256")
+
+
+def color_16(rgb):
+    from terminedia_paint import palette
+
+    return palette.nearest(rgb, "16")
+
+
+def color_code(color, background=False, mode="truecolor"):
+    """SGR parameters for a color"""
+    if getattr(color, "special", None):
+        return BG_DEFAULT if background else FG_DEFAULT
+    rgb = tuple(color)[:3]
+    if mode == "16":
+        index = color_16(rgb)
+        base = (40 if background else 30) if index < 8 else (100 if background else 90)
+        return str(base + index % 8)
+    prefix = "48" if background else "38"
+    if mode == "256":
+        return f"{prefix};5;{color_256(rgb)}"
+    return f"{prefix};2;{rgb[0]};{rgb[1]};{rgb[2]}"
+
+
+class AnsiEncoder:
+    """Writes rows of cells to 'file' as ANSI text
+
+    Cells are (char, foreground, background, effects) sequences, as in
+    terminedia shapes. TRANSPARENT values are written as the defaults.
+    """
+
+    def __init__(self, file, colors="truecolor"):
+        if colors not in COLOR_MODES:
+            raise ValueError(f"Unknown color mode {colors!r} - use one of {', '.join(COLOR_MODES)}")
+        self.file = file
+        self.colors = colors
+        self.fg = FG_DEFAULT
+        self.bg = BG_DEFAULT
+        self.effects = TM.Effects.none
+        self._codes = {}
+        self._chars = {}
+        self._widths = {}
+
+    def _color(self, color, background):
+        if getattr(color, "special", None):
+            # TRANSPARENT and context colors have no meaning in a file: use the terminal defaults
+            return BG_DEFAULT if background else FG_DEFAULT
+        key = (tuple(color), background)
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = color_code(color, background, self.colors)
+        return code
+
+    def _width(self, char):
+        """2 for double width characters, 1 otherwise, and 0 for those
+        terminals may disagree on, as East Asian "ambiguous" ones
+        """
+        width = self._widths.get(char)
+        if width is None:
+            width = 1
+            if char_width(char) == 2:
+                width = 2 if unicodedata.east_asian_width(char[0]) in "WF" else 0
+            self._widths[char] = width
+        return width
+
+    def _char(self, char, effects):
+        key = (char, effects)
+        result = self._chars.get(key)
+        if result is None:
+            result = self._chars[key] = translate_chars(char, effects & UNICODE_EFFECTS)
+        return result
+
+    def sgr(self, fg, bg, effects):
+        """Escape sequence going from the current state to the given one - "" if nothing changes"""
+        if fg == self.fg and bg == self.bg and effects == self.effects:
+            return ""
+        removed = self.effects & ~effects
+        # effects sharing an "off" code with a removed one have to be turned on again
+        off_codes = {effect_off_map[effect] for effect in removed}
+        turned_on = (effects & ~self.effects) | TM.Effects(
+            sum(effect for effect in (effects & self.effects) if effect_off_map[effect] in off_codes)
+        )
+        diff = sorted(off_codes)
+        if fg != self.fg:
+            diff.append(fg)
+        if bg != self.bg:
+            diff.append(bg)
+        diff.extend(effect_on_map[effect] for effect in turned_on)
+
+        reset = [RESET]
+        if fg != FG_DEFAULT:
+            reset.append(fg)
+        if bg != BG_DEFAULT:
+            reset.append(bg)
+        reset.extend(effect_on_map[effect] for effect in effects)
+
+        params = min(diff, reset, key=lambda codes: len(";".join(map(str, codes))))
+        self.fg, self.bg, self.effects = fg, bg, effects
+        return CSI + ";".join(map(str, params)) + "m"
+
+    def _skip(self, count):
+        move = CSI + ("C" if count == 1 else f"{count}C")
+        if count <= len(move) and self.bg == BG_DEFAULT and not self.effects & VISIBLE_ON_SPACE:
+            return EMPTY * count
+        return move
+
+    def encode_row(self, cells):
+        """ANSI text for a row of cells, with the line break"""
+        out = []
+        skip = 0
+        wide = ambiguous = resync = False
+        for x, (char, fg, bg, effects) in enumerate(cells):
+            if char == CONTINUATION:
+                if wide:
+                    # the double width character before it already took this cell
+                    wide = False
+                    resync = ambiguous
+                    continue
+                # left over from an overwritten double width character
+                char = EMPTY
+            wide = False
+            if effects == TRANSPARENT:
+                effects = TM.Effects.none
+            terminal_effects = effects & TERMINAL_EFFECTS
+            bg = self._color(bg, True)
+            if char == TRANSPARENT:
+                char = EMPTY
+            if char == EMPTY and bg == BG_DEFAULT and not terminal_effects & VISIBLE_ON_SPACE:
+                skip += 1
+                continue
+            if resync:
+                # move to the column explicitly, whatever width was used
+                out.append(f"{CSI}{x + 1}G")
+                resync = False
+            elif skip:
+                out.append(self._skip(skip))
+            skip = 0
+            out.append(self.sgr(self._color(fg, False), bg, terminal_effects))
+            if effects & UNICODE_EFFECTS:
+                char = self._char(char, effects)
+            out.append(char)
+            width = self._width(char)
+            wide = width != 1
+            ambiguous = width == 0
+        if self.bg != BG_DEFAULT:
+            # otherwise terminals may fill the next line with it when scrolling
+            out.append(self.sgr(self.fg, BG_DEFAULT, self.effects))
+        out.append("\n")
+        return "".join(out)
+
+    def encode_cells(self, cells):
+        """ANSI text rewriting only the given cells - ((x, y), cell) pairs sorted by row and column"""
+        out = []
+        cursor = None
+        for (x, y), (char, fg, bg, effects) in cells:
+            if char == CONTINUATION:
+                # drawn by the double width character before it
+                continue
+            if effects == TRANSPARENT:
+                effects = TM.Effects.none
+            if char == TRANSPARENT:
+                char = EMPTY
+            if cursor != (x, y):
+                out.append(f"{CSI}{y + 1};{x + 1}H")
+            out.append(self.sgr(self._color(fg, False), self._color(bg, True), effects & TERMINAL_EFFECTS))
+            if effects & UNICODE_EFFECTS:
+                char = self._char(char, effects)
+            out.append(char)
+            width = self._width(char)
+            # after an ambiguous width character, the cursor position is not known
+            cursor = (x + width, y) if width else None
+        return "".join(out)
+
+    def write_rows(self, rows):
+        for cells in rows:
+            self.file.write(self.encode_row(cells))
+
+    def close(self):
+        """Writes a final reset, if the last row left any attribute on"""
+        if self.fg != FG_DEFAULT or self.bg != BG_DEFAULT or self.effects:
+            self.file.write(CSI + RESET + "m")
+            self.fg, self.bg, self.effects = FG_DEFAULT, BG_DEFAULT, TM.Effects.none
+
+
+def plane_rows(planes):
+    """Rows of cells from data planes, as produced by `export.snapshot_planes`"""
+    chars, fg, bg, effects = planes
+    offset = 0
+    for row in chars:
+        width = len(row)
+        yield zip(row, fg[offset: offset + width], bg[offset: offset + width], effects[offset: offset + width])
+        offset += width
+
+
+def shape_rows(shape):
+    get_raw = shape.get_raw
+    for y in range(shape.height):
+        yield [get_raw((x, y)) for x in range(shape.width)]
+
+
+def write(rows, path, colors="truecolor"):
+    """Encodes 'rows' into the file at 'path', one row at a time"""
+    with open(path, "wt", encoding="utf-8") as file:
+        encoder = AnsiEncoder(file, colors)
+        encoder.write_rows(rows)
+        encoder.close()
+
+
+def write_planes(planes, path, colors="truecolor"):
+    write(plane_rows(planes), path, colors)
+
+
+def write_shape(shape, path, colors="truecolor"):
+    write(shape_rows(shape), path, colors)
+
+
+def write_animation(rows, updates, path, colors="truecolor"):
+    """Writes the first frame, 'rows', then each of 'updates': the
+    ((x, y), cell) pairs changed in each following frame
+    """
+    with open(path, "wt", encoding="utf-8") as file:
+        encoder = AnsiEncoder(file, colors)
+        file.write(CSI + "2J" + FRAME_START)
+        for y, cells in enumerate(rows):
+            text = encoder.encode_row(cells)
+            # a line break after the last row could scroll the screen
+            file.write(text[:-1] if y == len(rows) - 1 else text)
+        for cells in updates:
+            file.write(FRAME_START + encoder.encode_cells(cells))
+        encoder.close()
+
+
+def encode_shape(shape, colors="truecolor"):
+    file = io.StringIO()
+    encoder = AnsiEncoder(file, colors)
+    encoder.write_rows(shape_rows(shape))
+    encoder.close()
+    return file.getvalue()
+
+
+def compare(shape):
+    """Sizes in bytes, plain and gzipped, of 'shape' encoded by terminedia's
+    renderer ("generic") and by this module in each color mode
+    """
+    outputs = {"generic": shape.render(backend="ANSI") + "\n"}
+    for mode in COLOR_MODES:
+        outputs[mode] = encode_shape(shape, mode)
+    sizes = {}
+    for name, text in outputs.items():
+        data = text.encode("utf-8")
+        sizes[name] = (len(data), len(gzip.compress(data)))
+    return sizes
+
+
+def main(paths, file=None):
+    """Prints the output of 'compare' for each file in 'paths'"""
+    from terminedia_paint.export import load_shape
+
+    file = file or sys.stdout
+    print(f"{'file':<24} {'encoder':<10} {'bytes':>10} {'gzip':>8} {'ratio':>6}", file=file)
+    for path in paths:
+        sizes = compare(load_shape(path))
+        generic = sizes["generic"][0]
+        for name, (size, compressed) in sizes.items():
+            print(f"{Path(path).name[:24]:<24} {name:<10} {size:>10} {compressed:>8} {size / generic:>6.2f}", file=file)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,408 @@
+"""Streaming reader for ANSI art files
+
+Files are read and decoded in chunks and fed to an `AnsiParser`, which
+keeps the cursor position and the current colors and effects as a
+terminal would, and hands each printed character to a callback as a
+cell - so a drawing of any size goes straight into a canvas, without
+the whole file in memory. An escape sequence split between two chunks
+is carried over to the next one.
+
+Supported: SGR attributes (16, 256 and 24 bit colors), cursor movement
+and positioning, saving/restoring the cursor, CR, LF, TAB and BS.
+Other sequences are skipped. Positions are relative to where the file
+is pasted: "cursor home" is its top-left corner.
+
+Classic ANSI art is CP437 encoded, wraps at 80 columns and may end with
+a SAUCE metadata record: files that are not valid UTF-8 are read as
+CP437, and the SAUCE width, if present, is used for line wrapping.
+"""
+
+import codecs
+import re
+import struct
+import sys
+import time
+import unicodedata
+from pathlib import Path
+
+import terminedia as TM
+from terminedia.values import CONTINUATION, DEFAULT_BG, DEFAULT_FG, EMPTY
+
+from terminedia_paint.palette import BASIC_COLORS, xterm_color
+
+SUFFIXES = (".ans", ".ansi")
+CHUNK_SIZE = 2 ** 16
+CLASSIC_WIDTH = 80
+# longest escape sequence carried over between chunks: anything longer is junk
+MAX_SEQUENCE = 256
+
+SAUCE = struct.Struct("<5s2s35s20s20s8sIBBHHHHB")
+SAUCE_SIZE = 128
+
+TOKEN = re.compile(
+    r"\x1b\[([0-?]*)[ -/]*([@-~])"   # CSI
+    r"|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)"   # OSC, ended by BEL or ST
+    r"|\x1b[^\[\]]"   # other two character escapes
+    r"|[\x00-\x1a\x1c-\x1f\x7f]"   # control characters, but ESC
+)
+
+SGR_EFFECTS = {
+    1: TM.Effects.bold, 2: TM.Effects.faint, 3: TM.Effects.italic, 4: TM.Effects.underline,
+    5: TM.Effects.blink, 6: TM.Effects.fast_blink, 7: TM.Effects.reverse, 8: TM.Effects.conceal,
+    9: TM.Effects.crossed_out, 20: TM.Effects.fraktur, 21: TM.Effects.double_underline,
+    51: TM.Effects.framed, 52: TM.Effects.encircled, 53: TM.Effects.overlined,
+}
+SGR_EFFECTS_OFF = {
+    22: TM.Effects.bold | TM.Effects.faint, 23: TM.Effects.italic | TM.Effects.fraktur,
+    24: TM.Effects.underline | TM.Effects.double_underline, 25: TM.Effects.blink | TM.Effects.fast_blink,
+    27: TM.Effects.reverse, 28: TM.Effects.conceal, 29: TM.Effects.crossed_out,
+    54: TM.Effects.framed | TM.Effects.encircled, 55: TM.Effects.overlined,
+}
+
+
+def is_ansi_file(path):
+    return Path(path).suffix.lower() in SUFFIXES
+
+
+def read_sauce(path):
+    """The SAUCE record at the end of a file as a dict, or None"""
+    with open(path, "rb") as file:
+        file.seek(0, 2)
+        if file.tell() < SAUCE_SIZE:
+            return None
+        file.seek(-SAUCE_SIZE, 2)
+        data = file.read(SAUCE_SIZE)
+    if not data.startswith(b"SAUCE"):
+        return None
+    fields = SAUCE.unpack_from(data)
+    return {
+        "title": fields[2].decode("cp437").rstrip(" \x00"),
+        "author": fields[3].decode("cp437").rstrip(" \x00"),
+        "file_size": fields[6],
+        "data_type": fields[7],
+        "file_type": fields[8],
+        "width": fields[9],
+        "height": fields[10],
+    }
+
+
+class AnsiParser:
+    """Terminal emulation just good enough to draw ANSI art files
+
+    'put' is called with the position and a (char, fg, bg, effects)
+    tuple for each character. If 'width' is given, lines wrap at that
+    column, as in a terminal of that width.
+    """
+
+    def __init__(self, put, width=None):
+        self.put = put
+        self.width = width
+        self.x = self.y = 0
+        self.saved = (0, 0)
+        self.wrap_pending = False
+        self.extent = [0, 0]
+        self.fg = DEFAULT_FG
+        self.bg = DEFAULT_BG
+        self.effects = TM.Effects.none
+        self._carry = ""
+        self._colors = {}
+        self._wide = {}
+        self._csi = {
+            "m": self._sgr,
+            "A": lambda params: self._move(0, -self._param(params, 0, 1)),
+            "B": lambda params: self._move(0, self._param(params, 0, 1)),
+            "C": lambda params: self._move(self._param(params, 0, 1), 0),
+            "D": lambda params: self._move(-self._param(params, 0, 1), 0),
+            "E": lambda params: self._goto(0, self.y + self._param(params, 0, 1)),
+            "F": lambda params: self._goto(0, self.y - self._param(params, 0, 1)),
+            "G": lambda params: self._goto(self._param(params, 0, 1) - 1, self.y),
+            "d": lambda params: self._goto(self.x, self._param(params, 0, 1) - 1),
+            "H": lambda params: self._goto(self._param(params, 1, 1) - 1, self._param(params, 0, 1) - 1),
+            "s": lambda params: setattr(self, "saved", (self.x, self.y)),
+            "u": lambda params: self._goto(*self.saved),
+        }
+        self._csi["f"] = self._csi["H"]
+
+    @staticmethod
+    def _param(params, index, default):
+        try:
+            return int(params[index]) or default
+        except (IndexError, ValueError):
+            return default
+
+    def _move(self, dx, dy):
+        self._goto(self.x + dx, self.y + dy)
+
+    def _goto(self, x, y):
+        self.x = max(0, x)
+        self.y = max(0, y)
+        self.wrap_pending = False
+
+    def _color(self, rgb):
+        color = self._colors.get(rgb)
+        if color is None:
+            color = self._colors[rgb] = TM.Color(rgb)
+        return color
+
+    def _sgr(self, params):
+        codes = [int(param) if param.isdigit() else 0 for param in params] or [0]
+        i = 0
+        while i < len(codes):
+            code = codes[i]
+            i += 1
+            if code == 0:
+                self.fg, self.bg, self.effects = DEFAULT_FG, DEFAULT_BG, TM.Effects.none
+            elif code in SGR_EFFECTS:
+                self.effects |= SGR_EFFECTS[code]
+            elif code in SGR_EFFECTS_OFF:
+                self.effects &= ~SGR_EFFECTS_OFF[code]
+            elif 30 <= code <= 37 or 90 <= code <= 97:
+                self.fg = self._color(BASIC_COLORS[code % 10 + (8 if code >= 90 else 0)])
+            elif 40 <= code <= 47 or 100 <= code <= 107:
+                self.bg = self._color(BASIC_COLORS[code % 10 + (8 if code >= 100 else 0)])
+            elif code == 39:
+                self.fg = DEFAULT_FG
+            elif code == 49:
+                self.bg = DEFAULT_BG
+            elif code in (38, 48) and i < len(codes):
+                if codes[i] == 5 and i + 1 < len(codes):
+                    color = self._color(xterm_color(codes[i + 1] & 0xff))
+                    i += 2
+                elif codes[i] == 2 and i + 3 < len(codes):
+                    color = self._color(tuple(min(255, value) for value in codes[i + 1: i + 4]))
+                    i += 4
+                else:
+                    break
+                if code == 38:
+                    self.fg = color
+                else:
+                    self.bg = color
+
+    def _control(self, char):
+        if char == "\n":
+            # files are meant to be printed to a terminal, which adds the carriage return
+            self._goto(0, self.y + 1)
+        elif char == "\r":
+            self._goto(0, self.y)
+        elif char == "\t":
+            self._goto((self.x // 8 + 1) * 8, self.y)
+        elif char == "\b":
+            self._goto(self.x - 1, self.y)
+
+    def _text(self, text):
+        put = self.put
+        width = self.width
+        wide_chars = self._wide
+        fg, bg, effects = self.fg, self.bg, self.effects
+        x, y = self.x, self.y
+        for char in text:
+            wide = wide_chars.get(char)
+            if wide is None:
+                wide = wide_chars[char] = unicodedata.east_asian_width(char) in "WF"
+            if width and (self.wrap_pending or (wide and x == width - 1)):
+                x, y = 0, y + 1
+                self.wrap_pending = False
+            put((x, y), (char, fg, bg, effects))
+            if wide:
+                put((x + 1, y), (CONTINUATION, fg, bg, effects))
+                x += 1
+            if y >= self.extent[1]:
+                self.extent[1] = y + 1
+            if x >= self.extent[0]:
+                self.extent[0] = x + 1
+            if width and x >= width - 1:
+                # as terminals do, wrap only when the next character is printed
+                x = width - 1
+                self.wrap_pending = True
+            else:
+                x += 1
+        self.x, self.y = x, y
+
+    def feed(self, text):
+        """Parses a chunk of text"""
+        text = self._carry + text
+        self._carry = ""
+        pos = 0
+        for match in TOKEN.finditer(text):
+            start = match.start()
+            if start > pos:
+                self._text(text[pos:start])
+            pos = match.end()
+            token = match.group()
+            if len(token) == 1:
+                self._control(token)
+            elif match.group(2):
+                params = match.group(1)
+                if not params.startswith("?"):
+                    handler = self._csi.get(match.group(2))
+                    if handler:
+                        handler(params.split(";") if params else [])
+        rest = text[pos:]
+        escape = rest.find("\x1b")
+        if escape != -1 and len(rest) - escape < MAX_SEQUENCE:
+            # an incomplete sequence: it is finished in the next chunk
+            self._carry = rest[escape:]
+            rest = rest[:escape]
+        elif escape != -1:
+            rest = rest.replace("\x1b", "")
+        if rest:
+            self._text(rest)
+
+
+def _decoder(path, encoding):
+    if encoding is None:
+        with open(path, "rb") as file:
+            head = file.read(CHUNK_SIZE)
+        try:
+            # a multibyte character may be cut at the end of the sample
+            codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = "cp437"
+    return codecs.getincrementaldecoder(encoding)(errors="replace"), encoding
+
+
+def parse_file(path, put, width=None, encoding=None, chunk_size=CHUNK_SIZE):
+    """Parses the ANSI file at 'path', a chunk at a time, calling 'put' for each cell
+
+    This is a generator: after each chunk it yields the number of bytes
+    read so far - callers can do other work between chunks. Its return
+    value is the parser.
+    """
+    sauce = read_sauce(path)
+    size = Path(path).stat().st_size
+    if sauce:
+        # the record, the optional comment block and the EOF marker are not drawing data
+        size = min(sauce["file_size"] or size, size - SAUCE_SIZE)
+    decoder, encoding = _decoder(path, encoding)
+    if width is None:
+        if sauce and sauce["data_type"] == 1 and sauce["width"]:
+            width = sauce["width"]
+        elif encoding == "cp437":
+            width = CLASSIC_WIDTH
+    parser = AnsiParser(put, width)
+    done = 0
+    with open(path, "rb") as file:
+        while done < size:
+            data = file.read(min(chunk_size, size - done))
+            if not data:
+                break
+            done += len(data)
+            end = data.find(b"\x1a")
+            if end != -1:
+                # DOS end of file marker: SAUCE metadata may follow
+                data = data[:end]
+                done = size
+            parser.feed(decoder.decode(data, final=done >= size))
+            yield done
+    return parser
+
+
+def read_file(path, put, **kwargs):
+    """Runs 'parse_file' to the end and returns the parser"""
+    steps = parse_file(path, put, **kwargs)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+def canvas_writer(canvas, origin=(0, 0)):
+    """A 'put' callback writing cells into 'canvas', offset by 'origin'
+
+    The parser reuses the same color objects while the attributes do not
+    change, so encoded cells can be cached by their identity.
+    """
+    left, top = origin
+    encoded_cells = {}
+    encode = canvas.codec.encode
+    set_encoded = canvas.set_encoded
+
+    def put(pos, cell):
+        key = (cell[0], id(cell[1]), id(cell[2]), cell[3])
+        entry = encoded_cells.get(key)
+        if entry is None:
+            # the cell is kept with its encoding, so the ids in the key stay valid
+            entry = encoded_cells[key] = (encode(cell), cell)
+        set_encoded((left + pos[0], top + pos[1]), entry[0])
+
+    return put
+
+
+def load_shape(path):
+    """Reads an ANSI file into a new FullShape, through a sparse canvas"""
+    from terminedia_paint.canvas import Canvas
+
+    canvas = Canvas()
+    parser = read_file(path, canvas_writer(canvas))
+    planes = canvas.snapshot_planes(parser.extent)
+    chars = planes[0]
+    if not chars:
+        planes = [[[EMPTY]], [DEFAULT_FG], [DEFAULT_BG], [TM.Effects.none]]
+    return TM.image.FullShape(planes)
+
+
+def benchmark(size=2 ** 22, file=None):
+    """Parse throughput in MB/s for generated files of about 'size' bytes
+
+    One file is written by this project's encoder (truecolor, few escape
+    sequences), the other in the classic style: CP437, 16 colors, and a
+    color change every few characters.
+    """
+    import random
+    import tempfile
+
+    file = file or sys.stdout
+    random.seed(0)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        samples = {}
+
+        line = []
+        while sum(map(len, line)) < 200:
+            rgb = ";".join(str(random.randrange(256)) for _ in range(3))
+            line.append(f"\x1b[38;2;{rgb}m" + "█" * random.randrange(1, 12) + "\x1b[4C" + "terminedia")
+        text = "".join(line) + "\x1b[0m\n"
+        samples["utf-8 truecolor"] = (text.encode("utf-8"), "utf-8")
+
+        line = []
+        while sum(map(len, line)) < 80:
+            line.append(f"\x1b[{random.choice((0, 1))};{random.randrange(30, 38)};{random.randrange(40, 48)}m")
+            line.append("".join(random.choice("░▒▓█▄▀ ") for _ in range(random.randrange(1, 6))))
+        text = "".join(line)
+        samples["cp437 16 colors"] = (text.encode("cp437"), "cp437")
+
+        for name, (data, encoding) in samples.items():
+            path = Path(tmp, "bench.ans")
+            with open(path, "wb") as bench_file:
+                bench_file.write(data * (size // len(data) + 1))
+            cells = 0
+
+            def count(pos, cell):
+                nonlocal cells
+                cells += 1
+
+            start = time.perf_counter()
+            read_file(path, count, encoding=encoding)
+            elapsed = time.perf_counter() - start
+            megabytes = path.stat().st_size / 2 ** 20
+            results[name] = (megabytes, elapsed, cells)
+
+        path = Path(tmp, "bench.ans")
+        from terminedia_paint.canvas import Canvas
+        canvas = Canvas()
+        start = time.perf_counter()
+        read_file(path, canvas_writer(canvas), encoding="cp437")
+        canvas_time = time.perf_counter() - start
+
+    print(f"{'file':<18} {'MB':>6} {'seconds':>8} {'MB/s':>6} {'Mcells/s':>9}", file=file)
+    for name, (megabytes, elapsed, cells) in results.items():
+        print(f"{name:<18} {megabytes:>6.2f} {elapsed:>8.3f} {megabytes / elapsed:>6.2f} {cells / elapsed / 1e6:>9.2f}", file=file)
+    megabytes = results["cp437 16 colors"][0]
+    print(f"cp437 file into a canvas: {canvas_time:.3f}s, {megabytes / canvas_time:.2f} MB/s", file=file)
+    return results
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,335 @@
+"""Crash-safe autosave: a write-ahead log of drawing changes
+
+Every change the undo journal records - tool actions, undo and redo -
+is handed to a background thread, which appends the new value of each
+changed cell to a log file and syncs it to disk, at most once every
+SYNC_INTERVAL seconds. Writing costs as much as the change, whatever
+the size of the drawing.
+
+Once the log grows larger than the last checkpoint, both are merged,
+keeping only the last value of each cell, into a new checkpoint, and
+the log starts over. The painter always starts on an empty canvas, so
+the checkpoint and the log hold the whole drawing.
+
+Files are named after the process id. They are removed on a clean quit:
+files left by a process that is not running anymore are offered for
+recovery on the next launch.
+
+Animation frames and layers each have their own cells: records apply
+to the canvas picked by the last b"T" record in the same file, 0 (the
+one the painter starts with) until there is one. The frames or layers
+of the drawing, in order, are kept in a b"O" record, written each time
+they change; canvases not in it are left out when recovering.
+
+Both files are sequences of records: kind (1 byte), payload length and
+CRC32 of the payload, then the payload. A record cut short by a crash
+fails the check, and it and anything after it are ignored.
+
+  - b"S": index (uint32) and UTF-8 text of a codec string table entry
+  - b"C": cells: x, y (uint16) and the 4 uint32 of the encoded cell
+  - b"T": id (uint32) of the canvas the next records are for
+  - b"E": the canvas is emptied - its whole contents follow
+  - b"D": id (uint32) of another canvas, whose cells are copied into this one
+  - b"O": UTF-8 JSON, {"frames": [id, ...]} or {"layers": [{"id", "name",
+    "visible", "opacity", "key"}, ...]}, bottom layer first
+"""
+
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+from pathlib import Path
+
+from terminedia_paint.canvas import EMPTY_CELL
+from terminedia_paint.cells import CellCodec
+from terminedia_paint.journal import RECORD
+
+LOG_SUFFIX = ".wal"
+CHECKPOINT_SUFFIX = ".ckpt"
+SYNC_INTERVAL = 1.0
+# logs smaller than this are not merged into the checkpoint
+MIN_CHECKPOINT_BYTES = 2 ** 18
+# cells per record in checkpoints
+CHUNK_CELLS = 4096
+
+RECORD_HEADER = struct.Struct("<cII")
+CELL = struct.Struct("<2H4I")
+INDEX = struct.Struct("<I")
+# journal records are x, y (4 bytes), the old cell and the new one (16 bytes each)
+OLD_CELL_OFFSET = 4
+NEW_CELL_OFFSET = 20
+
+
+def autosave_dir():
+    base = os.environ.get("XDG_STATE_HOME") or Path.home() / ".local" / "state"
+    return Path(base) / "terminedia-paint" / "autosave"
+
+
+def _pack(kind, payload):
+    return RECORD_HEADER.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+
+def _string_record(index, text):
+    return _pack(b"S", INDEX.pack(index) + str(text).encode("utf-8"))
+
+
+def read_records(path):
+    """(kind, payload) for each intact record in a log or checkpoint file"""
+    try:
+        data = Path(path).read_bytes()
+    except FileNotFoundError:
+        return
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        kind, size, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start: start + size]
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            return
+        yield kind, payload
+        offset = start + size
+
+
+def read_state(paths):
+    """Merged contents of the files in 'paths'
+
+    Returns ({canvas id: {(x, y): encoded cell}}, {index: string}, order),
+    'order' being the decoded b"O" record, or None if there is none.
+    """
+    canvases = {}
+    strings = {}
+    order = None
+    for path in paths:
+        cells = canvases.setdefault(0, {})
+        for kind, payload in read_records(path):
+            if kind == b"S":
+                strings[INDEX.unpack_from(payload)[0]] = payload[INDEX.size:].decode("utf-8")
+            elif kind == b"C":
+                for x, y, *cell in CELL.iter_unpack(payload):
+                    cells[x, y] = tuple(cell)
+            elif kind == b"T":
+                cells = canvases.setdefault(INDEX.unpack_from(payload)[0], {})
+            elif kind == b"E":
+                cells.clear()
+            elif kind == b"D":
+                source = canvases.get(INDEX.unpack_from(payload)[0], {})
+                cells.clear()
+                cells.update(source)
+            elif kind == b"O":
+                order = json.loads(payload.decode("utf-8"))
+    return canvases, strings, order
+
+
+def canvas_ids(order):
+    """Ids of the canvases in a drawing, in order"""
+    if order is None:
+        return [0]
+    if "frames" in order:
+        return order["frames"]
+    return [layer["id"] for layer in order["layers"]]
+
+
+class Autosave:
+    """Logs the changes recorded by 'journal' to files in 'directory'
+
+    Records are logged for the canvas 'journal.target' is set to. Frames
+    or layers added, removed or reordered are given to 'set_order', and
+    canvases filled without going through the journal to 'copy' or 'dump'.
+    """
+
+    def __init__(self, journal, directory=None):
+        self.journal = journal
+        self.directory = Path(directory or autosave_dir())
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = str(os.getpid())
+        self.log_path = self.directory / (name + LOG_SUFFIX)
+        self.checkpoint_path = self.directory / (name + CHECKPOINT_SUFFIX)
+        self.checkpoint_size = 0
+        self.checkpoints = 0
+        # the first entries are the same for every codec
+        self._strings_written = len(CellCodec().strings)
+        self._empty = CellCodec().encode(EMPTY_CELL)
+        # canvas the records in the log are for
+        self._target_written = 0
+        self._order = None
+        self._file = open(self.log_path, "wb")
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+        journal.log = self.append
+
+    def append(self, records, undo=False):
+        """Queues journal records: cells are logged with their old values if 'undo', the new ones otherwise"""
+        cell = OLD_CELL_OFFSET if undo else NEW_CELL_OFFSET
+        self._put(self.journal.target, b"C", records, cell)
+
+    def set_order(self, order):
+        """Logs the frames or layers of the drawing, as described for b"O" records"""
+        if order != self._order:
+            self._order = order
+            self._put(None, b"O", json.dumps(order).encode("utf-8"))
+
+    def copy(self, source, target):
+        """Logs canvas 'target' as a copy of canvas 'source' - for duplicated frames"""
+        self._put(target, b"D", INDEX.pack(source))
+
+    def dump(self, target, canvas):
+        """Logs all cells of 'canvas' as the contents of canvas 'target' - for those changed out of the journal"""
+        encode, decode = self.journal.codec.encode, canvas.codec.decode
+        empty = canvas.codec.encode(EMPTY_CELL)
+        tw, th = canvas.tile_size
+        cells = bytearray()
+        for key, tile in canvas.tiles.items():
+            for offset in range(0, len(tile), 4):
+                value = tuple(tile[offset: offset + 4])
+                if value != empty:
+                    y, x = divmod(offset // 4, tw)
+                    cells += CELL.pack(key[0] * tw + x, key[1] * th + y, *encode(decode(value)))
+        self._put(target, b"E", b"")
+        self._put(target, b"C", bytes(cells), None)
+
+    def _put(self, target, kind, payload, cell=None):
+        # strings are added to the table from this thread: the writer only takes those already there
+        self._queue.put((target, kind, payload, cell, len(self.journal.codec.strings)))
+
+    def _encode(self, target, kind, payload, cell, strings_count):
+        out = bytearray()
+        strings = self.journal.codec.strings
+        while self._strings_written < strings_count:
+            out += _string_record(self._strings_written, strings[self._strings_written])
+            self._strings_written += 1
+        if target is not None and target != self._target_written:
+            out += _pack(b"T", INDEX.pack(target))
+            self._target_written = target
+        if cell is not None:
+            # journal records: x, y and one of the two cells
+            payload = b"".join(
+                payload[offset: offset + 4] + payload[offset + cell: offset + cell + 16]
+                for offset in range(0, len(payload), RECORD.size)
+            )
+        out += _pack(kind, payload)
+        return out
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            data = bytearray()
+            for item in items:
+                if item is not None:
+                    data += self._encode(*item)
+            if data:
+                self._file.write(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                if self._file.tell() > max(MIN_CHECKPOINT_BYTES, self.checkpoint_size):
+                    self.checkpoint()
+            if None in items:
+                return
+            # changes arriving meanwhile are written together
+            self._stop.wait(SYNC_INTERVAL)
+
+    def checkpoint(self):
+        """Merges the log into the checkpoint, and empties the log - called from the writer thread"""
+        self._file.close()
+        canvases, strings, order = read_state([self.checkpoint_path, self.log_path])
+        temp_path = self.checkpoint_path.with_suffix(".tmp")
+        size = 0
+        with open(temp_path, "wb") as file:
+            for index in sorted(strings):
+                size += file.write(_string_record(index, strings[index]))
+            if order is not None:
+                size += file.write(_pack(b"O", json.dumps(order).encode("utf-8")))
+            # frames and layers removed are left out
+            for target in canvas_ids(order) if order is not None else canvases:
+                size += file.write(_pack(b"T", INDEX.pack(target)))
+                # canvases start empty: erased cells need no record
+                drawn = [CELL.pack(*pos, *cell) for pos, cell in canvases.get(target, {}).items() if cell != self._empty]
+                for start in range(0, len(drawn), CHUNK_CELLS):
+                    size += file.write(_pack(b"C", b"".join(drawn[start: start + CHUNK_CELLS])))
+            file.flush()
+            os.fsync(file.fileno())
+        # a crash from here on replays the old log over the new checkpoint: same result
+        os.replace(temp_path, self.checkpoint_path)
+        self._file = open(self.log_path, "wb")
+        # the new log starts on canvas 0 again
+        self._target_written = 0
+        self.checkpoint_size = size
+        self.checkpoints += 1
+
+    def close(self, discard=False):
+        """Writes pending changes and stops the writer thread - 'discard' removes the files"""
+        if self.journal.log == self.append:
+            self.journal.log = None
+        self._queue.put(None)
+        self._stop.set()
+        self._thread.join()
+        self._file.close()
+        if discard:
+            remove([self.log_path, self.checkpoint_path])
+
+
+def _running(pid):
+    if os.name == "nt":
+        # there, os.kill would terminate the process
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def find_orphans(directory=None):
+    """[checkpoint path, log path] pairs left by processes not running anymore, most recent first"""
+    directory = Path(directory or autosave_dir())
+    if not directory.is_dir():
+        return []
+    pids = {path.stem for path in directory.iterdir() if path.suffix in (LOG_SUFFIX, CHECKPOINT_SUFFIX)}
+    orphans = []
+    for pid in pids:
+        if not pid.isdigit() or int(pid) == os.getpid() or _running(int(pid)):
+            continue
+        paths = [directory / (pid + CHECKPOINT_SUFFIX), directory / (pid + LOG_SUFFIX)]
+        stats = [path.stat() for path in paths if path.exists()]
+        if not any(stat.st_size for stat in stats):
+            # nothing was drawn
+            remove(paths)
+            continue
+        orphans.append((max(stat.st_mtime for stat in stats), paths))
+    orphans.sort(reverse=True)
+    return [paths for _, paths in orphans]
+
+
+def load(paths):
+    """The drawing saved in 'paths', and the codec to decode its cells
+
+    The drawing is a list with ({(x, y): encoded cell}, frame or layer)
+    for each frame or layer in it, in order - the second item is None for
+    frames, or for a drawing with neither, and layer settings for layers.
+    """
+    canvases, strings, order = read_state(paths)
+    table = CellCodec().strings
+    for index in sorted(strings):
+        if index >= len(table):
+            table.extend([" "] * (index - len(table)) + [strings[index]])
+    settings = order["layers"] if order is not None and "layers" in order else [None] * len(canvas_ids(order))
+    drawing = [(canvases.get(target, {}), layer) for target, layer in zip(canvas_ids(order), settings)]
+    return drawing, CellCodec(table)
+
+
+def remove(paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,502 @@
+"""Headless benchmarks for the painter
+
+A `Painter` is built over a non-interactive `Screen` of a fixed size -
+nothing is written to the terminal - and scripted KeyPress, MouseClick,
+MouseMove and MouseRelease events are fed straight into its handlers,
+once for each drawing resolution. Screen updates are rendered into a
+memory buffer.
+
+Each case runs on a fresh painter a few times, and the fastest run is
+kept. Results can be stored as a baseline: later runs are compared to
+it, and the run fails if any case got slower than the allowed tolerance.
+
+    python -m terminedia_paint.benchmarks --save-baseline
+    (upgrade terminedia, change code...)
+    python -m terminedia_paint.benchmarks
+
+Startup is measured in fresh interpreters: the import time reported by
+`python -X importtime`, and the time from interpreter start to the end
+of the first frame and of the frame showing the menu. These also have
+fixed budgets, checked with or without a baseline.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import terminedia as TM
+from terminedia.events import Event, KeyPress, MouseClick, MouseMove, MouseRelease
+from terminedia.input import KeyCodes
+from terminedia.utils import V2
+
+SCREEN_SIZE = (120, 40)
+REPEAT = 3
+TOLERANCE = 0.25
+# differences below this are timer noise, whatever the ratio
+MIN_DIFFERENCE = 0.002
+SAVE_SUFFIXES = (".ans", ".html", ".snapshot", ".tpaint")
+# drawing size for --storage
+STORAGE_SIZE = (400, 120)
+# seconds, from interpreter start
+STARTUP_BUDGET = {"startup/import": 0.25, "startup/first_frame": 0.5, "startup/menu": 1.2}
+
+# Run with "python -c": times are taken from before the first import
+STARTUP_PROBE = """
+import time
+start = time.perf_counter()
+import contextlib, io, json
+import terminedia as TM
+import terminedia_paint
+from terminedia.utils import V2
+
+screen = TM.Screen(size=V2({size}), interactive=False)
+painter = terminedia_paint.Painter(screen=screen)
+with contextlib.redirect_stdout(io.StringIO()):
+    with screen:
+        painter.tool_setup()
+        painter.event_setup()
+        painter.state_reset()
+        screen.update()
+        first_frame = time.perf_counter()
+        while painter.menu is None:
+            screen.update()
+        screen.update()
+        menu = time.perf_counter()
+print(json.dumps({{"first_frame": first_frame - start, "menu": menu - start}}))
+"""
+
+
+def default_baseline_path():
+    from terminedia_paint.charsearch import cache_dir
+    return cache_dir() / "benchmark-baseline.json"
+
+
+class Session:
+    """A painter on a headless screen, and helpers to script it"""
+
+    def __init__(self, size=SCREEN_SIZE, resolution=1):
+        from terminedia_paint import Painter
+
+        self.screen = TM.Screen(size=V2(size), interactive=False)
+        self.painter = Painter(screen=self.screen)
+        self.painter.tool_setup()
+        # in the app, it is built right after the first frame
+        self.painter.build_menu()
+        self.painter.state_reset()
+        self.painter.resolution = resolution
+        # the progress widget polls every 0.1s, which would show up in the timings
+        self.painter._progress = self._progress
+        self.tick = 0
+
+    @staticmethod
+    async def _progress(text, future):
+        await future
+
+    def key(self, key):
+        self.painter.key_dispatcher(Event(KeyPress, dispatch=False, key=key))
+
+    def frame(self):
+        """What the event loop does once per frame"""
+        self.tick += 1
+        self.painter.flush_stroke()
+        self.painter.journal.tick()
+
+    def drag(self, points, events_per_frame=4):
+        """A whole mouse stroke: press, move through 'points', release"""
+        painter = self.painter
+        painter.mouse_click(Event(MouseClick, dispatch=False, pos=V2(points[0]), buttons=1, tick=self.tick))
+        for i, point in enumerate(points):
+            painter.mouse_move(Event(MouseMove, dispatch=False, pos=V2(point), buttons=1, tick=self.tick))
+            if i % events_per_frame == events_per_frame - 1:
+                self.frame()
+        painter.mouse_release(Event(MouseRelease, dispatch=False, pos=V2(points[-1]), buttons=0, tick=self.tick))
+        self.frame()
+
+    def render(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.screen.update()
+
+
+def zigzag(size, rows=8):
+    """Mouse positions sweeping the screen left and right, going down"""
+    width, height = size
+    points = []
+    for row in range(rows):
+        y = 1 + row * (height - 2) // rows
+        xs = range(1, width - 1) if row % 2 == 0 else range(width - 2, 0, -1)
+        points.extend((x, y) for x in xs)
+    return points
+
+
+def make_image(path, size=(256, 256)):
+    from PIL import Image
+
+    image = Image.new("RGB", size)
+    image.putdata([(x, y, (x * y) % 256) for y in range(size[1]) for x in range(size[0])])
+    image.save(path)
+    return path
+
+
+# Each case gets a fresh session, and returns the function to be timed
+
+def case_keys(session):
+    keys = [KeyCodes.RIGHT, " ", KeyCodes.DOWN, " ", KeyCodes.LEFT, KeyCodes.UP, "x"] * 40
+    return lambda: [session.key(key) for key in keys]
+
+
+def case_stroke(session):
+    points = zigzag(session.screen.size)
+    return lambda: session.drag(points)
+
+
+def case_flood_fill(session):
+    return lambda: asyncio.run(session.painter.flood_fill())
+
+
+def case_undo_redo(session):
+    for row in range(4):
+        session.drag(zigzag(session.screen.size, rows=2 + row))
+    journal = session.painter.journal
+
+    def run():
+        while journal.undo():
+            pass
+        while journal.redo():
+            pass
+    return run
+
+
+def case_insert_image(session, image_path, palette="truecolor"):
+    from terminedia_paint import imaging
+
+    session.painter.palette = palette
+
+    def run():
+        imaging.cache_clear()
+        session.painter.paste_image(image_path, session.screen.size[0])
+    return run
+
+
+def case_reduce_colors(session, image_path):
+    painter = session.painter
+    painter.paste_image(image_path, session.screen.size[0] * 4)
+    painter.palette = "256"
+    return painter.reduce_colors
+
+
+def case_render(session):
+    session.drag(zigzag(session.screen.size))
+    session.render()
+
+    def run():
+        session.screen.shape.dirty_set()
+        session.render()
+    return run
+
+
+def case_save(session, path):
+    session.drag(zigzag(session.screen.size))
+
+    def run():
+        function, *args = session.painter.save_job(str(path))
+        function(*args)
+    return run
+
+
+def case_snapshot(session):
+    """What saving copies in the UI process, before handing it to a worker"""
+    session.drag(zigzag(session.screen.size))
+    return session.painter.viewport.snapshot
+
+
+def case_layers(session, count):
+    """Strokes rendered a frame at a time, on the middle one of 'count' layers with drawings"""
+    painter = session.painter
+    size = session.screen.size
+    painter._layers()
+    for index in range(count - 1):
+        session.drag(zigzag(size, rows=3 + index))
+        painter.new_layer()
+    painter.select_layer(-(count // 2))
+    # the first frame draws the whole screen, and fills the layer caches
+    session.render()
+    points = zigzag(size)
+
+    def run():
+        for start in range(0, len(points), 16):
+            session.drag(points[start: start + 16])
+            session.render()
+    return run
+
+
+def storage_report(size=STORAGE_SIZE, file=None):
+    """Memory use and copy times for a drawing held in a terminedia FullShape, a Canvas and a CellGrid
+
+    The test drawing has bands of colored text, and empty areas. Memory is
+    what tracemalloc sees allocated by building each one.
+    """
+    import tracemalloc
+    from terminedia.utils import Rect
+    from terminedia_paint.canvas import Canvas
+
+    file = file or sys.stdout
+    width, height = size
+    colors = [TM.Color((255, 0, 0)), TM.Color((0, 255, 0)), TM.Color((0, 0, 255)), TM.DEFAULT_FG]
+    drawn = [(x, y) for y in range(0, height, 2) for x in range(width * 2 // 3)]
+
+    def cell(x, y):
+        return "#*.█"[(x // 7 + y) % 4], colors[(x // 13) % 4], TM.DEFAULT_BG, TM.Effects.none
+
+    def allocated(build):
+        gc.collect()
+        tracemalloc.start()
+        result = build()
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, held
+
+    def build_shape():
+        shape = TM.shape(size)
+        for pos in drawn:
+            shape[pos] = cell(*pos)
+        return shape
+
+    def build_canvas():
+        canvas = Canvas()
+        for pos in drawn:
+            canvas.set(pos, cell(*pos))
+        return canvas
+
+    shape, shape_bytes = allocated(build_shape)
+    canvas, canvas_bytes = allocated(build_canvas)
+    grid, grid_bytes = allocated(lambda: canvas.read_region(Rect(size)))
+    print(f"{width}x{height} cells, {len(drawn)} drawn", file=file)
+    print(f"{'storage':<24} {'bytes':>10}", file=file)
+    for name, held in (("FullShape", shape_bytes), ("Canvas", canvas_bytes), ("CellGrid", grid_bytes)):
+        print(f"{name:<24} {held:>10}", file=file)
+
+    def best(function):
+        times = []
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    def blit(source):
+        target = TM.shape(source.size)
+        target.draw.blit((0, 0), source)
+
+    region = Rect((width // 4, height // 4), width_height=(width // 2, height // 2))
+    copies = {
+        "all, FullShape blit": best(lambda: blit(shape)),
+        "all, read_region": best(lambda: canvas.read_region(Rect(size))),
+        "all, write_region": best(lambda: Canvas(codec=canvas.codec).write_region((0, 0), grid)),
+        "1/4, FullShape blit": best(lambda: blit(shape[region])),
+        "1/4, read_region": best(lambda: canvas.read_region(region)),
+        "1/4, CellGrid.copy": best(lambda: grid.copy(region)),
+    }
+    print(f"{'copy':<24} {'time':>10}", file=file)
+    for name, elapsed in copies.items():
+        print(f"{name:<24} {elapsed * 1000:>8.2f}ms", file=file)
+    return {"bytes": {"shape": shape_bytes, "canvas": canvas_bytes, "grid": grid_bytes}, "copies": copies}
+
+
+def import_time(module="terminedia_paint"):
+    """Seconds taken by 'import module' in a new interpreter, as reported by -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1e6
+    raise RuntimeError(f"no import time reported for {module}")
+
+
+def startup_times(size=SCREEN_SIZE):
+    """Seconds from the start of a new interpreter to the first frame, and to the frame showing the menu"""
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP_PROBE.format(size=tuple(size))],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def measure_startup(size, repeat):
+    results = {"startup/import": min(import_time() for _ in range(repeat))}
+    runs = [startup_times(size) for _ in range(repeat)]
+    for name in ("first_frame", "menu"):
+        results[f"startup/{name}"] = min(run[name] for run in runs)
+    return results
+
+
+def over_budget(results, budget=STARTUP_BUDGET):
+    """[(name, seconds, budget seconds)] for the results exceeding their budget"""
+    return [(name, results[name], limit) for name, limit in budget.items() if results.get(name, 0) > limit]
+
+
+def measure(make_case, size, resolution, repeat):
+    best = None
+    for _ in range(repeat):
+        run = make_case(Session(size, resolution))
+        # as in timeit: garbage collection pauses would only add noise
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_all(size=SCREEN_SIZE, repeat=REPEAT, only=None, file=None):
+    """Runs every case, returning a {name: seconds} dict
+
+    Drawing cases run once per drawing resolution; saving runs at
+    full block resolution, once per file format.
+    """
+    from terminedia_paint import resolutions
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = make_image(Path(tmp, "image.png"))
+        cases = {}
+        for resolution, (name, _) in resolutions.items():
+            cases[f"{name}/keys"] = (case_keys, resolution)
+            cases[f"{name}/stroke"] = (case_stroke, resolution)
+            cases[f"{name}/flood_fill"] = (case_flood_fill, resolution)
+            cases[f"{name}/undo_redo"] = (case_undo_redo, resolution)
+            cases[f"{name}/insert_image"] = (lambda session: case_insert_image(session, image_path), resolution)
+        cases["palette/insert_image"] = (lambda session: case_insert_image(session, image_path, "16"), 4)
+        cases["palette/reduce_colors"] = (lambda session: case_reduce_colors(session, image_path), 4)
+        cases["render"] = (case_render, 1)
+        cases["snapshot"] = (case_snapshot, 1)
+        for count in (1, 4):
+            cases[f"layers/{count}"] = (lambda session, count=count: case_layers(session, count), 1)
+        for suffix in SAVE_SUFFIXES:
+            path = Path(tmp, "drawing" + suffix)
+            cases[f"save{suffix}"] = (lambda session, path=path: case_save(session, path), 1)
+
+        for name, (make_case, resolution) in cases.items():
+            if only and not any(pattern in name for pattern in only):
+                continue
+            results[name] = measure(make_case, size, resolution, repeat)
+            if file:
+                print(f"{name:<24} {results[name] * 1000:>10.1f}ms", file=file)
+    if not only or any(pattern in name for pattern in only for name in STARTUP_BUDGET):
+        for name, elapsed in measure_startup(size, repeat).items():
+            if only and not any(pattern in name for pattern in only):
+                continue
+            results[name] = elapsed
+            if file:
+                print(f"{name:<24} {elapsed * 1000:>10.1f}ms", file=file)
+    return results
+
+
+def environment(size):
+    return {
+        "python": platform.python_version(),
+        "terminedia": getattr(TM, "__version__", "unknown"),
+        "machine": platform.machine(),
+        "screen": list(size),
+    }
+
+
+def save_baseline(results, path, size):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wt") as file:
+        json.dump({"environment": environment(size), "results": results}, file, indent=2)
+
+
+def load_baseline(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Returns [(name, seconds, baseline seconds, ratio, regressed)] for each result"""
+    report = []
+    for name, elapsed in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            report.append((name, elapsed, None, None, False))
+            continue
+        ratio = elapsed / reference if reference else float("inf")
+        regressed = ratio > 1 + tolerance and elapsed - reference > MIN_DIFFERENCE
+        report.append((name, elapsed, reference, ratio, regressed))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m terminedia_paint.benchmarks",
+        description="Time painting operations on a headless screen, and compare them to a baseline"
+    )
+    parser.add_argument("--baseline", type=Path, default=None, metavar="PATH",
+        help="Baseline file (default: in the user cache directory)")
+    parser.add_argument("--save-baseline", action="store_true",
+        help="Store these results as the new baseline, instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+        help="Allowed slowdown against the baseline (default: %(default)g, i.e. 25%%)")
+    parser.add_argument("--repeat", type=int, default=REPEAT,
+        help="Runs per case - the fastest is kept (default: %(default)s)")
+    parser.add_argument("--size", type=int, nargs=2, default=SCREEN_SIZE, metavar=("COLS", "ROWS"),
+        help="Screen size (default: %(default)s)")
+    parser.add_argument("--only", nargs="+", metavar="NAME",
+        help="Run only the cases with any of these strings in their names")
+    parser.add_argument("--storage", action="store_true",
+        help="Only compare memory use and copy times of the ways to hold a drawing")
+    args = parser.parse_args(argv)
+    if args.storage:
+        storage_report()
+        return 0
+    path = args.baseline or default_baseline_path()
+
+    results = run_all(tuple(args.size), args.repeat, args.only)
+    slow_startup = over_budget(results)
+    for name, elapsed, limit in slow_startup:
+        print(f"{name} took {elapsed * 1000:.1f}ms: over its {limit * 1000:.0f}ms budget")
+    if args.save_baseline:
+        save_baseline(results, path, args.size)
+        for name, elapsed in results.items():
+            print(f"{name:<24} {elapsed * 1000:>10.1f}ms")
+        print(f"Baseline saved to {path}")
+        return 1 if slow_startup else 0
+
+    try:
+        baseline = load_baseline(path)
+    except (OSError, ValueError):
+        baseline = {"results": {}}
+        print(f"No baseline at {path}: run with --save-baseline to create one")
+    if baseline.get("environment", {}) not in ({}, environment(args.size)):
+        print(f"Baseline taken on a different setup: {baseline['environment']}")
+    failed = 0
+    print(f"{'case':<24} {'time':>10} {'baseline':>10} {'ratio':>6}")
+    for name, elapsed, reference, ratio, regressed in compare(results, baseline["results"], args.tolerance):
+        failed += regressed
+        reference_text = "-" if reference is None else f"{reference * 1000:.1f}ms"
+        ratio_text = "-" if ratio is None else f"{ratio:.2f}"
+        print(f"{name:<24} {elapsed * 1000:>8.1f}ms {reference_text:>10} {ratio_text:>6}{'  SLOWER' if regressed else ''}")
+    if failed:
+        print(f"{failed} case(s) slower than the baseline by more than {args.tolerance:.0%}")
+    return 1 if failed or slow_startup else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""Live broadcast of the drawing to any number of viewers
+
+`terminedia-paint --broadcast ADDRESS` listens on a Unix socket (any
+ADDRESS with a "/" in it) or on TCP ("HOST:PORT" or ":PORT"), and
+`terminedia-paint --view ADDRESS` shows the drawing as it is made, in
+another terminal - on the same machine, or anywhere TCP reaches.
+
+Cells changed on the painter screen are collected as they are set, and
+once per frame encoded in a single message, whose bytes are handed to
+every viewer: the cost of a frame does not depend on how many are
+watching. Viewers joining get a keyframe with the whole screen first.
+Menus and other widgets are sprites over the drawing, so they are not
+sent.
+
+Sockets are written without blocking. A viewer whose unsent data grows
+past MAX_BACKLOG is skipped, and gets a new keyframe once it catches up,
+so slow connections never hold the painter back.
+
+Messages are a kind byte and a payload length (uint32), then the payload:
+
+  - b"S": index (uint32) and UTF-8 text of an entry added to the string
+    table of the painter's `cells.CellCodec`
+  - b"K": screen width, height (uint16), then all its cells, row by row,
+    as the 4 uint32 of `cells.CellCodec`, zlib compressed
+  - b"D": cells changed: x, y (uint16) and the 4 uint32 of the cell
+"""
+
+import asyncio
+import os
+import socket
+import struct
+import sys
+import zlib
+
+from terminedia.values import EMPTY
+
+from terminedia_paint.cells import CELL, CellCodec
+
+HEADER = struct.Struct("<cI")
+SIZE = struct.Struct("<2H")
+DELTA_CELL = struct.Struct("<2H4I")
+INDEX = struct.Struct("<I")
+# TRANSPARENT and CONTINUATION are in every codec table from the start
+FIRST_STRING = len(CellCodec().strings)
+# bytes waiting to be sent to a viewer before it is skipped
+MAX_BACKLOG = 2 ** 20
+
+
+def parse_address(address):
+    """("unix", path) or ("tcp", host, port) for an address given in the command line"""
+    if "/" in address or ":" not in address:
+        return ("unix", address)
+    host, _, port = address.rpartition(":")
+    return ("tcp", host or "localhost", int(port))
+
+
+def _message(kind, payload):
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+def _string_message(index, text):
+    return _message(b"S", INDEX.pack(index) + str(text).encode("utf-8"))
+
+
+def listen(address):
+    """A listening socket for 'address' - a stale Unix socket file left by a crash is replaced"""
+    address = parse_address(address)
+    if address[0] == "tcp":
+        return socket.create_server(address[1:])
+    path = address[1]
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            raise OSError(f"{path} is in use by another broadcast")
+        finally:
+            probe.close()
+    sock = socket.socket(socket.AF_UNIX)
+    sock.bind(path)
+    sock.listen()
+    return sock
+
+
+class Viewer:
+    def __init__(self, writer):
+        self.writer = writer
+        # set for new viewers, and for those that fell behind
+        self.needs_keyframe = True
+
+    @property
+    def backlog(self):
+        return self.writer.transport.get_write_buffer_size()
+
+
+class Broadcaster:
+    """Streams the changes made to 'shape' to the viewers connected to 'address'
+
+    The socket is bound right away, so errors show up before the app
+    starts. Call 'tick' once per frame, from the event loop.
+    """
+
+    def __init__(self, shape, address):
+        self.shape = shape
+        self.address = address
+        self.sock = listen(address)
+        self.codec = CellCodec()
+        self.viewers = []
+        self.server = None
+        self.touched = set()
+        self.full = True
+        self.frames = 0
+        self.bytes_sent = 0
+        self._strings_sent = FIRST_STRING
+        self._mark = shape.dirty_mark_pixel
+        shape.dirty_mark_pixel = self.mark
+        self._dirty_set = shape.dirty_set
+        shape.dirty_set = self.dirty_set
+
+    def mark(self, pos):
+        """Called by the shape before any cell is changed"""
+        self.touched.add((pos[0], pos[1]))
+        # double width characters also change the cell to the right
+        self.touched.add((pos[0] + 1, pos[1]))
+        self._mark(pos)
+
+    def dirty_set(self, rect=None):
+        """Called when the whole shape may have changed - scrolling, clearing"""
+        self.full = True
+        self._dirty_set(rect)
+
+    async def _serve(self, reader, writer):
+        viewer = Viewer(writer)
+        self.viewers.append(viewer)
+        try:
+            # viewers send nothing: this just waits for them to leave
+            while await reader.read(4096):
+                pass
+        except (OSError, asyncio.CancelledError):
+            # cancelled when the event loop shuts down
+            pass
+        finally:
+            self._drop(viewer)
+
+    def _drop(self, viewer):
+        if viewer in self.viewers:
+            self.viewers.remove(viewer)
+        viewer.writer.close()
+
+    def _start(self):
+        if self.sock.family == socket.AF_UNIX:
+            server = asyncio.start_unix_server(self._serve, sock=self.sock)
+        else:
+            server = asyncio.start_server(self._serve, sock=self.sock)
+        self.server = asyncio.ensure_future(server)
+
+    def _strings(self, start):
+        strings = self.codec.strings
+        self._strings_sent = len(strings)
+        return b"".join(_string_message(index, strings[index]) for index in range(start, len(strings)))
+
+    def _cells(self, positions):
+        # raw data, as in export.snapshot_planes: no sprites, and no per-cell bounds checks
+        shape = self.shape
+        data = shape.data
+        context = shape.context
+        default = (EMPTY, context.color, context.background, context.effects)
+        encode = self.codec.encode
+        transformers = context.transformers
+        if not transformers:
+            return [encode(data.get(pos, default)) for pos in positions]
+        # layers and the onion skin are shown through transformers
+        pixel = shape.PixelCls
+        return [encode(transformers.process(shape, pos, pixel(*data.get(pos, default)))) for pos in positions]
+
+    def keyframe(self):
+        """Message with the whole screen, preceded by the whole string table"""
+        width, height = self.shape.size
+        cells = self._cells((x, y) for y in range(height) for x in range(width))
+        packed = b"".join(CELL.pack(*cell) for cell in cells)
+        payload = SIZE.pack(width, height) + zlib.compress(packed, 1)
+        # the string table only grows, and viewers joining need all of it
+        return self._strings(FIRST_STRING) + _message(b"K", payload)
+
+    def delta(self, touched):
+        """Message with the cells at the 'touched' positions - None if none is on the screen"""
+        width, height = self.shape.size
+        positions = sorted(
+            (pos for pos in touched if 0 <= pos[0] < width and 0 <= pos[1] < height),
+            key=lambda pos: (pos[1], pos[0]),
+        )
+        if not positions:
+            return None
+        cells = self._cells(positions)
+        payload = b"".join(DELTA_CELL.pack(*pos, *cell) for pos, cell in zip(positions, cells))
+        return self._strings(self._strings_sent) + _message(b"D", payload)
+
+    def tick(self, event=None):
+        """Sends what changed on this frame to every viewer"""
+        if self.server is None:
+            self._start()
+        touched, full = self.touched, self.full
+        self.touched = set()
+        self.full = False
+        if not self.viewers:
+            # nothing to encode: whoever connects next gets a keyframe anyway
+            return
+        width, height = self.shape.size
+        if full or len(touched) * 2 > width * height:
+            for viewer in self.viewers:
+                viewer.needs_keyframe = True
+            delta = None
+        else:
+            delta = self.delta(touched) if touched else None
+        keyframe = None
+        for viewer in list(self.viewers):
+            if viewer.writer.is_closing():
+                self._drop(viewer)
+                continue
+            if viewer.backlog > MAX_BACKLOG:
+                viewer.needs_keyframe = True
+                continue
+            if viewer.needs_keyframe:
+                if keyframe is None:
+                    keyframe = self.keyframe()
+                data = keyframe
+                viewer.needs_keyframe = False
+            elif delta:
+                data = delta
+            else:
+                continue
+            viewer.writer.write(data)
+            self.bytes_sent += len(data)
+        self.frames += 1
+
+    def close(self):
+        for viewer in list(self.viewers):
+            self._drop(viewer)
+        if self.server is not None and self.server.done() and not self.server.exception():
+            self.server.result().close()
+        self.sock.close()
+        if parse_address(self.address)[0] == "unix":
+            try:
+                os.unlink(self.address)
+            except FileNotFoundError:
+                pass
+
+
+class Receiver:
+    """Applies broadcast messages to 'shape'"""
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.codec = CellCodec()
+        self.frames = 0
+        # encoded cells on the shape: keyframes mostly repeat what is already there
+        self.cells = {}
+
+    def _set(self, pos, encoded):
+        if self.cells.get(pos) == encoded or pos not in self.shape.rect:
+            return
+        self.cells[pos] = encoded
+        self.shape[pos] = self.codec.decode(encoded)
+
+    def apply(self, kind, payload):
+        if kind == b"S":
+            index = INDEX.unpack_from(payload)[0]
+            strings = self.codec.strings
+            if index >= len(strings):
+                strings.extend([" "] * (index - len(strings) + 1))
+            strings[index] = payload[INDEX.size:].decode("utf-8")
+        elif kind == b"K":
+            width, height = SIZE.unpack_from(payload)
+            data = zlib.decompress(payload[SIZE.size:])
+            for index, cell in enumerate(CELL.iter_unpack(data)):
+                self._set(divmod(index, width)[::-1], cell)
+            self.frames += 1
+        elif kind == b"D":
+            for x, y, *cell in DELTA_CELL.iter_unpack(payload):
+                self._set((x, y), tuple(cell))
+            self.frames += 1
+
+
+async def connect(address):
+    address = parse_address(address)
+    if address[0] == "unix":
+        return await asyncio.open_unix_connection(address[1])
+    return await asyncio.open_connection(*address[1:])
+
+
+async def receive(reader, receiver):
+    """Applies messages from 'reader' until the connection is closed"""
+    while True:
+        try:
+            header = await reader.readexactly(HEADER.size)
+            kind, size = HEADER.unpack(header)
+            payload = await reader.readexactly(size)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+        receiver.apply(kind, payload)
+
+
+def view(address):
+    """Shows a broadcast drawing until the painter quits, or <ESC> or "q" is pressed"""
+    import terminedia as TM
+    from terminedia.input import KeyCodes
+
+    from terminedia_paint.damage import DamageTracker
+
+    async def main(screen):
+        try:
+            reader, writer = await connect(address)
+        except OSError as error:
+            TM.events.Event(TM.events.QuitLoop)
+            return f"Can't connect to {address}: {error}"
+        receiver = Receiver(screen.shape)
+        task = asyncio.create_task(receive(reader, receiver))
+
+        def key(event):
+            if event.key in ("q", KeyCodes.ESC):
+                TM.events.Event(TM.events.QuitLoop)
+
+        TM.events.Subscription(TM.events.KeyPress, key)
+        task.add_done_callback(lambda task: TM.events.Event(TM.events.QuitLoop))
+        await TM.terminedia_main(screen=screen)
+        task.cancel()
+        writer.close()
+        return None if not task.done() or task.cancelled() else "The broadcast ended"
+
+    screen = TM.Screen()
+    DamageTracker(screen)
+    with screen:
+        status = asyncio.run(main(screen))
+        screen.commands.moveto(screen.size)
+    if status:
+        print(status, file=sys.stderr)
@@ -0,0 +1,406 @@
+"""Sparse drawing canvas, larger than the terminal
+
+The artwork is kept in a `Canvas`, split in fixed-size tiles: tiles in
+which all cells are empty are not stored at all, so memory use follows
+the drawn area, not its bounding box. Cells are kept encoded as integers
+(see `cells.CellCodec`) in one flat array per tile.
+
+The screen shape works as a `Viewport` over the canvas: tools keep drawing
+on the screen shape as before, the cells they touch are tracked, and
+written back to the canvas before scrolling or saving. Scrolling loads
+only the tiles that become visible.
+
+Rectangular areas are copied out of the canvas, and back, as a `CellGrid`:
+one array per cell field, filled through array slices of the tiles.
+"""
+
+from array import array
+
+import terminedia as TM
+from terminedia.utils import Rect, V2
+from terminedia.values import DEFAULT_BG, DEFAULT_FG, EMPTY, TRANSPARENT
+
+from terminedia_paint.cells import CellCodec
+
+TILE_SIZE = V2(32, 16)
+# cell coordinates are stored as unsigned 16 bit integers in the undo journal
+MAX_SIZE = V2(2 ** 16, 2 ** 16)
+EMPTY_CELL = (EMPTY, DEFAULT_FG, DEFAULT_BG, TM.Effects.none)
+
+
+class CellGrid:
+    """Dense rectangle of encoded cells, one array per field
+
+    Codepoints (or string table indexes), foreground and background
+    colors as 0xRRGGBB, and effects flags are each kept in their own
+    `array("I")`, a row after another - so any field of any row is a
+    contiguous slice. Grids are copied in and out of a `Canvas` through
+    array slices, no cell is decoded, and they pickle as four byte
+    strings and the string table: a cheap snapshot of a drawing.
+    """
+
+    def __init__(self, size, codec=None, empty=None):
+        self.width, self.height = size
+        self.codec = codec or CellCodec()
+        count = self.width * self.height
+        empty = empty or self.codec.encode(EMPTY_CELL)
+        self.chars, self.fg, self.bg, self.effects = self.planes = tuple(
+            array("I", [value]) * count for value in empty
+        )
+
+    @property
+    def size(self):
+        return V2(self.width, self.height)
+
+    def get_encoded(self, pos):
+        index = pos[1] * self.width + pos[0]
+        return self.chars[index], self.fg[index], self.bg[index], self.effects[index]
+
+    def set_encoded(self, pos, encoded):
+        index = pos[1] * self.width + pos[0]
+        self.chars[index], self.fg[index], self.bg[index], self.effects[index] = encoded
+
+    def get(self, pos):
+        return self.codec.decode(self.get_encoded(pos))
+
+    def set(self, pos, value):
+        self.set_encoded(pos, self.codec.encode(value))
+
+    def copy(self, rect=None):
+        """New grid with the cells in 'rect' (grid coordinates) - the whole grid by default"""
+        rect = Rect(rect or self.size).intersection(Rect(self.size))
+        grid = CellGrid(rect.width_height if rect else (0, 0), self.codec)
+        if not rect:
+            return grid
+        width = rect.width
+        for y in range(rect.height):
+            start = (rect.top + y) * self.width + rect.left
+            for source, target in zip(self.planes, grid.planes):
+                target[y * width: (y + 1) * width] = source[start: start + width]
+        return grid
+
+    def cells(self):
+        """Each cell as a tuple of 4 integers, row by row"""
+        return zip(*self.planes)
+
+    def to_planes(self):
+        """FullShape data planes, as `Canvas.snapshot_planes` - equal cells share their decoded values"""
+        decode = self.codec.decode
+        decoded = {}
+        width = self.width
+        chars = []
+        row = []
+        fg = []
+        bg = []
+        effects = []
+        for cell in self.cells():
+            value = decoded.get(cell)
+            if value is None:
+                value = decoded[cell] = decode(cell)
+            row.append(value[0])
+            fg.append(value[1])
+            bg.append(value[2])
+            effects.append(value[3])
+            if len(row) == width:
+                chars.append(row)
+                row = []
+        return [chars, fg, bg, effects]
+
+    def __getstate__(self):
+        # the codec caches decoded colors: only its string table is needed
+        state = self.__dict__.copy()
+        state["codec"] = list(self.codec.strings)
+        return state
+
+    def __setstate__(self, state):
+        state["codec"] = CellCodec(state["codec"])
+        self.__dict__.update(state)
+
+
+class Canvas:
+    """Sparse grid of cells, stored in tiles of 'tile_size' cells"""
+
+    def __init__(self, tile_size=TILE_SIZE, codec=None):
+        self.tile_size = V2(tile_size)
+        self.codec = codec or CellCodec()
+        self.tiles = {}
+        self.empty_cell = self.codec.encode(EMPTY_CELL)
+        self._decoded = {}
+        self._empty_tile = array("I", self.empty_cell * (self.tile_size.x * self.tile_size.y))
+
+    def _locate(self, pos):
+        tile_x, x = divmod(pos[0], self.tile_size.x)
+        tile_y, y = divmod(pos[1], self.tile_size.y)
+        return (tile_x, tile_y), (y * self.tile_size.x + x) * 4
+
+    def get_encoded(self, pos):
+        key, offset = self._locate(pos)
+        tile = self.tiles.get(key)
+        if tile is None:
+            return self.empty_cell
+        return tuple(tile[offset: offset + 4])
+
+    def get(self, pos):
+        encoded = self.get_encoded(pos)
+        value = self._decoded.get(encoded)
+        if value is None:
+            value = self._decoded[encoded] = tuple(self.codec.decode(encoded))
+        return value
+
+    def set(self, pos, value):
+        self.set_encoded(pos, self.codec.encode(value))
+
+    def set_encoded(self, pos, encoded):
+        if not (0 <= pos[0] < MAX_SIZE.x and 0 <= pos[1] < MAX_SIZE.y):
+            return
+        key, offset = self._locate(pos)
+        tile = self.tiles.get(key)
+        if tile is None:
+            if encoded == self.empty_cell:
+                return
+            tile = self.tiles[key] = array("I", self._empty_tile)
+        tile[offset: offset + 4] = array("I", encoded)
+
+    def prune(self, keys=None):
+        """Drops tiles with no drawn cells left"""
+        for key in list(self.tiles if keys is None else keys):
+            if self.tiles.get(key) == self._empty_tile:
+                del self.tiles[key]
+
+    def tiles_in(self, rect):
+        """Keys for the tiles overlapping 'rect', whether they exist or not"""
+        rect = Rect(rect)
+        tw, th = self.tile_size
+        for tile_y in range(rect.top // th, (rect.bottom - 1) // th + 1):
+            for tile_x in range(rect.left // tw, (rect.right - 1) // tw + 1):
+                yield tile_x, tile_y
+
+    @property
+    def extent(self):
+        """Size of the area from (0, 0) containing every drawn cell"""
+        width = height = 0
+        tw, th = self.tile_size
+        row_size = tw * 4
+        empty_row = self._empty_tile[:row_size]
+        empty = array("I", self.empty_cell)
+        for (tile_x, tile_y), tile in self.tiles.items():
+            if (tile_x + 1) * tw <= width and (tile_y + 1) * th <= height:
+                continue
+            for y in range(th):
+                start = y * row_size
+                if tile[start: start + row_size] == empty_row:
+                    continue
+                height = max(height, tile_y * th + y + 1)
+                # rightmost drawn cell in the row
+                for x in range(tw - 1, (width - tile_x * tw) - 1, -1):
+                    if tile[start + x * 4: start + x * 4 + 4] != empty:
+                        width = tile_x * tw + x + 1
+                        break
+        return V2(width, height)
+
+    @property
+    def nbytes(self):
+        return sum(tile.itemsize * len(tile) for tile in self.tiles.values())
+
+    def _tile_rows(self, rect):
+        """(tile key, tile offset, row start in 'rect', run length) for each row run of the tiles overlapping 'rect'"""
+        tw, th = self.tile_size
+        for key in self.tiles_in(rect):
+            area = Rect((key[0] * tw, key[1] * th), width_height=(tw, th)).intersection(rect)
+            for y in range(area.top, area.bottom):
+                offset = ((y - key[1] * th) * tw + area.left - key[0] * tw) * 4
+                yield key, offset, (y - rect.top) * rect.width + area.left - rect.left, area.width
+
+    def read_region(self, rect):
+        """The cells in 'rect' as a `CellGrid` sharing this canvas codec"""
+        rect = Rect(rect)
+        grid = CellGrid(rect.width_height, self.codec, self.empty_cell)
+        planes = grid.planes
+        tiles = self.tiles
+        for key, offset, start, width in self._tile_rows(rect):
+            tile = tiles.get(key)
+            if tile is None:
+                continue
+            end = offset + width * 4
+            for field, plane in enumerate(planes):
+                plane[start: start + width] = tile[offset + field: end: 4]
+        return grid
+
+    def write_region(self, pos, grid):
+        """Copies all cells of 'grid', which must use this canvas codec, to 'pos'"""
+        rect = Rect(pos, width_height=grid.size).intersection(Rect(MAX_SIZE))
+        if not rect:
+            return
+        # the grid may stick out of the canvas at the right or bottom
+        skip = rect.width_height != grid.size
+        tiles = self.tiles
+        for key, offset, start, width in self._tile_rows(rect):
+            if skip:
+                row, column = divmod(start, rect.width)
+                start = row * grid.width + column
+            tile = tiles.get(key)
+            if tile is None:
+                tile = tiles[key] = array("I", self._empty_tile)
+            end = offset + width * 4
+            for field, plane in enumerate(grid.planes):
+                tile[offset + field: end: 4] = plane[start: start + width]
+        self.prune(set(self.tiles_in(rect)))
+
+    def snapshot_planes(self, size):
+        """FullShape data planes for the area from (0, 0) to 'size'
+
+        Same format as `export.snapshot_planes`, so it can be saved by
+        `export.save_snapshot`.
+        """
+        return self.read_region(Rect(size)).to_planes()
+
+
+class Viewport:
+    """Displays the area of 'canvas' starting at 'origin' on 'shape'
+
+    Changes made to the shape are written back to the canvas on 'sync'.
+    Positions taken and returned by methods are in canvas coordinates,
+    unless stated otherwise.
+    """
+
+    def __init__(self, shape, canvas=None):
+        self.shape = shape
+        self.canvas = canvas or Canvas()
+        self.origin = V2(0, 0)
+        self.touched = set()
+        self._mark = shape.dirty_mark_pixel
+        shape.dirty_mark_pixel = self.mark
+
+    def mark(self, pos):
+        """Called by the shape before any cell is changed"""
+        if pos in self.shape.rect:
+            self.touched.add((pos[0], pos[1]))
+            # double width characters also change the cell to the right
+            if pos[0] + 1 < self.shape.width:
+                self.touched.add((pos[0] + 1, pos[1]))
+        self._mark(pos)
+
+    def mark_cell(self, pos):
+        """Called before a cell out of view is changed directly in the canvas"""
+
+    @property
+    def rect(self):
+        return Rect(self.origin, self.origin + self.shape.size)
+
+    def to_canvas(self, pos):
+        return V2(pos[0] + self.origin.x, pos[1] + self.origin.y)
+
+    def to_screen(self, pos):
+        return V2(pos[0] - self.origin.x, pos[1] - self.origin.y)
+
+    def visible(self, pos):
+        x = pos[0] - self.origin.x
+        y = pos[1] - self.origin.y
+        return 0 <= x < self.shape.width and 0 <= y < self.shape.height
+
+    def get(self, pos):
+        if self.visible(pos):
+            return tuple(self.shape.get_raw(self.to_screen(pos)))
+        return self.canvas.get(pos)
+
+    def set(self, pos, value):
+        """Sets a cell without going through the shape drawing logic"""
+        if self.visible(pos):
+            pos = self.to_screen(pos)
+            self.shape.dirty_mark_pixel(pos)
+            self.shape._raw_setitem(pos, value, force_transparent_ink=True)
+        else:
+            self.mark_cell(pos)
+            self.canvas.set(pos, value)
+
+    def set_encoded(self, pos, encoded):
+        """'set' for a cell encoded by the canvas codec: cells out of view are not decoded"""
+        if self.visible(pos):
+            self.set(pos, self.canvas.codec.decode(encoded))
+            return
+        self.mark_cell(pos)
+        self.canvas.set_encoded(pos, encoded)
+
+    def sync(self):
+        """Writes the cells changed on screen back to the canvas"""
+        if not self.touched:
+            return
+        get_raw = self.shape.get_raw
+        tiles = set()
+        for pos in self.touched:
+            canvas_pos = self.to_canvas(pos)
+            self.canvas.set(canvas_pos, get_raw(pos))
+            tiles.add(self.canvas._locate(canvas_pos)[0])
+        self.canvas.prune(tiles)
+        self.touched = set()
+
+    def scroll_to(self, origin):
+        self.sync()
+        size = self.shape.size
+        origin = V2(
+            max(0, min(origin[0], MAX_SIZE.x - size.x)),
+            max(0, min(origin[1], MAX_SIZE.y - size.y)),
+        )
+        if origin == self.origin:
+            return
+        self.origin = origin
+        self.load()
+
+    def show(self, canvas):
+        """Switches to another canvas, keeping the origin"""
+        self.sync()
+        self.canvas = canvas
+        self.load()
+
+    def load(self):
+        """Fills the shape with the visible tiles"""
+        canvas = self.canvas
+        shape = self.shape
+        set_ = shape._raw_setitem
+        tw, th = canvas.tile_size
+        screen = Rect((0, 0), shape.size)
+        empty = EMPTY_CELL
+        for key in canvas.tiles_in(self.rect):
+            tile_rect = Rect(self.to_screen((key[0] * tw, key[1] * th)), width_height=(tw, th)).intersection(screen)
+            exists = key in canvas.tiles
+            for pos in tile_rect.iter_cells():
+                value = canvas.get(self.to_canvas(pos)) if exists else empty
+                set_(pos, value, force_transparent_ink=True)
+        shape.dirty_set()
+
+    def blit(self, pos, source):
+        """Pastes the shape 'source' at 'pos': parts out of view go straight to the canvas"""
+        left, top = pos
+        # only the visible part is drawn through the shape
+        area = Rect((left, top), width_height=source.size).intersection(self.rect)
+        if area:
+            crop = Rect(area.c1 - (left, top), width_height=area.width_height)
+            self.shape.draw.blit(self.to_screen(area.c1), source[crop] if crop.width_height != source.size else source)
+        canvas = self.canvas
+        get_raw = source.get_raw
+        for y in range(source.height):
+            row = range(source.width)
+            if area and area.top <= top + y < area.bottom:
+                # skip the part of the row already drawn on screen
+                row = [*range(area.left - left), *range(area.right - left, source.width)]
+            for x in row:
+                value = get_raw((x, y))
+                if all(component is TRANSPARENT for component in value):
+                    continue
+                target = left + x, top + y
+                old = canvas.get(target)
+                value = [old_c if new_c is TRANSPARENT else new_c for new_c, old_c in zip(value, old)]
+                self.mark_cell(target)
+                canvas.set(target, value)
+
+    def snapshot(self):
+        """`CellGrid` with the whole drawing - at least the size of the screen"""
+        self.sync()
+        extent = self.canvas.extent
+        size = V2(max(extent.x, self.shape.width), max(extent.y, self.shape.height))
+        return self.canvas.read_region(Rect(size))
+
+    def snapshot_planes(self):
+        """Data planes for the whole drawing - at least the size of the screen"""
+        return self.snapshot().to_planes()
+
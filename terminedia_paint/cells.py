@@ -0,0 +1,114 @@
+"""Compact integer encoding for cell values
+
+A terminedia cell is a (char, foreground, background, effects) sequence
+of Python objects. Here each one is mapped to an unsigned 32 bit integer,
+so that cells can be stored packed in bytes or arrays:
+
+  - char: the codepoint for single-codepoint strings. Anything else
+    (TRANSPARENT, CONTINUATION, grapheme clusters) goes into a string
+    table kept by the codec, and is encoded as its index with the
+    high bit set.
+  - colors: 0xRRGGBB, or SPECIAL_COLOR + index for terminedia's special
+    colors (DEFAULT_FG, DEFAULT_BG, TRANSPARENT, CONTEXT_COLORS)
+  - effects: the Effects flag value, or TRANSPARENT_EFFECTS.
+"""
+
+import struct
+
+import terminedia as TM
+from terminedia.values import CONTEXT_COLORS, CONTINUATION, DEFAULT_BG, DEFAULT_FG, TRANSPARENT
+
+SPECIAL_COLORS = (DEFAULT_FG, DEFAULT_BG, TRANSPARENT, CONTEXT_COLORS)
+# Special colors are matched by name: unpickled ones are not the same instances
+_SPECIAL_INDEX = {color.special: i for i, color in enumerate(SPECIAL_COLORS)}
+SPECIAL_COLOR = 0x01000000
+STRING_FLAG = 0x80000000
+TRANSPARENT_EFFECTS = 0xFFFFFFFF
+
+#: char, foreground, background, effects
+CELL = struct.Struct("<4I")
+
+
+class CellCodec:
+    """Encodes and decodes cell values to and from 4-tuples of integers
+
+    The string table is per instance, and has to be persisted along
+    with encoded data: 'strings' can be passed back to the constructor.
+    """
+
+    def __init__(self, strings=None):
+        self.strings = list(strings) if strings else [TRANSPARENT, CONTINUATION]
+        self._string_index = {self._key(value): i for i, value in enumerate(self.strings)}
+        self._colors = {}
+
+    @staticmethod
+    def _key(char):
+        # TRANSPARENT is a Color, and does not hash or compare as a string
+        return ("TRANSPARENT",) if getattr(char, "special", None) else char
+
+    def encode_char(self, char):
+        if isinstance(char, str) and len(char) == 1:
+            return ord(char)
+        key = self._key(char)
+        index = self._string_index.get(key)
+        if index is None:
+            index = self._string_index[key] = len(self.strings)
+            self.strings.append(char)
+        return STRING_FLAG | index
+
+    def decode_char(self, value):
+        if value & STRING_FLAG:
+            return self.strings[value & ~STRING_FLAG]
+        return chr(value)
+
+    @staticmethod
+    def encode_color(color):
+        special = getattr(color, "special", None)
+        if special:
+            return SPECIAL_COLOR + _SPECIAL_INDEX[special]
+        if not isinstance(color, TM.Color):
+            color = TM.Color(color)
+        red, green, blue = color.components[:3]
+        return (red << 16) | (green << 8) | blue
+
+    def decode_color(self, value):
+        color = self._colors.get(value)
+        if color is None:
+            if value >= SPECIAL_COLOR:
+                color = SPECIAL_COLORS[value - SPECIAL_COLOR]
+            else:
+                color = TM.Color(((value >> 16) & 0xff, (value >> 8) & 0xff, value & 0xff))
+            self._colors[value] = color
+        return color
+
+    @staticmethod
+    def encode_effects(effects):
+        return TRANSPARENT_EFFECTS if effects is TRANSPARENT else int(effects)
+
+    @staticmethod
+    def decode_effects(value):
+        return TRANSPARENT if value == TRANSPARENT_EFFECTS else TM.Effects(value)
+
+    def encode(self, cell):
+        char, fg, bg, effects = cell
+        return (
+            self.encode_char(char),
+            self.encode_color(fg),
+            self.encode_color(bg),
+            self.encode_effects(effects),
+        )
+
+    def decode(self, values):
+        char, fg, bg, effects = values
+        return [
+            self.decode_char(char),
+            self.decode_color(fg),
+            self.decode_color(bg),
+            self.decode_effects(effects),
+        ]
+
+    def pack(self, cell):
+        return CELL.pack(*self.encode(cell))
+
+    def unpack(self, data, offset=0):
+        return self.decode(CELL.unpack_from(data, offset))
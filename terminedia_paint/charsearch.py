@@ -0,0 +1,130 @@
+"""Search for Unicode characters by name
+
+`terminedia.unicode.lookup` runs a regexp over the name of every
+codepoint on each query. Here an inverted index from each word in the
+character names to the characters containing it is built once, and
+stored in the user cache directory, so a search is a few dictionary
+lookups and set intersections.
+
+Every word in the query matches name words starting with it, so results
+can be updated as the user types. Results are ranked: whole word
+matches first, then the symbols most used for drawing, then shorter names.
+"""
+
+import os
+import pickle
+import unicodedata
+from array import array
+from bisect import bisect_left
+from heapq import nsmallest
+from pathlib import Path
+
+# box drawing, block elements, geometric shapes, legacy computing (sextants)
+PREFERRED_RANGES = [(0x2500, 0x25FF), (0x1FB00, 0x1FBFF)]
+
+_index = None
+
+
+def cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "terminedia-paint"
+
+
+def _words(text):
+    return text.replace("-", " ").split()
+
+
+class CharIndex:
+    """Word index over the names of all named Unicode characters"""
+
+    def __init__(self, codes, names, words):
+        self.codes = codes
+        self.names = names
+        self.words = words
+        self.sorted_words = sorted(words)
+
+    @classmethod
+    def build(cls):
+        codes = array("I")
+        names = []
+        words = {}
+        for code in range(0x110000):
+            name = unicodedata.name(chr(code), None)
+            if name is None:
+                continue
+            ordinal = len(names)
+            codes.append(code)
+            names.append(name)
+            for word in set(_words(name)):
+                words.setdefault(word, array("I")).append(ordinal)
+        return cls(codes, names, words)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            return cls(*pickle.load(file))
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as file:
+            pickle.dump((self.codes, self.names, self.words), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _prefixed(self, prefix):
+        """All indexed words starting with 'prefix'"""
+        words = self.sorted_words
+        i = bisect_left(words, prefix)
+        while i < len(words) and words[i].startswith(prefix):
+            yield words[i]
+            i += 1
+
+    def _rank(self, query_words):
+        def key(ordinal):
+            code = self.codes[ordinal]
+            name = self.names[ordinal]
+            name_words = _words(name)
+            partial = sum(1 for word in query_words if word not in name_words)
+            preferred = any(start <= code <= end for start, end in PREFERRED_RANGES)
+            return partial, not preferred, len(name), code
+        return key
+
+    def search(self, query, limit=20, offset=0):
+        """Returns the total number of matches and the (char, name) pairs of
+        the requested page, best ranked first
+        """
+        query_words = _words(query.upper())
+        if not query_words:
+            return 0, []
+        matches = None
+        # longer words first: they usually narrow the search the most
+        for query_word in sorted(query_words, key=len, reverse=True):
+            found = set()
+            for word in self._prefixed(query_word):
+                found.update(self.words[word])
+            matches = found if matches is None else matches & found
+            if not matches:
+                return 0, []
+        page = nsmallest(offset + limit, matches, key=self._rank(query_words))[offset:]
+        return len(matches), [(chr(self.codes[i]), self.names[i]) for i in page]
+
+
+def get_index():
+    """Loads the index from the cache, building it on the first use"""
+    global _index
+    if _index is None:
+        path = cache_dir() / f"charnames-{unicodedata.unidata_version}.pickle"
+        try:
+            _index = CharIndex.load(path)
+        except (OSError, pickle.UnpicklingError, EOFError, TypeError, ValueError):
+            _index = CharIndex.build()
+            try:
+                _index.save(path)
+            except OSError:
+                pass
+    return _index
+
+
+def search(query, limit=20, offset=0):
+    return get_index().search(query, limit, offset)
@@ -0,0 +1,261 @@
+"""Animated images and videos to ANSI animations
+
+Frames are read one at a time: from animated GIF, PNG and WebP files
+through PIL, from a directory of numbered images, or from video files
+through imageio (`pip install imageio[ffmpeg]`), if it is installed.
+Each frame is converted to character cells, as in `imaging`, in a pool
+of worker processes. Only a couple of frames per worker are in flight at
+any time, and just the previous frame is kept for comparison, so memory
+use does not grow with the length of the clip.
+
+Converted frames are written as they come, either as a delta-encoded
+ANSI animation (see `ansi.write_animation`) or as one ANSI file per frame:
+
+    python -m terminedia_paint.clips CLIP -o banner.ans --width 80
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from pathlib import Path
+
+import terminedia as TM
+
+from terminedia_paint import ansi, imaging
+from terminedia_paint.cells import CellCodec
+from terminedia_paint.export import positive_int
+
+IMAGE_SUFFIXES = (".png", ".gif", ".jpg", ".jpeg", ".bmp", ".webp", ".tif", ".tiff")
+VIDEO_SUFFIXES = (".mp4", ".m4v", ".mkv", ".webm", ".mov", ".avi", ".mpg", ".mpeg")
+# frames in flight per worker process
+QUEUE_DEPTH = 2
+
+
+def _natural_key(path):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path.name)]
+
+
+def is_clip(path):
+    """Whether 'path' holds more than one frame"""
+    path = Path(path)
+    if path.is_dir() or path.suffix.lower() in VIDEO_SUFFIXES:
+        return True
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            return getattr(img, "n_frames", 1) > 1
+    except OSError:
+        return False
+
+
+def _video_frames(path):
+    try:
+        import imageio.v3 as iio
+    except ImportError:
+        raise OSError(f"Can't read {path}: reading videos needs imageio (pip install imageio[ffmpeg])")
+    from PIL import Image
+
+    for array in iio.imiter(path):
+        yield Image.fromarray(array).convert("RGB")
+
+
+def _read_frames(path):
+    from PIL import Image, ImageSequence
+
+    path = Path(path)
+    if path.is_dir():
+        size = None
+        for item in sorted((item for item in path.iterdir() if item.suffix.lower() in IMAGE_SUFFIXES), key=_natural_key):
+            with Image.open(item) as img:
+                img = img.convert("RGB")
+            # all frames take the size of the first one
+            size = size or img.size
+            yield img if img.size == size else img.resize(size)
+        return
+    if path.suffix.lower() in VIDEO_SUFFIXES:
+        yield from _video_frames(path)
+        return
+    with Image.open(path) as img:
+        for frame in ImageSequence.Iterator(img):
+            yield frame.convert("RGB")
+
+
+def iter_frames(path, step=1, limit=None):
+    """Frames of the clip at 'path' as RGB PIL images, read as they are requested
+
+    Only every 'step'th frame is kept, and at most 'limit' of them.
+    """
+    if step < 1:
+        raise ValueError(f"step must be 1 or more, not {step}")
+    count = 0
+    for index, frame in enumerate(_read_frames(path)):
+        if index % step:
+            continue
+        yield frame
+        count += 1
+        if limit and count >= limit:
+            return
+
+
+def clip_fps(path, default=10):
+    """Frame rate of an animated image, from the duration of its first frame"""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            duration = img.info.get("duration")
+    except OSError:
+        return default
+    return 1000 / duration if duration else default
+
+
+def _shrink(img, width, resolution):
+    """A smaller copy of 'img', still larger than needed: less data is sent to the workers"""
+    res = imaging.RESOLUTIONS[resolution]
+    height = imaging.size_in_cells(img.size, width)
+    factor = min(img.width // (width * res.block_width), img.height // (height * res.block_height))
+    return img.reduce(factor) if factor >= 2 else img
+
+
+def convert_frame(data, size, width, resolution="square", dither=False, colors="truecolor"):
+    """Rows of (char, foreground, background) cells for the RGB image data,
+    with colors encoded as in `cells.CellCodec` - run in the worker processes
+    """
+    from PIL import Image
+
+    img = Image.frombytes("RGB", size, data)
+    if imaging.np is None:
+        encode = CellCodec.encode_color
+        shape = imaging._fallback_image_to_shape(img, width, resolution, colors)
+        return [tuple((char, encode(fg), encode(bg)) for char, fg, bg, _ in row) for row in ansi.shape_rows(shape)]
+    np = imaging.np
+    chars, fg, bg = imaging.pil_to_cells(img, width, resolution, dither, colors)
+    fg = fg.astype(np.uint32)
+    bg = bg.astype(np.uint32)
+    fg = (fg[..., 0] << 16 | fg[..., 1] << 8 | fg[..., 2]).tolist()
+    bg = (bg[..., 0] << 16 | bg[..., 1] << 8 | bg[..., 2]).tolist()
+    return [tuple(zip(row, fg_row, bg_row)) for row, fg_row, bg_row in zip(chars, fg, bg)]
+
+
+def convert(frames, width, resolution="square", dither=False, colors="truecolor", workers=None):
+    """Converts the PIL images in 'frames' in a process pool, yielding rows of cells in order"""
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for frame in frames:
+            frame = _shrink(frame, width, resolution)
+            pending.append(pool.submit(convert_frame, frame.tobytes(), frame.size, width, resolution, dither, colors))
+            if len(pending) >= workers * QUEUE_DEPTH:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def deltas(frames):
+    """For each frame, the ((x, y), cell) pairs that differ from the previous one - all cells, for the first"""
+    previous = []
+    for frame in frames:
+        changes = []
+        for y, row in enumerate(frame):
+            old = previous[y] if y < len(previous) else ()
+            if row == old:
+                continue
+            changes.extend(((x, y), cell) for x, cell in enumerate(row) if x >= len(old) or cell != old[x])
+        previous = frame
+        yield changes
+
+
+class CellDecoder:
+    """Turns converted cells into terminedia (char, fg, bg, effects) cells"""
+
+    def __init__(self):
+        self.codec = CellCodec()
+        self.effects = TM.Effects.none
+
+    def __call__(self, cell):
+        char, fg, bg = cell
+        return (char, self.codec.decode_color(fg), self.codec.decode_color(bg), self.effects)
+
+
+def write_animation(frames, path, colors="truecolor"):
+    """Writes converted 'frames' as a delta-encoded ANSI animation - returns the frame count"""
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        return 0
+    cell = CellDecoder()
+    count = 1
+
+    def updates():
+        nonlocal count
+        changes = deltas(chain([first], frames))
+        # the first frame is written whole
+        next(changes)
+        for frame_changes in changes:
+            count += 1
+            yield [(pos, cell(value)) for pos, value in frame_changes]
+
+    ansi.write_animation([[cell(value) for value in row] for row in first], updates(), path, colors)
+    return count
+
+
+def write_sequence(frames, path, colors="truecolor"):
+    """Writes each of the converted 'frames' to its own ANSI file, numbered after 'path' - returns the paths"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cell = CellDecoder()
+    paths = []
+    for index, frame in enumerate(frames):
+        target = path.with_name(f"{path.stem}-{index + 1:04d}{path.suffix or '.ans'}")
+        ansi.write(([cell(value) for value in row] for row in frame), target, colors)
+        paths.append(target)
+    return paths
+
+
+def main(argv=None):
+    from terminedia_paint import resolutions
+
+    names = [name for name, _ in resolutions.values()]
+    parser = argparse.ArgumentParser(
+        prog="python -m terminedia_paint.clips",
+        description="Convert animated images, image sequences and videos to ANSI animations"
+    )
+    parser.add_argument("source", help="Animated image, video, or directory of frames")
+    parser.add_argument("-o", "--output", required=True, help="ANSI file to write")
+    parser.add_argument("--width", type=positive_int, default=80, help="Width in characters (default: %(default)s)")
+    parser.add_argument("--resolution", choices=names, default="square", help="Characters used (default: %(default)s)")
+    parser.add_argument("--dither", action="store_true", help="Ordered dithering")
+    parser.add_argument("--colors", choices=ansi.COLOR_MODES, default="truecolor", help="(default: %(default)s)")
+    parser.add_argument("--step", type=positive_int, default=1, help="Keep every STEP-th frame")
+    parser.add_argument("--limit", type=positive_int, default=None, help="Stop after LIMIT frames")
+    parser.add_argument("-j", "--jobs", type=positive_int, default=None, help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--sequence", action="store_true", help="Write one ANSI file per frame, instead of an animation")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    frames = convert(
+        iter_frames(args.source, args.step, args.limit), args.width, args.resolution, args.dither, args.colors, args.jobs
+    )
+    try:
+        if args.sequence:
+            count = len(write_sequence(frames, args.output, args.colors))
+        else:
+            count = write_animation(frames, args.output, args.colors)
+    except OSError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    print(f"{count} frames in {elapsed:.2f}s ({count / elapsed:.1f} frames/s)")
+    if not args.sequence:
+        fps = clip_fps(args.source) / args.step
+        print(f"play with: python -m terminedia_paint.animation {args.output} --fps {fps:g}")
+
+
+if __name__ == "__main__":
+    main()
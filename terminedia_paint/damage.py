@@ -0,0 +1,168 @@
+"""Cell-exact damage tracking for the painter screen.
+
+Terminedia marks changed pixels in 8x8 tiles, so a single point set
+with the mouse repaints up to 64 cells. This module records the exact
+cells touched by every drawing operation - any set on the shape, which
+covers lines, flood fills and blits - and renders only those, plus the
+rectangles terminedia itself registers for moving sprites - and the
+areas sprites move away from, which it does not.
+
+Right after the terminal is cleared there is nothing to repaint but what
+was drawn since: the first frame skips the blank screen.
+"""
+
+import sys
+from collections import deque
+from io import StringIO
+
+from terminedia.terminal import UnblockTTY
+from terminedia.utils import Rect
+from terminedia.values import EMPTY
+
+
+def cells_to_rects(cells):
+    """Coalesces a set of (x, y) cells into one rectangle per horizontal run"""
+    rects = []
+    start = last = None
+    for x, y in sorted(cells, key=lambda cell: (cell[1], cell[0])):
+        if last is not None and y == last[1] and x == last[0] + 1:
+            last = (x, y)
+            continue
+        if start is not None:
+            rects.append(Rect(start, (last[0] + 1, last[1] + 1)))
+        start = last = (x, y)
+    if start is not None:
+        rects.append(Rect(start, (last[0] + 1, last[1] + 1)))
+    return rects
+
+
+class DamageTracker:
+    """Hooks into a Screen so that each frame outputs only the damaged cells
+
+    Keeps per-frame counters of cells and bytes sent to the terminal:
+    'last_cells' and 'last_bytes' refer to the most recent frame that
+    produced any output, 'history' holds the last 'history_size' frames.
+    """
+
+    def __init__(self, screen, history_size=100):
+        self.screen = screen
+        self.cells = set()
+        self.rects = []
+        self.frames = 0
+        self.last_cells = self.last_bytes = 0
+        self.total_cells = self.total_bytes = 0
+        self.history = deque(maxlen=history_size)
+        self._sprite_rects = {}
+        # True while the terminal is known to show only empty cells
+        self.blank = False
+        self._fast_render = screen.commands.fast_render
+        self._clear = screen.clear
+        # Instance attributes shadow the methods: terminedia's own
+        # tile-based marking is replaced by exact cell marking.
+        screen.shape.dirty_mark_pixel = self.mark
+        screen.commands.fast_render = self.render
+        screen.clear = self.clear
+
+    def clear(self, wet_run=True):
+        """Replaces Screen.clear: cells cleared are not marked one by one
+
+        Nothing else hooked to the shape sees them either: clearing the
+        screen is not a drawing change. If all cells are empty already,
+        only the terminal is cleared.
+        """
+        screen = self.screen
+        if wet_run and self.is_empty():
+            screen.commands.clear()
+            screen.commands.cursor_hide()
+            screen.shape.dirty_set()
+            self.blank = True
+            return
+        shape = screen.shape
+        mark = shape.dirty_mark_pixel
+        shape.dirty_mark_pixel = lambda pos: None
+        try:
+            self._clear(wet_run)
+        finally:
+            shape.dirty_mark_pixel = mark
+        self.blank = wet_run
+
+    def is_empty(self):
+        """Whether every cell is as a clear would leave it - checking is far faster than filling"""
+        shape = self.screen.shape
+        context = shape.context
+        empty = [EMPTY, context.color, context.background, context.effects]
+        get_raw = shape.get_raw
+        return all(get_raw((x, y)) == empty for y in range(shape.height) for x in range(shape.width))
+
+    def mark(self, pos):
+        self.cells.add((pos[0], pos[1]))
+
+    def add_rect(self, rect):
+        """Marks a whole area as damaged - for changes made bypassing the shape"""
+        self.rects.append(Rect(rect))
+
+    def _vacated_rects(self, data):
+        """Where sprites were on the last frame, if they moved or changed size since"""
+        rects = []
+        current = {}
+        for sprite in data.sprites:
+            rect = Rect(sprite.rect) if sprite.active else None
+            current[id(sprite)] = rect
+            previous = self._sprite_rects.get(id(sprite))
+            if previous is not None and previous != rect:
+                rects.append(previous)
+        self._sprite_rects = current
+        return rects
+
+    def pending_rects(self):
+        rects = cells_to_rects(self.cells) + self.rects
+        self.cells = set()
+        self.rects = []
+        return rects
+
+    def render(self, data, rects=None, file=None):
+        if rects is None:
+            rects = [Rect((0, 0), data.size)]
+        area = Rect((0, 0), data.size)
+        cells = set()
+        clipped = set()
+        blank, self.blank = self.blank, False
+        for rect in list(rects) + self.pending_rects() + self._vacated_rects(data):
+            rect = Rect(rect).intersection(area)
+            if not rect or blank and rect == area:
+                # the full repaint requested by the clear itself
+                continue
+            # terminedia sorts the rects, so they are passed on as tuples
+            clipped.add(rect.as_tuple)
+            cells.update(rect.iter_cells())
+        self.frames += 1
+        if not clipped:
+            self.history.append((0, 0))
+            return
+        rects = clipped
+        buffer = StringIO()
+        self._fast_render(data, rects, buffer)
+        output = buffer.getvalue()
+        if file is None:
+            with UnblockTTY():
+                sys.stdout.write(output)
+                sys.stdout.flush()
+        else:
+            file.write(output)
+            file.flush()
+        self.last_cells = len(cells)
+        self.last_bytes = len(output.encode("utf-8"))
+        self.total_cells += self.last_cells
+        self.total_bytes += self.last_bytes
+        self.history.append((self.last_cells, self.last_bytes))
+
+    @property
+    def summary(self):
+        if not self.history:
+            return "no frames"
+        cells = sum(item[0] for item in self.history) / len(self.history)
+        bytes_ = sum(item[1] for item in self.history) / len(self.history)
+        return (
+            f"last frame: {self.last_cells} cells/{self.last_bytes} bytes - "
+            f"avg {cells:.0f} cells/{bytes_:.0f} bytes over {len(self.history)} frames"
+        )
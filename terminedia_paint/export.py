@@ -0,0 +1,209 @@
+"""Non-interactive conversion of saved artwork into other file formats.
+
+Used by `terminedia-paint --export`, so that large batches of ".snapshot"
+files can be turned into ANSI or HTML without starting the interactive app.
+ANSI files are written by the compact encoder in `ansi`.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import terminedia as TM
+from terminedia.values import EMPTY
+
+from terminedia_paint import ansi, ansiparse, tilefile
+
+
+SUFFIXES = {
+    "ANSI": ".ans",
+    "HTML": ".html",
+    "SNAPSHOT": ".snapshot",
+    "TPAINT": tilefile.SUFFIX,
+}
+
+
+def backend_for_path(path):
+    """Picks the rendering backend from a file suffix - ANSI is the fallback"""
+    backend = Path(path).suffix.strip(".").upper()
+    if backend not in ("HTML", "SNAPSHOT", "TPAINT"):
+        backend = "ANSI"
+    return backend
+
+
+def render_shape(shape, path, backend=None, colors="truecolor"):
+    """Writes 'shape' to 'path' exactly as the interactive "save" does
+
+    'colors' is the color mode for ANSI files: one of `ansi.COLOR_MODES`.
+    """
+    path = Path(path)
+    if backend is None:
+        backend = backend_for_path(path)
+    if backend == "TPAINT":
+        tilefile.save_shape(shape, path)
+        return
+    if backend == "ANSI":
+        ansi.write_shape(shape, path, colors)
+        return
+    shape.render(output=path, backend=backend)
+
+
+def snapshot_planes(shape):
+    """Cheap copy of the raw cell data of 'shape', as FullShape data planes
+
+    Sprites and transformers are not applied, so there is no need to switch
+    them off. The result is picklable, and can be handed to another
+    process to be encoded with 'save_snapshot'.
+    """
+    data = shape.data
+    width, height = shape.size
+    context = shape.context
+    default = (EMPTY, context.color, context.background, context.effects)
+    chars = []
+    fg = []
+    bg = []
+    effects = []
+    for y in range(height):
+        row = []
+        for x in range(width):
+            value = data.get((x, y), default)
+            row.append(value[0])
+            fg.append(value[1])
+            bg.append(value[2])
+            effects.append(value[3])
+        chars.append(row)
+    return [chars, fg, bg, effects]
+
+
+def save_snapshot(planes, path, backend=None, colors="truecolor"):
+    """Renders data from 'snapshot_planes' into 'path'
+
+    Yields a file identical to blitting the live shape into a new one
+    and calling 'render_shape' on it, which is what a blocking save does.
+    """
+    if backend is None:
+        backend = backend_for_path(path)
+    if backend == "ANSI":
+        # the encoder reads the planes directly - no need to build a shape
+        ansi.write_planes(planes, path, colors)
+        return
+    source = TM.image.FullShape(planes)
+    img = TM.shape(source.size)
+    img.draw.blit((0, 0), source)
+    render_shape(img, path, backend)
+
+
+def save_grid(grid, path, backend=None, colors="truecolor"):
+    """'save_snapshot' for a `canvas.CellGrid`: cells are only decoded here"""
+    save_snapshot(grid.to_planes(), path, backend, colors)
+
+
+def save_layer_grids(grids, settings, path, backend=None, colors="truecolor"):
+    """'save_grid' for the layers of a drawing: they are composited here, in the worker"""
+    from terminedia_paint.layers import flatten_grids
+
+    save_grid(flatten_grids(grids, settings), path, backend, colors)
+
+
+def load_shape(path):
+    if tilefile.is_tile_file(path):
+        return tilefile.load_shape(path)
+    if ansiparse.is_ansi_file(path):
+        return ansiparse.load_shape(path)
+    shape = TM.shape(Path(path))
+    if not isinstance(shape, TM.image.FullShape):
+        shape = TM.image.FullShape.promote(shape)
+    return shape
+
+
+def target_path(source, backend, output_dir=None):
+    source = Path(source)
+    target = source.with_suffix(SUFFIXES[backend])
+    if output_dir is not None:
+        target = Path(output_dir) / target.name
+    return target
+
+
+def export_file(source, backend, output_dir=None, colors="truecolor"):
+    """Converts a single file. Returns (source, target, error)
+
+    Errors are returned rather than raised, so that a broken file
+    does not abort a batch running in a process pool.
+    """
+    target = target_path(source, backend, output_dir)
+    if target.resolve() == Path(source).resolve():
+        return source, target, "target would overwrite source"
+    try:
+        render_shape(load_shape(source), target, backend, colors)
+    except Exception as error:
+        return source, target, f"{error.__class__.__name__}: {error}"
+    return source, target, None
+
+
+def _export_file_star(args):
+    return export_file(*args)
+
+
+def batch_export(sources, backend, output_dir=None, workers=None, colors="truecolor"):
+    """Converts all 'sources' to 'backend', fanning out over a process pool.
+
+    Yields the (source, target, error) tuples as they are completed.
+    """
+    backend = backend.upper()
+    if backend not in SUFFIXES:
+        raise ValueError(f"Unknown export format {backend!r}")
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    jobs = [(source, backend, output_dir, colors) for source in sources]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+    if workers == 1:
+        yield from map(_export_file_star, jobs)
+        return
+    chunksize = max(1, len(jobs) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_export_file_star, jobs, chunksize=chunksize)
+
+
+def positive_int(text):
+    """argparse type for counts and sizes: 1 or more"""
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"expected a whole number, 1 or more: {text!r}")
+    return value
+
+
+def main(sources, to="ansi", output_dir=None, workers=None, file=None, colors="truecolor"):
+    """Runs a batch export, reporting failures and throughput to 'file'
+
+    Returns the number of files that could not be converted.
+    """
+    if file is None:
+        file = sys.stderr
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(sources) or 1))
+    start = time.perf_counter()
+    done = failed = 0
+    for source, target, error in batch_export(sources, to, output_dir, workers, colors):
+        if error:
+            failed += 1
+            print(f"{source}: {error}", file=file)
+        else:
+            done += 1
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed else 0.0
+    print(
+        f"Exported {done} file(s) to {to.upper()} in {elapsed:.2f}s "
+        f"({rate:.1f} files/s, {rate / workers:.1f} files/s per worker, "
+        f"{workers} worker(s)); {failed} failed",
+        file=file
+    )
+    return failed
@@ -0,0 +1,172 @@
+"""Incremental scanline flood fill
+
+Terminedia's `Drawing.floodfill` collects every fillable position in a
+set, checking the 4 neighbours of each one, before painting anything.
+With the sub-cell resolutions that means millions of get/set calls in a
+single, uninterruptible, call.
+
+Here the fill walks horizontal runs of pixels: each run is filled
+at once, and only the rows immediately above and below it are scanned
+for new runs. Work is done in slices, so the caller can spread a big fill
+across several frames and cancel it mid-way.
+"""
+
+import time
+from contextlib import nullcontext
+
+from terminedia.utils import Rect
+
+
+class SpanFill:
+    """Scanline flood fill over a `Drawing`-like object
+
+    Args:
+      - drawable: the shape, one of its sub-cell views (`shape.braille`,
+        `shape.high`...), or a `subcells.BitPlane`, to be filled with its
+        draw context values
+      - pos: seed position
+      - threshold (Optional[Callable]): same meaning as in terminedia's
+        `Drawing.floodfill`: takes the seed value, the target value and
+        position, and returns True for boundary pixels.
+      - max_pending (int): soft limit for pending seeds - when it is
+        exceeded, seeds next to each other, in the same run, are merged.
+
+    Call `step` repeatedly until it returns True, or just `run()`.
+    """
+
+    def __init__(self, drawable, pos, threshold=None, max_pending=1024):
+        self.drawable = drawable
+        self.draw = draw = drawable.draw
+        self.size = draw.size
+        self.rect = Rect(self.size)
+        self.threshold = threshold or (lambda seed, target, pos: seed != target)
+        self.max_pending = max_pending
+        self.filled = 0
+        self.elapsed = 0.0
+        self.done = False
+        self.cancelled = False
+        self.pending = []
+        # cells filled whole, see below
+        self.cells = None
+        # bit planes (see `subcells`) set whole runs at once, and write
+        # the changed cells to the shape once per step
+        self.set_span = getattr(drawable, "set_span", None)
+        self.batch = drawable if self.set_span else nullcontext()
+        if self.set_span:
+            self.get = drawable.get
+        pos = int(pos[0]), int(pos[1])
+        if pos not in self.rect:
+            self.done = True
+            return
+        self.seed = self.get(pos)
+        if self.seed is None and self.set_span:
+            # a cell showing some other character, like text: as with terminedia's
+            # floodfill, it is filled whole, along with any such cells next to it
+            self.cells = drawable.other_cells(pos)
+            return
+        # (x, y, dy, first and last x of the run on row y - dy that queued it)
+        self.pending.append((pos[0], pos[1], 0, 0, -1))
+
+    def get(self, pos):
+        value = self.draw.get(pos)
+        # raw shape values are mutable lists, changed in place as the fill goes
+        return tuple(value) if isinstance(value, list) else value
+
+    def fillable(self, x, y):
+        return not self.threshold(self.seed, self.get((x, y)), (x, y))
+
+    def fill_run(self, x1, x2, y):
+        self.filled += x2 - x1 + 1
+        if self.set_span:
+            self.set_span(x1, x2, y)
+            return
+        # full cells, or the 1/2 block view: there each half of a cell has
+        # its own color, so dots are set one by one through terminedia
+        set_ = self.draw.set
+        for x in range(x1, x2 + 1):
+            set_((x, y))
+
+    def _expand(self, x, y):
+        """Finds the extent of the fillable run containing (x, y)"""
+        width = self.size[0]
+        x1 = x
+        while x1 > 0 and self.fillable(x1 - 1, y):
+            x1 -= 1
+        x2 = x
+        while x2 < width - 1 and self.fillable(x2 + 1, y):
+            x2 += 1
+        return x1, x2
+
+    def _scan(self, x1, x2, y, dy, parent):
+        """Queues the runs on row 'y' touching the x1..x2 interval - 'parent' is the run scanning it"""
+        if not 0 <= y < self.size[1]:
+            return
+        x = x1
+        while x <= x2:
+            if self.fillable(x, y):
+                self.pending.append((x, y, dy) + parent)
+                # skip to the end of this run: it will be expanded when popped
+                while x <= x2 and self.fillable(x, y):
+                    x += 1
+            x += 1
+
+    def _compact(self):
+        """Drops seeds next to another one: they are in the same run"""
+        merged = {}
+        for x, y, dy, px1, px2 in self.pending:
+            merged.setdefault((y, dy), []).append((x, px1, px2))
+        self.pending = []
+        for (y, dy), seeds in merged.items():
+            seeds.sort()
+            last = None
+            for x, px1, px2 in seeds:
+                # the parent run of any of them is filled: skipping it when rescanning is safe
+                if last is None or x > last + 1:
+                    self.pending.append((x, y, dy, px1, px2))
+                last = x
+
+    def step(self, time_budget=0.01):
+        """Fills for up to 'time_budget' seconds. Returns True when finished"""
+        start = time.perf_counter()
+        with self.batch:
+            self._fill_slice(start, time_budget)
+        self.elapsed += time.perf_counter() - start
+        self.done = not self.pending or self.cancelled
+        return self.done
+
+    def _fill_slice(self, start, time_budget):
+        if self.cells:
+            self.filled += self.drawable.fill_cells(self.cells)
+            self.cells = None
+        while self.pending and not self.cancelled:
+            x, y, dy, px1, px2 = self.pending.pop()
+            if not self.fillable(x, y):
+                # already filled through another span
+                continue
+            x1, x2 = self._expand(x, y)
+            self.fill_run(x1, x2, y)
+            if self.fillable(x1, y):
+                # Filling does not change the pixel value: nothing to do.
+                self.filled -= x2 - x1 + 1
+                self.pending.clear()
+                break
+            run = (x1, x2)
+            if dy >= 0:
+                self._scan(x1, x2, y + 1, 1, run)
+            if dy <= 0:
+                self._scan(x1, x2, y - 1, -1, run)
+            # the row we came from needs checking only beyond the parent run
+            if dy:
+                self._scan(x1, min(x2, px1 - 1), y - dy, -dy, run)
+                self._scan(max(x1, px2 + 1), x2, y - dy, -dy, run)
+            if len(self.pending) > self.max_pending:
+                self._compact()
+            if time_budget is not None and time.perf_counter() - start > time_budget:
+                break
+
+    def run(self):
+        self.step(time_budget=None)
+        return self.filled
+
+    def cancel(self):
+        self.cancelled = True
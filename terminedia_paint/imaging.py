@@ -0,0 +1,160 @@
+"""Conversion of pixel images into character-cell shapes.
+
+Each character cell covers a small grid of image pixels - 1x1 for full
+blocks, 1x2 for half blocks, 2x2 for quadrants, 2x3 for sextants and 2x4
+for braille dots. For every cell the pixels are split by luminance in
+two groups: the average colour of the bright group becomes the foreground,
+the dark one the background, and the bit pattern of the bright pixels
+selects the character through the tables terminedia uses for
+sub-cell drawing.
+
+The whole image is processed with NumPy array operations. If NumPy is
+not installed, conversion falls back to terminedia's own per-pixel code.
+
+Colors can be reduced to the 256 or 16 color terminal palettes, with the
+lookup tables in `palette`, applied to the foreground and background
+arrays once the cells are worked out.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+import terminedia as TM
+from terminedia.subpixels import BlockChars, BrailleChars, HalfChars, SextantChars
+from terminedia.values import EMPTY, FULL_BLOCK
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from terminedia_paint.palette import quantize_array, quantize_shape
+
+CACHE_SIZE = 16
+
+Resolution = namedtuple("Resolution", "block_width block_height chars bits")
+
+
+def _braille_bit(x, y):
+    return 2 ** (y + 3 * x) if y < 3 else 2 ** (6 + x)
+
+
+def _bits(width, height, bit):
+    return [[bit(x, y) for x in range(width)] for y in range(height)]
+
+
+RESOLUTIONS = {
+    "block": Resolution(1, 1, {0: EMPTY, 1: FULL_BLOCK}, [[1]]),
+    "square": Resolution(1, 2, HalfChars.chars_in_order, _bits(1, 2, lambda x, y: 1 << y)),
+    "high": Resolution(2, 2, BlockChars.chars_in_order, _bits(2, 2, lambda x, y: 1 << (x + 2 * y))),
+    "sextant": Resolution(2, 3, SextantChars.chars_in_order, _bits(2, 3, lambda x, y: 1 << (x + 2 * y))),
+    "braille": Resolution(2, 4, BrailleChars.chars_in_order, _bits(2, 4, _braille_bit)),
+}
+
+# 4x4 ordered-dithering (Bayer) threshold map
+BAYER_4 = [
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+]
+
+
+def size_in_cells(image_size, width):
+    """Height, in character cells, for an image pasted 'width' cells wide
+
+    Terminal cells are about twice as tall as they are wide.
+    """
+    img_width, img_height = image_size
+    return max(1, round(width * img_height / img_width / 2))
+
+
+def image_to_shape(path, width, resolution="square", dither=False, colors="truecolor"):
+    """Loads the image at 'path' as a FullShape 'width' cells wide
+
+    'colors' is one of `ansi.COLOR_MODES`. Results are cached by path,
+    modification time and all the other arguments, so pasting the same
+    file again is instantaneous.
+    """
+    path = Path(path).resolve()
+    return _cached_image_to_shape(str(path), path.stat().st_mtime, width, resolution, bool(dither), colors)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _cached_image_to_shape(path, mtime, width, resolution, dither, colors):
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+        if np is None:
+            return _fallback_image_to_shape(img, width, resolution, colors)
+        return pil_to_shape(img, width, resolution, dither, colors)
+
+
+def _fallback_image_to_shape(img, width, resolution, colors="truecolor"):
+    res = RESOLUTIONS[resolution]
+    height = size_in_cells(img.size, width)
+    size = width * res.block_width, height * res.block_height
+    shape = TM.shape(img.resize(size), promote=True, resolution=resolution if resolution != "block" else None)
+    return quantize_shape(shape, colors)
+
+
+def pil_to_shape(img, width, resolution="square", dither=False, colors="truecolor"):
+    """Converts a PIL image into a FullShape 'width' cells wide"""
+    chars, fg, bg = pil_to_cells(img, width, resolution, dither, colors)
+    height = len(chars)
+    fg = [TM.Color(tuple(color)) for color in fg.reshape(-1, 3).tolist()]
+    bg = [TM.Color(tuple(color)) for color in bg.reshape(-1, 3).tolist()]
+    effects = [TM.Effects.none] * (width * height)
+    return TM.image.FullShape([chars, fg, bg, effects])
+
+
+def pil_to_cells(img, width, resolution="square", dither=False, colors="truecolor"):
+    """Vectorized conversion of a PIL image to character cells
+
+    Returns a list of rows of characters, and two (rows, width, 3) uint8
+    arrays with foreground and background colours, quantized to the
+    'colors' palette.
+    """
+    res = RESOLUTIONS[resolution]
+    bw, bh = res.block_width, res.block_height
+    height = size_in_cells(img.size, width)
+    img = img.convert("RGB").resize((width * bw, height * bh))
+
+    pixels = np.asarray(img, dtype=np.float32)
+    # (rows, cell_y, cols, cell_x, rgb) -> (rows, cols, sub_pixels, rgb)
+    cells = pixels.reshape(height, bh, width, bw, 3).transpose(0, 2, 1, 3, 4).reshape(height, width, bh * bw, 3)
+    luma = cells @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    threshold = luma.mean(axis=2, keepdims=True)
+    if dither:
+        bayer = (np.array(BAYER_4, dtype=np.float32) + 0.5) / 16 - 0.5
+        # threshold offset for each sub-pixel, following its position in the whole image
+        ys = (np.arange(height)[:, None, None, None] * bh + np.arange(bh)[None, None, :, None]) % 4
+        xs = (np.arange(width)[None, :, None, None] * bw + np.arange(bw)[None, None, None, :]) % 4
+        offsets = bayer[ys, xs].reshape(height, width, bh * bw)
+        spread = luma.max(axis=2, keepdims=True) - luma.min(axis=2, keepdims=True)
+        threshold = threshold + offsets * spread
+    lit = luma > threshold
+    # Cells with a single flat colour have no pixel above the average: make them solid
+    lit[~lit.any(axis=2)] = True
+
+    lit_count = lit.sum(axis=2, keepdims=True)
+    dark_count = bh * bw - lit_count
+    fg = (cells * lit[..., None]).sum(axis=2) / lit_count
+    bg = (cells * ~lit[..., None]).sum(axis=2) / np.maximum(dark_count, 1)
+    bg = np.where(dark_count > 0, bg, fg)
+
+    weights = np.array(res.bits, dtype=np.int32).reshape(bh * bw)
+    masks = (lit * weights).sum(axis=2)
+    table = np.array([res.chars[i] for i in range(len(res.chars))], dtype=object)
+    chars = table[masks].tolist()
+
+    fg = np.rint(fg).astype(np.uint8)
+    bg = np.rint(bg).astype(np.uint8)
+    return chars, quantize_array(fg, colors), quantize_array(bg, colors)
+
+
+def cache_clear():
+    _cached_image_to_shape.cache_clear()
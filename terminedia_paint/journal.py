@@ -0,0 +1,216 @@
+"""Undo journal owned by the painter
+
+Terminedia's own undo keeps a full dict of Pixel lists for each undo
+step, and each individual set outside an undo group is one more step.
+Here only the cells changed by each tool action are kept, packed as
+(x, y, old cell, new cell) records of 36 bytes, and the whole journal is
+capped to a maximum size in bytes, dropping the oldest actions first.
+
+Changes are captured from the shape itself: any set on it is recorded,
+so tools need no special code. Actions are delimited explicitly with
+'begin'/'end' (e.g. a whole mouse stroke); changes made outside those
+are grouped per frame.
+
+If a `canvas.Viewport` is given, positions are recorded in canvas
+coordinates, so undo keeps working after scrolling.
+
+'log', if set, is called with the records of each committed action, and
+of each undo and redo, as they are applied (see `autosave`).
+
+Animation frames and layers swap what the canvas holds: each keeps its
+own history, put in place with 'swap_history' when it is shown. The
+size cap counts all of them, but only the history in place is trimmed.
+Each of them also has a 'target' id, telling `autosave` what the records
+logged are for: 0 is the canvas the painter starts with.
+"""
+
+import struct
+from collections import deque
+from contextlib import contextmanager
+
+from terminedia.utils import V2
+
+from terminedia_paint.cells import CellCodec
+
+DEFAULT_MAX_BYTES = 32 * 2 ** 20
+
+#: x, y, old cell, new cell
+RECORD = struct.Struct("<2H4I4I")
+
+
+class UndoJournal:
+    def __init__(self, shape, max_bytes=DEFAULT_MAX_BYTES, viewport=None):
+        self.shape = shape
+        self.viewport = viewport
+        self.max_bytes = max_bytes
+        self.codec = CellCodec()
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.size = 0
+        # bytes in the histories swapped out
+        self.parked = 0
+        self.current = None
+        self.depth = 0
+        self.replaying = False
+        self.log = None
+        self.target = 0
+        self._last_target = 0
+        self._mark = shape.dirty_mark_pixel
+        shape.dirty_mark_pixel = self.mark
+        if viewport:
+            self._mark_cell = viewport.mark_cell
+            viewport.mark_cell = self.mark_cell
+
+    def _get(self, pos):
+        if self.viewport:
+            return self.viewport.get(pos)
+        return tuple(self.shape.get_raw(pos))
+
+    def _set(self, pos, value):
+        if self.viewport:
+            self.viewport.set(pos, value)
+            return
+        # marks the cell for redrawing - the journal itself ignores it
+        self.shape.dirty_mark_pixel(pos)
+        self.shape._raw_setitem(pos, value, force_transparent_ink=True)
+
+    def _record(self, x, y):
+        if self.current is None:
+            self.current = {}
+        # double width characters also change the cell to the right
+        for key in ((x, y), (x + 1, y)):
+            if self.viewport is None and key not in self.shape.rect or key[0] > 0xffff:
+                continue
+            if key not in self.current:
+                self.current[key] = self._get(key)
+
+    def mark(self, pos):
+        """Called by the shape before any cell is changed"""
+        if not self.replaying and pos in self.shape.rect:
+            key = self.viewport.to_canvas(pos) if self.viewport else pos
+            self._record(int(key[0]), int(key[1]))
+        self._mark(pos)
+
+    def mark_cell(self, pos):
+        """Called by the viewport before a cell out of view is changed"""
+        if not self.replaying:
+            self._record(int(pos[0]), int(pos[1]))
+        self._mark_cell(pos)
+
+    def begin(self):
+        """Starts an action: all changes until the matching 'end' are undone at once"""
+        if not self.depth:
+            self.commit()
+            self.current = {}
+        self.depth += 1
+
+    def end(self):
+        self.depth = max(0, self.depth - 1)
+        if not self.depth:
+            self.commit()
+
+    def tick(self, event=None):
+        """Closes changes made outside of explicit actions - call once per frame"""
+        if not self.depth:
+            self.commit()
+
+    def commit(self):
+        group, self.current = self.current, None
+        if not group:
+            return
+        encode = self.codec.encode
+        data = bytearray()
+        for pos, old in group.items():
+            new = self._get(pos)
+            if new == old:
+                continue
+            data += RECORD.pack(*pos, *encode(old), *encode(new))
+        if not data:
+            return
+        data = bytes(data)
+        if self.log:
+            self.log(data)
+        for record in self.redo_stack:
+            self.size -= len(record)
+        self.redo_stack.clear()
+        self.undo_stack.append(data)
+        self.size += len(data)
+        while self.size + self.parked > self.max_bytes and len(self.undo_stack) > 1:
+            self.size -= len(self.undo_stack.popleft())
+
+    def _apply(self, record, undo=True):
+        decode = self.codec.decode
+        self.replaying = True
+        try:
+            for fields in RECORD.iter_unpack(record):
+                pos = V2(fields[0], fields[1])
+                self._set(pos, decode(fields[2:6] if undo else fields[6:10]))
+        finally:
+            self.replaying = False
+        if self.log:
+            self.log(record, undo)
+
+    def undo(self):
+        self.commit()
+        if not self.undo_stack:
+            return False
+        record = self.undo_stack.pop()
+        self._apply(record, undo=True)
+        self.redo_stack.append(record)
+        return True
+
+    def redo(self):
+        self.commit()
+        if not self.redo_stack:
+            return False
+        record = self.redo_stack.pop()
+        self._apply(record, undo=False)
+        self.undo_stack.append(record)
+        return True
+
+    @contextmanager
+    def suspended(self):
+        """Changes made inside are not recorded - for contents swapped in, not drawn"""
+        self.commit()
+        replaying, self.replaying = self.replaying, True
+        try:
+            yield
+        finally:
+            self.replaying = replaying
+
+    def new_target(self):
+        """An id for a new frame or layer"""
+        self._last_target += 1
+        return self._last_target
+
+    def swap_history(self, history, target):
+        """Takes out the undo and redo history, and puts 'history' in its place
+
+        'history' is a value returned by an earlier call, or None for an
+        empty one, and 'target' the id of the frame or layer shown. Changes
+        not committed yet go with the history taken out.
+        """
+        self.commit()
+        taken = (self.undo_stack, self.redo_stack, self.size)
+        self.parked += self.size
+        if history is None:
+            history = (deque(), [], 0)
+        self.undo_stack, self.redo_stack, self.size = history
+        self.parked -= self.size
+        self.target = target
+        return taken
+
+    def drop_history(self, history):
+        """Forgets a history swapped out, when what it belongs to is deleted"""
+        if history is not None:
+            self.parked -= history[2]
+
+    def clear(self):
+        """Drops all undo and redo history"""
+        self.current = None
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.size = 0
+
+    def __len__(self):
+        return len(self.undo_stack)
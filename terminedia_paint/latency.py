@@ -0,0 +1,146 @@
+"""Input to screen latency tracing
+
+When enabled, every input event is followed from the moment terminedia
+creates it, through the painter handler and drawing operations, to the
+end of the first frame written to the terminal after it was handled -
+the closest we can get to it being on screen.
+
+Everything is written, as it happens, to a file in the Chrome trace
+event format (a JSON array): it can be opened in chrome://tracing or
+https://ui.perfetto.dev. Each input shows up as an async "latency" span,
+with the handler, stroke drawing and frame rendering as nested spans.
+
+Latencies and frame render times of the last events are also kept, for
+the percentiles shown in the on-screen stats.
+"""
+
+import json
+import os
+import time
+from collections import deque
+from functools import wraps
+
+ENV_VAR = "TERMINEDIA_PAINT_TRACE"
+
+PID = os.getpid()
+INPUT_TID = 1
+FRAME_TID = 2
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[int(fraction * (len(ordered) - 1))]
+
+
+class LatencyTracer:
+    """Writes trace events to 'path' and hooks the frame rendering of 'screen'
+
+    Handlers are instrumented with 'wrap_handler' and 'wrap_operation'.
+    """
+
+    def __init__(self, path, screen, history_size=500):
+        self.path = path
+        self.file = open(path, "wt")
+        self.file.write("[\n")
+        self._first = True
+        self._next_id = 0
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        # (id, name, start timestamp) for inputs not yet on screen
+        self.pending = []
+        self.latencies = deque(maxlen=history_size)
+        self.frame_times = deque(maxlen=history_size)
+        self._render = screen.commands.fast_render
+        screen.commands.fast_render = self.render
+        self.emit(name="process_name", ph="M", pid=PID, args={"name": "terminedia-paint"})
+
+    def now(self):
+        """Microseconds since the tracer was created"""
+        return (time.perf_counter() - self.start) * 1e6
+
+    def wall_to_trace(self, timestamp):
+        return (timestamp - self.wall_start) * 1e6
+
+    def emit(self, **event):
+        if self.file.closed:
+            return
+        event.setdefault("pid", PID)
+        self.file.write(("" if self._first else ",\n") + json.dumps(event))
+        self._first = False
+
+    def wrap_handler(self, name, handler):
+        """Instruments an input event handler"""
+        @wraps(handler)
+        def wrapper(event):
+            start = self.now()
+            # the event was created when the input was read, before it was queued
+            created = min(start, self.wall_to_trace(getattr(event, "timestamp", self.wall_start)))
+            try:
+                return handler(event)
+            finally:
+                end = self.now()
+                event_id = self._next_id
+                self._next_id += 1
+                self.pending.append((event_id, name, created))
+                self.emit(name=name, cat="handler", ph="X", ts=start, dur=end - start, tid=INPUT_TID,
+                          args={"queued_ms": round((start - created) / 1000, 3)})
+        return wrapper
+
+    def wrap_operation(self, name, operation, active=None):
+        """Instruments a drawing operation - if 'active' is given, only calls where it returns True are traced"""
+        @wraps(operation)
+        def wrapper(*args, **kwargs):
+            if active is not None and not active():
+                return operation(*args, **kwargs)
+            start = self.now()
+            try:
+                return operation(*args, **kwargs)
+            finally:
+                self.emit(name=name, cat="operation", ph="X", ts=start, dur=self.now() - start, tid=INPUT_TID)
+        return wrapper
+
+    def render(self, data, rects=None, file=None):
+        start = self.now()
+        self._render(data, rects, file)
+        end = self.now()
+        self.frame_times.append((end - start) / 1000)
+        if not self.pending:
+            return
+        self.emit(name="frame", cat="frame", ph="X", ts=start, dur=end - start, tid=FRAME_TID,
+                  args={"inputs": len(self.pending)})
+        for event_id, name, created in self.pending:
+            self.latencies.append((end - created) / 1000)
+            self.emit(name=name, cat="latency", ph="b", id=event_id, ts=created, tid=INPUT_TID)
+            self.emit(name=name, cat="latency", ph="e", id=event_id, ts=end, tid=INPUT_TID)
+        self.pending = []
+        # the trace stays usable if the app is killed: the closing bracket is optional
+        self.file.flush()
+
+    @property
+    def summary(self):
+        latencies = list(self.latencies)
+        frames = list(self.frame_times)
+        return (
+            f"latency p50 {percentile(latencies, .5):.1f}ms p99 {percentile(latencies, .99):.1f}ms - "
+            f"frame p50 {percentile(frames, .5):.1f}ms p99 {percentile(frames, .99):.1f}ms"
+        )
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write("\n]\n")
+            self.file.close()
+
+
+def instrument(painter, path):
+    """Creates a tracer for 'painter', wrapping its event handlers
+
+    Has to be called before the handlers are subscribed to events.
+    """
+    tracer = LatencyTracer(path, painter.sc)
+    for name in ("key_dispatcher", "mouse_click", "mouse_move", "mouse_release"):
+        setattr(painter, name, tracer.wrap_handler(name, getattr(painter, name)))
+    # strokes are drawn once per frame, from the positions collected by 'mouse_move'
+    painter.flush_stroke = tracer.wrap_operation("flush_stroke", painter.flush_stroke, active=lambda: bool(painter.strokes))
+    return tracer
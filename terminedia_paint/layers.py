@@ -0,0 +1,343 @@
+"""Layers: canvases stacked over one another
+
+Each `Layer` has its own `Canvas`, and its own undo history. The active
+layer is the canvas behind the viewport, so tools, undo and scrolling
+work on it as they would without layers. The other ones are put together with it on screen by a
+transformer, as each cell is rendered.
+
+What lies under the active layer is cached already composited, and the
+cells of the layers over it are cached per position, both a tile at a
+time: a frame only composites the cells rendered on it, whatever the
+number of layers. Changing a layer only invalidates the tiles where it
+has something drawn.
+
+Layers are composited cell by cell, on encoded cells (`cells.CellCodec`):
+
+  - cells with a blank character on the default background, or on the
+    layer transparency key color, show what is below
+  - on other cells with the default or key background, the character
+    is drawn over the background below
+  - characters in the key color are not shown
+  - opacity blends the colors of a layer with those below
+"""
+
+from array import array
+
+import terminedia as TM
+from terminedia.utils import Rect
+from terminedia.values import DEFAULT_BG, EMPTY, TRANSPARENT
+
+from terminedia_paint.canvas import EMPTY_CELL, Canvas, CellGrid
+from terminedia_paint.cells import SPECIAL_COLOR, CellCodec
+
+_codec = CellCodec()
+EMPTY_ENCODED = _codec.encode(EMPTY_CELL)
+BLANK_CHARS = frozenset((ord(EMPTY), _codec.encode_char(TRANSPARENT)))
+SEE_THROUGH = frozenset((_codec.encode_color(DEFAULT_BG), _codec.encode_color(TRANSPARENT)))
+SPACE = ord(" ")
+del _codec
+
+
+def mix(bottom, top, opacity):
+    """Encoded color 'top' over 'bottom' at 'opacity' - special colors can't be blended, the closest wins"""
+    if opacity >= 1 or bottom == top:
+        return top
+    if bottom >= SPECIAL_COLOR or top >= SPECIAL_COLOR:
+        return top if opacity >= 0.5 else bottom
+    result = 0
+    for shift in (16, 8, 0):
+        low = (bottom >> shift) & 0xff
+        result |= int(low + (((top >> shift) & 0xff) - low) * opacity + 0.5) << shift
+    return result
+
+
+def compose(top, bottom, opacity=1.0, key=None):
+    """Encoded cell 'top', of a layer with 'opacity' and transparency 'key', over the encoded cell 'bottom'"""
+    if opacity <= 0:
+        return bottom
+    char, fg, bg, effects = top
+    blank = char in BLANK_CHARS or fg == key
+    if bg in SEE_THROUGH or bg == key:
+        if blank:
+            return bottom
+        bg = bottom[2]
+    elif opacity < 1:
+        bg = mix(bottom[2], bg, opacity)
+    elif blank:
+        return SPACE, fg, bg, effects
+    if blank:
+        # a translucent background: the character below shows through, tinted
+        return bottom[0], mix(bottom[1], top[2], opacity), bg, bottom[3]
+    return char, mix(bg, fg, opacity), bg, effects
+
+
+def flatten_grids(grids, settings):
+    """A `CellGrid` with 'grids', bottom first, composited
+
+    Grids have the same size and codec. 'settings' are (visible, opacity,
+    key) for each one. This only takes plain data, so it can run in
+    another process.
+    """
+    result = CellGrid(grids[0].size, grids[0].codec, EMPTY_ENCODED)
+    planes = result.planes
+    for grid, (visible, opacity, key) in zip(grids, settings):
+        if not visible:
+            continue
+        chars, fg, bg, effects = grid.planes
+        for index in range(len(chars)):
+            cell = chars[index], fg[index], bg[index], effects[index]
+            if cell == EMPTY_ENCODED:
+                continue
+            below = tuple(plane[index] for plane in planes)
+            for plane, value in zip(planes, compose(cell, below, opacity, key)):
+                plane[index] = value
+    return result
+
+
+class Layer:
+    """A canvas and how it is composited: 'key' is an encoded color, or None"""
+
+    def __init__(self, name, canvas, visible=True, opacity=1.0, key=None):
+        self.name = name
+        self.canvas = canvas
+        self.visible = visible
+        self.opacity = opacity
+        self.key = key
+        # undo history, while another layer is active, and autosave id (see `journal.UndoJournal`)
+        self.history = None
+        self.id = None
+
+    @property
+    def settings(self):
+        return self.visible, self.opacity, self.key
+
+    @property
+    def plain(self):
+        """Whether the layer shows its cells as they are"""
+        return self.settings == (True, 1.0, None)
+
+
+class Compositor(TM.Transformer):
+    """Shows the composited layers on the screen shape"""
+
+    def __init__(self, stack):
+        self.stack = stack
+        super().__init__()
+
+    def pixel(self, pixel, pos):
+        return self.stack.composite(pixel, pos)
+
+
+class LayerStack:
+    """The layers of a drawing, bottom first, over the canvas behind 'viewport'"""
+
+    def __init__(self, viewport, journal=None, damage=None):
+        self.viewport = viewport
+        self.journal = journal
+        self.damage = damage
+        self.codec = viewport.canvas.codec
+        self.layers = [Layer("layer 1", viewport.canvas)]
+        if journal is not None:
+            self.layers[0].id = journal.target
+        self.index = 0
+        self.created = 1
+        # {tile key: composited cells under the active layer, or None if all empty}
+        self._below = {}
+        # {tile key: {cell offset: ((cell, opacity, key), ...) for the layers over the active one}}
+        self._above = {}
+        self._decoded = {}
+        self.compositor = None
+
+    def __len__(self):
+        return len(self.layers)
+
+    @property
+    def active(self):
+        return self.layers[self.index]
+
+    @property
+    def plain(self):
+        """True if the stack looks just like its only layer"""
+        return len(self.layers) == 1 and self.active.plain
+
+    def decode(self, encoded):
+        value = self._decoded.get(encoded)
+        if value is None:
+            value = self._decoded[encoded] = tuple(self.codec.decode(encoded))
+        return value
+
+    def _tile_below(self, key):
+        if key in self._below:
+            return self._below[key]
+        tile = None
+        for layer in self.layers[:self.index]:
+            source = layer.canvas.tiles.get(key)
+            if not layer.visible or source is None:
+                continue
+            if tile is None:
+                tile = array("I", self.layers[0].canvas._empty_tile)
+            opacity, color_key = layer.opacity, layer.key
+            for offset in range(0, len(source), 4):
+                cell = tuple(source[offset: offset + 4])
+                if cell != EMPTY_ENCODED:
+                    tile[offset: offset + 4] = array("I", compose(cell, tuple(tile[offset: offset + 4]), opacity, color_key))
+        self._below[key] = tile
+        return tile
+
+    def _tile_above(self, key):
+        cells = self._above.get(key)
+        if cells is not None:
+            return cells
+        cells = self._above[key] = {}
+        for layer in self.layers[self.index + 1:]:
+            source = layer.canvas.tiles.get(key)
+            if not layer.visible or source is None:
+                continue
+            for offset in range(0, len(source), 4):
+                cell = tuple(source[offset: offset + 4])
+                if cell != EMPTY_ENCODED:
+                    cells[offset] = cells.get(offset, ()) + ((cell, layer.opacity, layer.key),)
+        return cells
+
+    def composite(self, pixel, pos):
+        """What the screen shows at 'pos' (screen coordinates), where the active layer has 'pixel'"""
+        origin = self.viewport.origin
+        key, offset = self.active.canvas._locate((pos[0] + origin.x, pos[1] + origin.y))
+        below = self._tile_below(key)
+        above = self._tile_above(key).get(offset)
+        layer = self.active
+        if below is None and above is None and layer.plain:
+            return pixel
+        result = tuple(below[offset: offset + 4]) if below is not None else EMPTY_ENCODED
+        if layer.visible:
+            result = compose(self.codec.encode(pixel), result, layer.opacity, layer.key)
+        for cell, opacity, color_key in above or ():
+            result = compose(cell, result, opacity, color_key)
+        return self.decode(result)
+
+    def _update_compositor(self):
+        transformers = self.viewport.shape.context.transformers
+        if self.plain:
+            if self.compositor is not None:
+                transformers.remove(self.compositor)
+                self.compositor = None
+        elif self.compositor is None:
+            self.compositor = Compositor(self)
+            transformers.append(self.compositor)
+
+    def invalidate(self, keys=None):
+        """Drops the cached tiles 'keys' - all if None - and redraws them"""
+        if keys is None:
+            keys = set(self._below) | set(self._above)
+            self._below.clear()
+            self._above.clear()
+        else:
+            for key in keys:
+                self._below.pop(key, None)
+                self._above.pop(key, None)
+        self._update_compositor()
+        self._redraw(keys)
+
+    def _redraw(self, keys):
+        """Marks the visible part of tiles 'keys' for rendering"""
+        if self.damage is None:
+            return
+        viewport = self.viewport
+        tile_size = self.active.canvas.tile_size
+        for key in keys:
+            rect = Rect((key[0] * tile_size.x, key[1] * tile_size.y), width_height=tile_size).intersection(viewport.rect)
+            if rect:
+                self.damage.add_rect(Rect(viewport.to_screen(rect.c1), width_height=rect.width_height))
+
+    def _drawn_tiles(self, *layers):
+        self.viewport.sync()
+        return {key for layer in layers for key in layer.canvas.tiles}
+
+    def select(self, index):
+        """Makes layer 'index' the active one, with its undo history"""
+        target = self.layers[index]
+        journal = self.journal
+        if journal is not None and target is not self.active:
+            if target.id is None:
+                target.id = journal.new_target()
+            self.active.history = journal.swap_history(target.history, target.id)
+            target.history = None
+        self.index = index
+        self._below.clear()
+        self._above.clear()
+        self._update_compositor()
+        # reloads the whole screen
+        self.viewport.show(self.active.canvas)
+
+    def add(self, layer=None):
+        """Inserts 'layer', or a new empty one, over the active layer, and makes it active"""
+        if layer is None:
+            self.created += 1
+            layer = Layer(f"layer {self.created}", Canvas(self.active.canvas.tile_size, self.codec))
+        self.layers.insert(self.index + 1, layer)
+        self.select(self.index + 1)
+        return layer
+
+    def remove(self):
+        """Deletes the active layer, and its undo history, moving to the one below it"""
+        if len(self.layers) == 1:
+            return False
+        layer = self.active
+        self.select(self.index - 1 if self.index else 1)
+        shown = self.active
+        self.layers.remove(layer)
+        self.index = self.layers.index(shown)
+        if self.journal is not None:
+            self.journal.drop_history(layer.history)
+            layer.history = None
+        # nothing was rendered since selecting: no cached tile has the removed layer
+        self._update_compositor()
+        return True
+
+    def move(self, delta):
+        """Moves the active layer 'delta' places up the stack"""
+        target = self.index + delta
+        if not 0 <= target < len(self.layers):
+            return False
+        layers = self.layers
+        keys = self._drawn_tiles(layers[self.index], layers[target])
+        layers[self.index], layers[target] = layers[target], layers[self.index]
+        self.index = target
+        self.invalidate(keys)
+        return True
+
+    def configure(self, visible=None, opacity=None, key=()):
+        """Changes how the active layer is shown - key=None removes the transparency key"""
+        layer = self.active
+        if visible is not None:
+            layer.visible = visible
+        if opacity is not None:
+            layer.opacity = max(0.0, min(1.0, opacity))
+        if key != ():
+            layer.key = key
+        # the active layer is composited as it is rendered: there is no cache to drop
+        self._update_compositor()
+        self._redraw(self._drawn_tiles(layer))
+
+    def size(self):
+        """Size of the area with every drawn cell of every layer - at least the screen"""
+        self.viewport.sync()
+        width, height = self.viewport.shape.size
+        for layer in self.layers:
+            extent = layer.canvas.extent
+            width, height = max(width, extent.x), max(height, extent.y)
+        return width, height
+
+    def snapshot(self):
+        """([`CellGrid` for each layer], [settings for each layer]): arguments for `flatten_grids`"""
+        rect = Rect(self.size())
+        return [layer.canvas.read_region(rect) for layer in self.layers], [layer.settings for layer in self.layers]
+
+    def file_data(self):
+        """(layer settings, copy of the canvas tiles) for each layer, as `tilefile.save_layers` takes them"""
+        self.viewport.sync()
+        return [
+            ({"name": layer.name, "visible": layer.visible, "opacity": layer.opacity, "key": layer.key},
+             {key: tile[:] for key, tile in layer.canvas.tiles.items()})
+            for layer in self.layers
+        ]
@@ -0,0 +1,220 @@
+"""Color quantization to the xterm 256 and 16 color palettes
+
+Finding the nearest palette color means comparing against all 240 (or
+16) of them. Instead, RGB space is split in a grid of 32x32x32 boxes,
+and the nearest palette index for the center of each box is computed
+once, into a 32768 entries lookup table: quantizing a color is then a
+matter of shifting its components into a table index. The error this
+adds is at most 4 units per component, far less than the distance
+between palette colors. Colors already in the palette are always kept,
+even where two of them fall in the same box.
+
+With NumPy, tables are built and applied on whole arrays at once -
+image conversions and the tiles of a canvas. Without it the same tables
+are used one color at a time.
+
+Palette indexes 0 to 15 of the 256 color palette are left out of it:
+terminals let users change those, so they are not known colors.
+"""
+
+from functools import lru_cache
+
+import terminedia as TM
+
+from terminedia_paint.cells import SPECIAL_COLOR
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+#: bits kept from each color component to index the tables
+LUT_BITS = 5
+LUT_SHIFT = 8 - LUT_BITS
+
+# xterm defaults for the 16 basic colors
+BASIC_COLORS = [
+    (0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0), (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+    (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0), (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+]
+CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+
+
+def xterm_color(index):
+    """RGB values for an index in the xterm 256 color palette"""
+    if index < 16:
+        return BASIC_COLORS[index]
+    if index < 232:
+        index -= 16
+        return CUBE_LEVELS[index // 36], CUBE_LEVELS[index // 6 % 6], CUBE_LEVELS[index % 6]
+    grey = 8 + (index - 232) * 10
+    return grey, grey, grey
+
+
+PALETTES = {
+    "256": [xterm_color(index) for index in range(256)],
+    "16": BASIC_COLORS,
+}
+# indexes each color mode can pick from
+CANDIDATES = {
+    "256": range(16, 256),
+    "16": range(16),
+}
+
+
+def _distance(color1, color2):
+    return sum((c1 - c2) ** 2 for c1, c2 in zip(color1, color2))
+
+
+def _nearest_256(rgb):
+    # the cube is nearest per component, the grey ramp by the average
+    levels = [min(range(6), key=lambda i: abs(CUBE_LEVELS[i] - value)) for value in rgb]
+    cube = tuple(CUBE_LEVELS[level] for level in levels)
+    grey_index = max(0, min(23, round((sum(rgb) / 3 - 8) / 10)))
+    if _distance(rgb, (8 + grey_index * 10,) * 3) < _distance(rgb, cube):
+        return 232 + grey_index
+    return 16 + levels[0] * 36 + levels[1] * 6 + levels[2]
+
+
+def _box_centers():
+    half = 1 << (LUT_SHIFT - 1)
+    levels = [(level << LUT_SHIFT) + half for level in range(1 << LUT_BITS)]
+    return [(red, green, blue) for red in levels for green in levels for blue in levels]
+
+
+@lru_cache(maxsize=None)
+def lookup_table(mode):
+    """Nearest palette index for each grid box, as a flat uint8 array (or bytes, without NumPy)"""
+    palette = PALETTES[mode]
+    candidates = CANDIDATES[mode]
+    centers = _box_centers()
+    if np is None:
+        if mode == "256":
+            return bytes(_nearest_256(center) for center in centers)
+        return bytes(min(candidates, key=lambda index: _distance(center, palette[index])) for center in centers)
+    centers = np.array(centers, dtype=np.float64)
+    colors = np.array([palette[index] for index in candidates], dtype=np.float64)
+    # squared distances, less the |center|² term that is the same for all colors
+    distances = (colors ** 2).sum(axis=1) - 2 * centers @ colors.T
+    return np.asarray(candidates, dtype=np.uint8)[distances.argmin(axis=1)]
+
+
+def _table_index(red, green, blue):
+    return (red >> LUT_SHIFT) << (2 * LUT_BITS) | (green >> LUT_SHIFT) << LUT_BITS | blue >> LUT_SHIFT
+
+
+@lru_cache(maxsize=None)
+def _exact(mode):
+    # palette colors close to each other may share a box: these are kept as they are
+    return {PALETTES[mode][index]: index for index in CANDIDATES[mode]}
+
+
+def nearest(rgb, mode):
+    """Palette index for an (r, g, b) color"""
+    rgb = tuple(rgb[:3])
+    index = _exact(mode).get(rgb)
+    if index is None:
+        index = int(lookup_table(mode)[_table_index(*rgb)])
+    return index
+
+
+@lru_cache(maxsize=4096)
+def _quantized_color(rgb, mode):
+    return TM.Color(PALETTES[mode][nearest(rgb, mode)])
+
+
+def quantize_color(color, mode):
+    """'color' replaced by the nearest one in the palette - special colors are kept
+
+    "truecolor" keeps every color as it is.
+    """
+    if mode == "truecolor" or getattr(color, "special", None):
+        return color
+    if not isinstance(color, TM.Color):
+        color = TM.Color(color)
+    return _quantized_color(tuple(color.components[:3]), mode)
+
+
+def quantize_shape(shape, mode):
+    """Quantizes the colors of all cells in 'shape', in place"""
+    if mode == "truecolor":
+        return shape
+    for pos in shape.rect.iter_cells():
+        char, fg, bg, effects = shape.get_raw(pos)
+        shape._raw_setitem(pos, (char, quantize_color(fg, mode), quantize_color(bg, mode), effects), force_transparent_ink=True)
+    return shape
+
+
+def _quantize_packed(value, mode):
+    """Quantizes a color encoded as in `cells.CellCodec`"""
+    if value >= SPECIAL_COLOR:
+        return value
+    red, green, blue = PALETTES[mode][nearest((value >> 16, (value >> 8) & 0xff, value & 0xff), mode)]
+    return (red << 16) | (green << 8) | blue
+
+
+@lru_cache(maxsize=None)
+def _packed_palette(mode):
+    """Palette colors encoded as 0xRRGGBB, and those in the mode candidates"""
+    palette = np.array(PALETTES[mode], dtype=np.uint32)
+    packed = palette[:, 0] << 16 | palette[:, 1] << 8 | palette[:, 2]
+    return packed, packed[list(CANDIDATES[mode])]
+
+
+def _quantize_packed_array(values, mode):
+    packed, candidates = _packed_palette(mode)
+    mask = (1 << LUT_BITS) - 1
+    index = (
+        ((values >> (16 + LUT_SHIFT)) & mask) << (2 * LUT_BITS) |
+        ((values >> (8 + LUT_SHIFT)) & mask) << LUT_BITS |
+        (values >> LUT_SHIFT) & mask
+    )
+    keep = (values >= SPECIAL_COLOR) | np.isin(values, candidates)
+    return np.where(keep, values, packed[lookup_table(mode)[index]])
+
+
+def quantize_array(rgb, mode):
+    """Vectorized 'quantize_color': 'rgb' is an (..., 3) uint8 array"""
+    if mode == "truecolor":
+        return rgb
+    rgb = np.asarray(rgb, dtype=np.uint32)
+    values = _quantize_packed_array(rgb[..., 0] << 16 | rgb[..., 1] << 8 | rgb[..., 2], mode)
+    return np.stack([values >> 16, (values >> 8) & 0xff, values & 0xff], axis=-1).astype(np.uint8)
+
+
+def quantize_canvas(canvas, mode):
+    """{pos: encoded cell} for the cells of 'canvas' whose colors change when quantized
+
+    The canvas itself is left untouched, so changes can go through the undo journal.
+    """
+    changes = {}
+    if mode == "truecolor" or not canvas.tiles:
+        return changes
+    tw, th = canvas.tile_size
+    keys = list(canvas.tiles)
+    if np is None:
+        quantized = {}
+        for key in keys:
+            tile = canvas.tiles[key]
+            for offset in range(0, len(tile), 4):
+                cell = tile[offset: offset + 4]
+                colors = []
+                for value in cell[1:3]:
+                    if value not in quantized:
+                        quantized[value] = _quantize_packed(value, mode)
+                    colors.append(quantized[value])
+                if colors != list(cell[1:3]):
+                    y, x = divmod(offset // 4, tw)
+                    changes[key[0] * tw + x, key[1] * th + y] = (cell[0], *colors, cell[3])
+        return changes
+    # all tiles as a single (tiles, cells, 4) array
+    cells = np.frombuffer(b"".join(canvas.tiles[key].tobytes() for key in keys), dtype=np.uint32).reshape(len(keys), tw * th, 4)
+    colors = _quantize_packed_array(cells[..., 1:3], mode)
+    tile_indexes, cell_indexes = np.nonzero((colors != cells[..., 1:3]).any(axis=2))
+    for tile_index, cell_index in zip(tile_indexes.tolist(), cell_indexes.tolist()):
+        key = keys[tile_index]
+        y, x = divmod(cell_index, tw)
+        cell = cells[tile_index, cell_index].tolist()
+        fg, bg = colors[tile_index, cell_index].tolist()
+        changes[key[0] * tw + x, key[1] * th + y] = (cell[0], fg, bg, cell[3])
+    return changes
@@ -0,0 +1,89 @@
+"""Mouse drag coalescing
+
+Terminals can send mouse move events much faster than the screen is
+updated. Drag positions are collected as they arrive, and once per frame
+they are turned into a single polyline: consecutive repeated positions
+are dropped, and the points shared by adjacent segments are drawn only once.
+"""
+
+from collections import deque
+
+
+def line_points(pos1, pos2):
+    """Points of a straight line, following terminedia's `Drawing.line`"""
+    x1, y1 = pos1
+    x2, y2 = pos2
+    points = [(x1, y1)]
+    max_manh = max(abs(x2 - x1), abs(y2 - y1))
+    if max_manh == 0:
+        return points
+    step_x = (x2 - x1) / max_manh
+    step_y = (y2 - y1) / max_manh
+    x, y = x1, y1
+    for _ in range(max_manh):
+        x += step_x
+        y += step_y
+        points.append((int(x), int(y)))
+    return points
+
+
+def polyline_points(points, start=None):
+    """All points of the polyline through 'points', each listed once
+
+    If 'start' is given, the line begins there, but 'start' itself
+    is not included: it is the end of an already drawn stroke.
+    """
+    result = []
+    seen = set()
+    previous = start
+    if start is not None:
+        seen.add(tuple(start))
+    for point in points:
+        point = tuple(point)
+        segment = [point] if previous is None else line_points(previous, point)
+        for segment_point in segment:
+            if segment_point not in seen:
+                seen.add(segment_point)
+                result.append(segment_point)
+        previous = point
+    return result
+
+
+class StrokeBuffer:
+    """Collects drag positions between frames
+
+    'history' keeps how many raw events went into each of the last
+    'history_size' drawing operations.
+    """
+
+    def __init__(self, history_size=100):
+        self.pending = []
+        self.first_tick = self.last_tick = None
+        self.history = deque(maxlen=history_size)
+
+    def add(self, pos, tick):
+        if not self.pending:
+            self.first_tick = tick
+        self.last_tick = tick
+        self.pending.append(pos)
+
+    def take(self):
+        """Returns the collected positions, with consecutive repetitions removed"""
+        points = []
+        for pos in self.pending:
+            if not points or points[-1] != pos:
+                points.append(pos)
+        if self.pending:
+            self.history.append(len(self.pending))
+        self.pending = []
+        return points
+
+    def __bool__(self):
+        return bool(self.pending)
+
+    @property
+    def summary(self):
+        if not self.history:
+            return "no strokes"
+        average = sum(self.history) / len(self.history)
+        return f"events/stroke op: last {self.history[-1]}, avg {average:.1f}, max {max(self.history)}"
@@ -0,0 +1,249 @@
+"""Sub-cell drawing on a bit plane
+
+Terminedia's sub-cell views (`shape.high`, `shape.sextant`,
+`shape.braille`) set each dot by reading the character in its cell,
+finding which dots it shows, changing one bit and writing a new
+character back: the whole shape setitem machinery runs once per dot.
+
+A `BitPlane` keeps the dots of every screen cell as a bitmask, all in one
+bytearray, read from the characters only the first time a cell is
+touched. Tools set and reset bits in it, and the cells changed are
+turned back into characters through a mask -> character table, once per
+drawing operation: a line, the points of a stroke in a frame, a slice of
+a flood fill. Anything else writing to the shape marks the cells it
+changes as unknown, so nothing has to be kept in sync by hand.
+
+The 1/2 block resolution stays with terminedia: there each half of a
+cell takes its own color, so a cell is not just a bitmask.
+"""
+
+from terminedia.drawing import Drawing
+from terminedia.subpixels import BlockChars, BrailleChars, SextantChars
+from terminedia.utils import V2
+
+# cell states
+UNKNOWN, GRAPHICS, OTHER = 0, 1, 2
+
+
+def _braille_bit(x, y):
+    return 1 << (y + 3 * x) if y < 3 else 1 << (6 + x)
+
+
+#: name: (block class, block width, block height, bit for each dot)
+LAYOUTS = {
+    "high": (BlockChars, 2, 2, lambda x, y: 1 << (x + 2 * y)),
+    "sextant": (SextantChars, 2, 3, lambda x, y: 1 << (x + 2 * y)),
+    "braille": (BrailleChars, 2, 4, _braille_bit),
+}
+
+
+class BitPlane:
+    """Dots of 'shape' at the 'resolution' named in LAYOUTS
+
+    Works as a drop-in for terminedia's sub-cell views: 'draw' has the
+    same drawing methods, and `get` returns None for cells showing some
+    other character. Use the plane as a context manager to group several
+    operations into a single write to the shape.
+    """
+
+    def __init__(self, shape, resolution):
+        self.shape = shape
+        self.context = shape.context
+        self.block_class, self.block_width, self.block_height, bit = LAYOUTS[resolution]
+        bw, bh = self.block_width, self.block_height
+        self.bits = [bit(x, y) for y in range(bh) for x in range(bw)]
+        # all dots in each row of a cell
+        self.row_bits = [sum(bit(x, y) for x in range(bw)) for y in range(bh)]
+        chars = self.block_class.chars_in_order
+        self.chars = [chars[mask] for mask in range(len(chars))]
+        self.orders = self.block_class.chars_to_order
+        self.depth = 0
+        self.flushing = False
+        self._allocate()
+        self._mark = shape.dirty_mark_pixel
+        shape.dirty_mark_pixel = self.mark
+        self._dirty_set = shape.dirty_set
+        shape.dirty_set = self.dirty_set
+        self.draw = PlaneDrawing(self)
+
+    def _allocate(self):
+        self.width, self.height = self.shape.size
+        self.masks = bytearray(self.width * self.height)
+        self.states = bytearray(self.width * self.height)
+        self.dirty = set()
+
+    def get_size(self):
+        return V2(self.width * self.block_width, self.height * self.block_height)
+
+    size = property(get_size)
+
+    def mark(self, pos):
+        """Called by the shape before any cell is changed"""
+        if not self.flushing:
+            x, y = pos
+            if 0 <= x < self.width and 0 <= y < self.height:
+                index = y * self.width + x
+                self.states[index] = UNKNOWN
+                # double width characters also change the cell to the right
+                if x + 1 < self.width:
+                    self.states[index + 1] = UNKNOWN
+        self._mark(pos)
+
+    def dirty_set(self, rect=None):
+        """Called when the whole shape may have changed"""
+        if V2(self.width, self.height) != self.shape.size:
+            self._allocate()
+        else:
+            self.states = bytearray(len(self.states))
+        self._dirty_set(rect)
+
+    def _locate(self, pos):
+        """Cell index and bit for a dot - None if it is off the shape"""
+        cell_x, sub_x = divmod(int(pos[0]), self.block_width)
+        cell_y, sub_y = divmod(int(pos[1]), self.block_height)
+        if not (0 <= cell_x < self.width and 0 <= cell_y < self.height):
+            return None, 0
+        index = cell_y * self.width + cell_x
+        if not self.states[index]:
+            self._load(index)
+        return index, self.bits[sub_y * self.block_width + sub_x]
+
+    def _load(self, index):
+        cell_y, cell_x = divmod(index, self.width)
+        char = self.shape.get_raw((cell_x, cell_y))[0]
+        mask = self.orders.get(char) if isinstance(char, str) else None
+        self.masks[index] = mask or 0
+        self.states[index] = OTHER if mask is None else GRAPHICS
+
+    def get(self, pos):
+        """True or False for the dot at 'pos', None if its cell is not a block character"""
+        index, bit = self._locate(pos)
+        if index is None:
+            return False
+        if self.states[index] == OTHER:
+            return None
+        return bool(self.masks[index] & bit)
+
+    def set(self, pos):
+        index, bit = self._locate(pos)
+        if index is None:
+            return
+        self.masks[index] |= bit
+        self.dirty.add(index)
+        if not self.depth:
+            self.flush()
+
+    def reset(self, pos):
+        index, bit = self._locate(pos)
+        if index is None:
+            return
+        self.masks[index] &= ~bit
+        self.dirty.add(index)
+        if not self.depth:
+            self.flush()
+
+    def set_span(self, x1, x2, y, erase=False):
+        """Sets (or resets) the dots from x1 to x2, inclusive, on row 'y'"""
+        bw = self.block_width
+        cell_y, sub_y = divmod(y, self.block_height)
+        if not 0 <= cell_y < self.height:
+            return
+        row = self.bits[sub_y * bw: sub_y * bw + bw]
+        full = self.row_bits[sub_y]
+        masks, states, dirty = self.masks, self.states, self.dirty
+        first, last = max(0, x1 // bw), min(self.width - 1, x2 // bw)
+        for cell_x in range(first, last + 1):
+            index = cell_y * self.width + cell_x
+            if not states[index]:
+                self._load(index)
+            left = cell_x * bw
+            if x1 <= left and left + bw - 1 <= x2:
+                bits = full
+            else:
+                bits = sum(row[sub_x] for sub_x in range(max(x1, left) - left, min(x2, left + bw - 1) - left + 1))
+            masks[index] = masks[index] & ~bits if erase else masks[index] | bits
+            dirty.add(index)
+        if not self.depth:
+            self.flush()
+
+    def other_cells(self, pos):
+        """Indexes of the cells showing some other character connected to the one with the dot at 'pos'"""
+        index, _ = self._locate(pos)
+        if index is None or self.states[index] != OTHER:
+            return set()
+        width, height, states = self.width, self.height, self.states
+        region = {index}
+        pending = [index]
+        while pending:
+            cell_y, cell_x = divmod(pending.pop(), width)
+            for x, y in ((cell_x - 1, cell_y), (cell_x + 1, cell_y), (cell_x, cell_y - 1), (cell_x, cell_y + 1)):
+                if not (0 <= x < width and 0 <= y < height):
+                    continue
+                index = y * width + x
+                if index in region:
+                    continue
+                if not states[index]:
+                    self._load(index)
+                if states[index] == OTHER:
+                    region.add(index)
+                    pending.append(index)
+        return region
+
+    def fill_cells(self, indexes):
+        """Sets all dots of the cells at 'indexes' - returns how many were set"""
+        full = sum(self.bits)
+        count = 0
+        for index in indexes:
+            count += bin(full & ~self.masks[index]).count("1")
+            self.masks[index] = full
+            self.dirty.add(index)
+        if not self.depth:
+            self.flush()
+        return count
+
+    def flush(self):
+        """Writes the characters for all changed cells to the shape"""
+        if not self.dirty:
+            return
+        shape = self.shape
+        width, masks, states, chars = self.width, self.masks, self.states, self.chars
+        self.flushing = True
+        try:
+            for index in sorted(self.dirty):
+                cell_y, cell_x = divmod(index, width)
+                shape[cell_x, cell_y] = chars[masks[index]]
+                states[index] = GRAPHICS
+        finally:
+            self.flushing = False
+            self.dirty = set()
+
+    def __enter__(self):
+        self.depth += 1
+        return self
+
+    def __exit__(self, *args):
+        self.depth -= 1
+        if not self.depth:
+            self.flush()
+
+
+class PlaneDrawing(Drawing):
+    """terminedia `Drawing` over a `BitPlane`: each call writes to the shape once, when done"""
+
+    def __init__(self, plane):
+        super().__init__(plane.set, plane.reset, plane.get, plane.get_size, plane.context)
+        self.plane = plane
+
+
+def _batched(method):
+    def wrapper(self, *args, **kwargs):
+        with self.plane:
+            return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+for _name in ("line", "rect", "fill", "floodfill", "ellipse", "bezier", "blit"):
+    setattr(PlaneDrawing, _name, _batched(getattr(Drawing, _name)))
+del _name
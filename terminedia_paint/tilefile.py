@@ -0,0 +1,455 @@
+"""Native binary file format, for drawings of any size
+
+Files with the ".tpaint" suffix hold the canvas tiles directly: the
+cells of each tile are stored as runs of indexes into a palette with
+all distinct cells in the drawing. Tiles are written one at a time as
+they are encoded, followed by the palette, the character table and a
+directory of tile offsets.
+
+Reading maps the file into memory and parses only the header, palette
+and directory: tiles are decoded when they are requested.
+
+Layout (all integers little-endian):
+  header | tile data ... | palette | character table | directory
+
+  - palette: 4 uint32 per entry - the `cells.CellCodec` encoding
+  - character table: JSON list with the codec strings (null for TRANSPARENT)
+  - directory: tile x, tile y (uint16), offset (uint64), length (uint32)
+  - tile data: LEB128 varint pairs: run length, palette index
+
+Drawings with layers are written as version 2: the character table is a
+JSON object, {"strings": [...], "layers": [{"name", "visible", "opacity",
+"key"}, ...]}, bottom layer first, with "key" as "#rrggbb" or null, and
+directory entries start with the layer index (uint16). Read as an image,
+they give the layers composited.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+import terminedia as TM
+from terminedia.utils import V2
+from terminedia.values import TRANSPARENT
+
+from terminedia_paint.canvas import EMPTY_CELL, Canvas
+from terminedia_paint.cells import CellCodec
+from terminedia_paint.layers import EMPTY_ENCODED, compose
+
+SUFFIX = ".tpaint"
+MAGIC = b"TPNT"
+VERSION = 1
+LAYERS_VERSION = 2
+
+#: magic, version, tile width, tile height, width, height,
+#: palette offset, palette entries, table offset, table size, directory offset, directory entries
+HEADER = struct.Struct("<4sHHHIIQIQIQI")
+PALETTE_ENTRY = struct.Struct("<4I")
+DIRECTORY_ENTRY = struct.Struct("<HHQI")
+LAYER_DIRECTORY_ENTRY = struct.Struct("<HHHQI")
+
+
+class FormatError(ValueError):
+    pass
+
+
+def is_tile_file(path):
+    return Path(path).suffix.lower() == SUFFIX
+
+
+def _varint(value, out):
+    while value > 0x7f:
+        out.append(0x80 | (value & 0x7f))
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+class TileWriter:
+    """Streams tiles to a new file
+
+    The file is written under a temporary name, and only replaces
+    'path' when 'close' is called. If 'layers' (a list with the settings
+    of each layer) is given, tiles are written for a layer each.
+    """
+
+    def __init__(self, path, tile_size, strings, layers=None):
+        self.path = Path(path)
+        self.tile_size = V2(tile_size)
+        self.strings = strings
+        self.layers = layers
+        self.palette = {}
+        self.directory = []
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.file = open(self._tmp_path, "wb")
+        self.file.write(bytes(HEADER.size))
+
+    def write_tile(self, key, tile, layer=0):
+        """Writes a tile, as a flat sequence of encoded cells - 4 integers per cell"""
+        palette = self.palette
+        out = bytearray()
+        run_index = None
+        run_length = 0
+        for i in range(0, len(tile), 4):
+            cell = tuple(tile[i: i + 4])
+            index = palette.get(cell)
+            if index is None:
+                index = palette[cell] = len(palette)
+            if index == run_index:
+                run_length += 1
+                continue
+            if run_length:
+                _varint(run_length, out)
+                _varint(run_index, out)
+            run_index, run_length = index, 1
+        _varint(run_length, out)
+        _varint(run_index, out)
+        entry = (key[0], key[1], self.file.tell(), len(out))
+        self.directory.append(entry if self.layers is None else (layer, *entry))
+        self.file.write(out)
+
+    def close(self, size):
+        file = self.file
+        palette_offset = file.tell()
+        for cell in self.palette:
+            file.write(PALETTE_ENTRY.pack(*cell))
+        table_offset = file.tell()
+        table = [None if string is TRANSPARENT else str(string) for string in self.strings]
+        if self.layers is not None:
+            table = {"strings": table, "layers": [_layer_to_json(layer) for layer in self.layers]}
+        table = json.dumps(table).encode("utf-8")
+        file.write(table)
+        directory_offset = file.tell()
+        entry_struct = DIRECTORY_ENTRY if self.layers is None else LAYER_DIRECTORY_ENTRY
+        for entry in self.directory:
+            file.write(entry_struct.pack(*entry))
+        file.seek(0)
+        file.write(HEADER.pack(
+            MAGIC, VERSION if self.layers is None else LAYERS_VERSION, self.tile_size.x, self.tile_size.y, size[0], size[1],
+            palette_offset, len(self.palette), table_offset, len(table),
+            directory_offset, len(self.directory),
+        ))
+        file.close()
+        os.replace(self._tmp_path, self.path)
+
+
+def save_tiles(tiles, strings, tile_size, size, path):
+    """Writes canvas tiles (a {(tile_x, tile_y): cells} dict) to 'path'
+
+    Arguments are plain data, so this can run in another process.
+    """
+    writer = TileWriter(path, tile_size, strings)
+    try:
+        for key in sorted(tiles, key=lambda key: (key[1], key[0])):
+            writer.write_tile(key, tiles[key])
+    except BaseException:
+        writer.file.close()
+        os.unlink(writer._tmp_path)
+        raise
+    writer.close(size)
+
+
+def save_layers(layers, strings, tile_size, size, path):
+    """Writes layers to 'path': a (settings, tiles) pair for each, bottom first
+
+    Settings are a dict with the "name", "visible", "opacity" and "key" of
+    the layer - "key" being an encoded color or None.
+    """
+    writer = TileWriter(path, tile_size, strings, [settings for settings, _ in layers])
+    try:
+        for index, (_, tiles) in enumerate(layers):
+            for key in sorted(tiles, key=lambda key: (key[1], key[0])):
+                writer.write_tile(key, tiles[key], index)
+    except BaseException:
+        writer.file.close()
+        os.unlink(writer._tmp_path)
+        raise
+    writer.close(size)
+
+
+def _layer_to_json(settings):
+    key = settings["key"]
+    return {**settings, "key": None if key is None else f"#{key:06x}"}
+
+
+def _layer_from_json(settings):
+    if not isinstance(settings, dict):
+        raise ValueError(f"layer settings are not an object: {settings!r}")
+    key = settings.get("key")
+    if not (key is None or isinstance(key, str)):
+        raise ValueError(f"layer key is not a color: {key!r}")
+    return {
+        "name": str(settings.get("name", "")),
+        "visible": bool(settings.get("visible", True)),
+        "opacity": float(settings.get("opacity", 1.0)),
+        "key": None if key is None else int(key.lstrip("#"), 16),
+    }
+
+
+def save_canvas(canvas, path, size=None):
+    save_tiles(canvas.tiles, canvas.codec.strings, canvas.tile_size, size or canvas.extent, path)
+
+
+def save_shape(shape, path):
+    canvas = Canvas()
+    get_raw = shape.get_raw
+    for y in range(shape.height):
+        for x in range(shape.width):
+            canvas.set((x, y), get_raw((x, y)))
+    save_canvas(canvas, path, shape.size)
+
+
+class TileFile:
+    """Memory-mapped reader: tiles are decoded on demand
+
+    'layers' has the settings of each layer in the file, as `save_layers`
+    takes them, and 'directory' the tiles of each: {tile key: {layer
+    index: (offset, length)}}. Files without layers have a single one.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as file:
+            try:
+                # empty files can't be mapped
+                self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as error:
+                raise self._error(error) from error
+        try:
+            self._read_header()
+        except (struct.error, ValueError, KeyError, TypeError) as error:
+            self.close()
+            raise self._error(error) from error
+
+    def _error(self, error):
+        return FormatError(f"{self.path} is not a valid {SUFFIX} file: {error}")
+
+    def _read_header(self):
+        (magic, version, tile_w, tile_h, width, height, palette_offset, palette_count,
+         table_offset, table_size, directory_offset, directory_count) = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError("wrong file signature")
+        if version not in (VERSION, LAYERS_VERSION):
+            raise ValueError(f"unsupported version {version}")
+        self.tile_size = V2(tile_w, tile_h)
+        self.size = V2(width, height)
+        self._palette_offset = palette_offset
+        self.palette_count = palette_count
+        table = json.loads(bytes(self.data[table_offset: table_offset + table_size]).decode("utf-8"))
+        if version == VERSION:
+            strings = table
+            self.layers = [{"name": "layer 1", "visible": True, "opacity": 1.0, "key": None}]
+        else:
+            strings = table["strings"]
+            self.layers = [_layer_from_json(settings) for settings in table["layers"]]
+        self.codec = CellCodec([TRANSPARENT if string is None else string for string in strings])
+        self.directory = {}
+        for i in range(directory_count):
+            if version == VERSION:
+                entry = DIRECTORY_ENTRY.unpack_from(self.data, directory_offset + i * DIRECTORY_ENTRY.size)
+                layer = 0
+            else:
+                layer, *entry = LAYER_DIRECTORY_ENTRY.unpack_from(self.data, directory_offset + i * LAYER_DIRECTORY_ENTRY.size)
+            tile_x, tile_y, offset, length = entry
+            self.directory.setdefault((tile_x, tile_y), {})[layer] = (offset, length)
+        self._decoded = {}
+        self._encoded = {}
+
+    def palette_entry(self, index):
+        """Decoded cell value for a palette index"""
+        cell = self._decoded.get(index)
+        if cell is None:
+            encoded = self.encoded_entry(index)
+            try:
+                cell = self._decoded[index] = tuple(self.codec.decode(encoded))
+            except (IndexError, ValueError) as error:
+                raise self._error(error) from error
+        return cell
+
+    def encoded_entry(self, index):
+        """Encoded cell for a palette index"""
+        cell = self._encoded.get(index)
+        if cell is None:
+            if index >= self.palette_count:
+                raise self._error(f"palette index {index} out of range")
+            try:
+                cell = PALETTE_ENTRY.unpack_from(self.data, self._palette_offset + index * PALETTE_ENTRY.size)
+            except struct.error as error:
+                raise self._error(error) from error
+            self._encoded[index] = cell
+        return cell
+
+    def tile_indexes(self, key, layer=0):
+        """Palette indexes for all cells in a tile of a layer, row by row"""
+        offset, length = self.directory[key][layer]
+        data = self.data
+        pos, end = offset, offset + length
+        cells = self.tile_size.x * self.tile_size.y
+        indexes = []
+        try:
+            while pos < end:
+                run_length, pos = _read_varint(data, pos)
+                index, pos = _read_varint(data, pos)
+                if len(indexes) + run_length > cells:
+                    break
+                indexes.extend([index] * run_length)
+        except IndexError as error:
+            # tile data cut short
+            raise self._error(error) from error
+        if pos != end or len(indexes) != cells:
+            raise self._error(f"bad data for tile {key}")
+        return indexes
+
+    def iter_cells(self, key, layer=None):
+        """Yields (x, y, cell) for the cells in a tile, in drawing coordinates
+
+        Cells are those of 'layer', or of all layers composited if it is None.
+        """
+        tile_w, tile_h = self.tile_size
+        left, top = key[0] * tile_w, key[1] * tile_h
+        if layer is None and len(self.layers) > 1:
+            decode = self.codec.decode
+            for i, cell in enumerate(self._flat_tile(key)):
+                y, x = divmod(i, tile_w)
+                yield left + x, top + y, tuple(decode(cell))
+            return
+        entry = self.palette_entry
+        for i, index in enumerate(self.tile_indexes(key, layer or 0)):
+            y, x = divmod(i, tile_w)
+            yield left + x, top + y, entry(index)
+
+    def _flat_tile(self, key):
+        cells = [EMPTY_ENCODED] * (self.tile_size.x * self.tile_size.y)
+        layers = self.directory[key]
+        entry = self.encoded_entry
+        for index, settings in enumerate(self.layers):
+            if index not in layers or not settings["visible"]:
+                continue
+            opacity, color_key = settings["opacity"], settings["key"]
+            for i, palette_index in enumerate(self.tile_indexes(key, index)):
+                cell = entry(palette_index)
+                if cell != EMPTY_ENCODED:
+                    cells[i] = compose(cell, cells[i], opacity, color_key)
+        return cells
+
+    def to_shape(self):
+        """Decodes the whole drawing into a new FullShape"""
+        width, height = self.size
+        cells = [EMPTY_CELL] * (width * height)
+        for key in self.directory:
+            for x, y, cell in self.iter_cells(key):
+                if x < width and y < height:
+                    cells[y * width + x] = cell
+        chars = [[cell[0] for cell in cells[y * width: (y + 1) * width]] for y in range(height)]
+        planes = [chars] + [[cell[i] for cell in cells] for i in (1, 2, 3)]
+        shape = TM.image.FullShape(planes)
+        # the constructor skips TRANSPARENT values: they have to be forced in
+        for i, cell in enumerate(cells):
+            if TRANSPARENT in cell:
+                shape._raw_setitem((i % width, i // width), cell, force_transparent_ink=True)
+        return shape
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def paste_tiles(viewport, pos, tile_file):
+    """Pastes the contents of a TileFile into a canvas viewport at 'pos'
+
+    Cells are written straight into the canvas, tile by tile, without
+    building a shape for the whole drawing. Empty cells in the file are
+    not pasted.
+    """
+    left, top = pos
+    empty = EMPTY_CELL
+    for key in tile_file.directory:
+        for x, y, cell in tile_file.iter_cells(key):
+            if cell == empty:
+                continue
+            target = left + x, top + y
+            if any(component is TRANSPARENT for component in cell):
+                old = viewport.get(target)
+                cell = [old_c if new_c is TRANSPARENT else new_c for new_c, old_c in zip(cell, old)]
+            viewport.set(target, cell)
+
+
+def load_shape(path):
+    with TileFile(path) as tile_file:
+        return tile_file.to_shape()
+
+
+def benchmark(size=(1000, 300), directory=None, file=None):
+    """Compares size, save and load times of ".tpaint" and ".snapshot" files
+
+    The test drawing has bands of colored text, lines and empty areas.
+    """
+    import tempfile
+    from terminedia_paint.canvas import Viewport
+    from terminedia_paint.export import save_snapshot
+
+    file = file or sys.stdout
+    width, height = size
+    canvas = Canvas()
+    colors = [TM.Color((255, 0, 0)), TM.Color((0, 255, 0)), TM.Color((0, 0, 255)), TM.DEFAULT_FG]
+    for y in range(0, height, 2):
+        for x in range(0, width * 2 // 3):
+            canvas.set((x, y), ("#*.█"[(x // 7 + y) % 4], colors[(x // 13) % 4], TM.DEFAULT_BG, TM.Effects.none))
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        results = {}
+        for suffix in (".snapshot", SUFFIX):
+            path = Path(tmp, "bench" + suffix)
+            start = time.perf_counter()
+            if suffix == SUFFIX:
+                save_canvas(canvas, path, size)
+            else:
+                save_snapshot(canvas.snapshot_planes(size), path)
+            save_time = time.perf_counter() - start
+            start = time.perf_counter()
+            if suffix == SUFFIX:
+                load_shape(path)
+            else:
+                TM.shape(path)
+            load_time = time.perf_counter() - start
+            results[suffix] = (path.stat().st_size, save_time, load_time)
+        start = time.perf_counter()
+        with TileFile(Path(tmp, "bench" + SUFFIX)) as tile_file:
+            list(tile_file.iter_cells(next(iter(tile_file.directory))))
+        one_tile = time.perf_counter() - start
+        # what "Paste Image" does: cells go to the canvas, no shape is built
+        viewport = Viewport(TM.image.FullShape.new((80, 25)))
+        start = time.perf_counter()
+        with TileFile(Path(tmp, "bench" + SUFFIX)) as tile_file:
+            paste_tiles(viewport, (0, 0), tile_file)
+        paste_time = time.perf_counter() - start
+
+    print(f"{width}x{height} cells, {len(canvas.tiles)} tiles", file=file)
+    print(f"{'format':<10} {'bytes':>10} {'save s':>8} {'load s':>8}", file=file)
+    for suffix, (bytes_, save_time, load_time) in results.items():
+        print(f"{suffix:<10} {bytes_:>10} {save_time:>8.3f} {load_time:>8.3f}", file=file)
+    print(f"open {SUFFIX} and decode one tile: {one_tile * 1000:.2f}ms", file=file)
+    print(f"open {SUFFIX} and paste into a canvas: {paste_time:.3f}s", file=file)
+    return results
+
+
+if __name__ == "__main__":
+    benchmark()
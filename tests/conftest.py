@@ -0,0 +1,10 @@
+import pytest
+
+from terminedia_paint.benchmarks import Session
+
+
+@pytest.fixture
+def session():
+    """A painter on a small headless screen"""
+    return Session((40, 12))
+
@@ -0,0 +1,69 @@
+def char_at(painter, pos):
+    painter.viewport.sync()
+    return painter.viewport.get(pos)[0]
+
+
+def test_frames_keep_their_contents(session):
+    painter = session.painter
+    session.drag([(1, 1), (8, 1)])
+    painter.new_frame()
+    assert char_at(painter, (3, 1)) == " "
+    session.drag([(1, 5), (8, 5)])
+    painter.duplicate_frame()
+    assert char_at(painter, (3, 5)) != " "
+    painter.step_frame(-2)
+    assert len(painter.animation) == 3
+    assert char_at(painter, (3, 1)) != " "
+    assert char_at(painter, (3, 5)) == " "
+    painter.step_frame(1)
+    assert char_at(painter, (3, 1)) == " "
+    assert char_at(painter, (3, 5)) != " "
+
+
+def test_undo_is_per_frame(session):
+    painter = session.painter
+    journal = painter.journal
+    session.drag([(1, 1), (8, 1)])
+    painter.new_frame()
+    assert not journal.undo()
+    session.drag([(1, 5), (8, 5)])
+    painter.step_frame(-1)
+    # the stroke on this frame is undone, not the one drawn last on the other
+    while journal.undo():
+        pass
+    assert char_at(painter, (3, 1)) == " "
+    painter.step_frame(1)
+    assert char_at(painter, (3, 5)) != " "
+    assert journal.undo()
+    assert char_at(painter, (3, 5)) == " "
+    painter.step_frame(-1)
+    while journal.redo():
+        pass
+    assert char_at(painter, (3, 1)) != " "
+    painter.step_frame(1)
+    assert char_at(painter, (3, 5)) == " "
+
+
+def test_removed_frame_drops_its_history(session):
+    painter = session.painter
+    session.drag([(1, 1), (8, 1)])
+    painter.new_frame()
+    session.drag([(1, 5), (8, 5)])
+    assert painter.journal.parked
+    painter.remove_frame()
+    assert len(painter.animation) == 1
+    assert painter.journal.parked == 0
+    assert char_at(painter, (3, 1)) != " "
+
+
+def test_export_only_has_changes(session):
+    painter = session.painter
+    session.drag([(1, 1), (8, 1)])
+    painter.duplicate_frame()
+    session.drag([(1, 3), (4, 3)])
+    painter.duplicate_frame()
+    rows, updates = painter.animation.export_data()
+    assert "".join(cell[0] for cell in rows[1]).strip()
+    assert not any("".join(cell[0] for cell in row).strip() for row in rows[2:])
+    assert {pos[1] for pos, _ in updates[0]} == {3}
+    assert updates[1] == []
@@ -0,0 +1,86 @@
+import pytest
+import terminedia as TM
+
+from terminedia_paint import ansi, ansiparse
+
+ESC = "\x1b"
+
+
+def drawing():
+    shape = TM.shape((12, 4))
+    shape.context.color = (255, 0, 0)
+    shape.context.background = (0, 0, 64)
+    shape.context.effects = TM.Effects.bold
+    shape[1, 0] = "A"
+    shape[2, 0] = "B"
+    shape.context.color = (0, 200, 0)
+    shape.context.effects = TM.Effects.underline | TM.Effects.italic
+    shape[5, 1] = "é"
+    shape[6, 1] = "█"
+    shape.context.color = TM.DEFAULT_FG
+    shape.context.background = TM.DEFAULT_BG
+    shape.context.effects = TM.Effects.none
+    shape[0, 3] = "z"
+    shape[11, 3] = "!"
+    return shape
+
+
+def test_only_changes_are_written():
+    shape = TM.shape((6, 2))
+    shape.context.color = (255, 0, 0)
+    shape[0, 0] = "a"
+    shape[1, 0] = "b"
+    shape.context.effects = TM.Effects.bold
+    shape[2, 0] = "c"
+    shape.context.color = TM.DEFAULT_FG
+    shape.context.effects = TM.Effects.none
+    shape[1, 1] = "d"
+    assert ansi.encode_shape(shape) == f"{ESC}[38;2;255;0;0mab{ESC}[1mc\n {ESC}[0md\n"
+
+
+@pytest.mark.parametrize("colors, code", [("truecolor", "38;2;255;0;0"), ("256", "38;5;196"), ("16", "91")])
+def test_color_modes(colors, code):
+    shape = TM.shape((1, 1))
+    shape.context.color = (255, 0, 0)
+    shape[0, 0] = "a"
+    assert ansi.encode_shape(shape, colors) == f"{ESC}[{code}ma\n{ESC}[0m"
+
+
+def test_blank_areas_are_skipped():
+    shape = TM.shape((200, 3))
+    shape[199, 2] = "x"
+    assert len(ansi.encode_shape(shape)) < 40
+
+
+def test_write_shape(tmp_path):
+    shape = drawing()
+    path = tmp_path / "drawing.ans"
+    ansi.write_shape(shape, path)
+    assert path.read_text(encoding="utf-8") == ansi.encode_shape(shape)
+
+
+def raw(shape, pos):
+    return tuple(map(str, shape.get_raw(pos)))
+
+
+def test_round_trip(tmp_path):
+    shape = drawing()
+    path = tmp_path / "drawing.ans"
+    ansi.write_shape(shape, path)
+    loaded = ansiparse.load_shape(path)
+    assert loaded.size == shape.size
+    for y in range(shape.height):
+        for x in range(shape.width):
+            assert raw(loaded, (x, y)) == raw(shape, (x, y)), (x, y)
+
+
+@pytest.mark.parametrize("colors", ["256", "16"])
+def test_palette_modes_round_trip(tmp_path, colors):
+    shape = drawing()
+    path = tmp_path / "drawing.ans"
+    ansi.write_shape(shape, path, colors)
+    loaded = ansiparse.load_shape(path)
+    for pos in [(1, 0), (5, 1), (0, 3)]:
+        char, _, _, effects = loaded.get_raw(pos)
+        assert (char, effects) == (shape[pos][0], shape[pos][3])
+    assert loaded.get_raw((1, 0))[1] != TM.DEFAULT_FG
@@ -0,0 +1,119 @@
+import struct
+
+import terminedia as TM
+
+from terminedia_paint import ansiparse
+from terminedia_paint.ansiparse import SAUCE, AnsiParser
+
+ESC = "\x1b"
+
+
+def parse(*chunks, width=None):
+    cells = {}
+    parser = AnsiParser(lambda pos, cell: cells.__setitem__(pos, cell), width)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return cells, parser
+
+
+def text(cells):
+    return {pos: cell[0] for pos, cell in cells.items()}
+
+
+def test_cursor_moves():
+    cells, parser = parse(f"ab{ESC}[2Cc{ESC}[3;5Hd{ESC}[Ae{ESC}[2Df\r\ng{ESC}[s{ESC}[10Gh{ESC}[uj\tk\b\bl")
+    assert text(cells) == {
+        (0, 0): "a", (1, 0): "b", (4, 0): "c",
+        (4, 2): "d", (5, 1): "e", (4, 1): "f",
+        (0, 2): "g", (9, 2): "h", (1, 2): "j", (8, 2): "k", (7, 2): "l",
+    }
+    assert parser.extent == [10, 3]
+
+
+def test_colors_and_effects():
+    cells, _ = parse(f"{ESC}[1;31;44ma{ESC}[38;5;196;48;2;1;2;3mb{ESC}[22;39mc{ESC}[0md")
+    char, fg, bg, effects = cells[0, 0]
+    assert (tuple(fg), tuple(bg), effects) == ((205, 0, 0), (0, 0, 238), TM.Effects.bold)
+    char, fg, bg, effects = cells[1, 0]
+    assert (tuple(fg), tuple(bg)) == ((255, 0, 0), (1, 2, 3))
+    char, fg, bg, effects = cells[2, 0]
+    assert (fg, tuple(bg), effects) == (TM.DEFAULT_FG, (1, 2, 3), TM.Effects.none)
+    assert cells[3, 0][1:] == (TM.DEFAULT_FG, TM.DEFAULT_BG, TM.Effects.none)
+
+
+def test_split_escape_sequences():
+    sequence = f"a{ESC}[1;38;2;10;20;30mb{ESC}[5Cc"
+    whole, _ = parse(sequence)
+    for split in range(1, len(sequence)):
+        cells, _ = parse(sequence[:split], sequence[split:])
+        assert cells == whole, split
+
+
+def test_other_sequences_are_skipped():
+    cells, _ = parse(f"{ESC}[?25la{ESC}]0;title\x07b{ESC}[2Jc{ESC}7d")
+    assert "".join(cell[0] for _, cell in sorted(cells.items())) == "abcd"
+
+
+def test_wrapping():
+    cells, _ = parse("abcde", width=3)
+    assert text(cells) == {(0, 0): "a", (1, 0): "b", (2, 0): "c", (0, 1): "d", (1, 1): "e"}
+    # a line break right at the edge doesn't add an empty line
+    cells, _ = parse("abc\ndef", width=3)
+    assert text(cells)[0, 1] == "d"
+
+
+def test_wide_characters():
+    cells, _ = parse("🙂a")
+    assert cells[1, 0][0] == TM.values.CONTINUATION
+    assert cells[2, 0][0] == "a"
+
+
+def read(path, **kwargs):
+    cells = {}
+    parser = ansiparse.read_file(path, lambda pos, cell: cells.__setitem__(pos, cell), **kwargs)
+    return cells, parser
+
+
+def sauce(width, height, file_size):
+    fields = (b"SAUCE", b"00", b"title".ljust(35), b"author".ljust(20), b"".ljust(20), b"20240101",
+              file_size, 1, 1, width, height, 0, 0, 0)
+    return SAUCE.pack(*fields) + b"\x00" * (ansiparse.SAUCE_SIZE - SAUCE.size)
+
+
+def test_cp437_with_sauce(tmp_path):
+    path = tmp_path / "art.ans"
+    # CP437 block characters, and a line longer than the SAUCE width
+    data = b"\xdb\xb2\xb1\xb0" * 3
+    path.write_bytes(data + b"\x1a" + sauce(8, 2, len(data)))
+    assert ansiparse.read_sauce(path)["width"] == 8
+    assert ansiparse.read_sauce(path)["title"] == "title"
+    cells, parser = read(path)
+    assert "".join(text(cells)[x, 0] for x in range(8)) == "█▓▒░█▓▒░"
+    assert "".join(text(cells)[x, 1] for x in range(4)) == "█▓▒░"
+    assert parser.extent == [8, 2]
+
+
+def test_cp437_wraps_at_80_columns(tmp_path):
+    path = tmp_path / "art.ans"
+    path.write_bytes(b"\xdb" * 100)
+    cells, _ = read(path)
+    assert max(x for x, y in cells) == 79
+    assert max(y for x, y in cells) == 1
+
+
+def test_utf8_file_read_in_chunks(tmp_path):
+    path = tmp_path / "art.ans"
+    content = f"{ESC}[31mé🙂{ESC}[2Bü\n" * 20
+    path.write_text(content, encoding="utf-8")
+    whole, _ = read(path)
+    # chunks end in the middle of characters and escape sequences
+    cells, _ = read(path, chunk_size=3)
+    assert cells == whole
+    assert text(cells)[0, 0] == "é"
+    assert len(whole) == 20 * 4
+
+
+def test_no_sauce(tmp_path):
+    path = tmp_path / "art.ans"
+    path.write_bytes(b"x")
+    assert ansiparse.read_sauce(path) is None
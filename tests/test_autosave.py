@@ -0,0 +1,102 @@
+from terminedia_paint import autosave
+from terminedia_paint.benchmarks import Session
+
+
+def rows(cells, codec):
+    """Rows with something drawn on them"""
+    return sorted({y for (x, y), value in cells.items() if codec.decode(value)[0] != " "})
+
+
+def recorded(session, directory):
+    painter = session.painter
+    painter.autosave = autosave.Autosave(painter.journal, directory)
+    return painter
+
+
+def test_recovers_drawing(session, tmp_path):
+    painter = recorded(session, tmp_path)
+    session.drag([(1, 1), (8, 1)])
+    depth = len(painter.journal)
+    session.drag([(1, 3), (8, 3)])
+    session.drag([(1, 5), (8, 5)])
+    while len(painter.journal) > depth:
+        painter.journal.undo()
+    painter.journal.redo()
+    painter.autosave.close()
+    [(cells, _)], codec = autosave.load([painter.autosave.checkpoint_path, painter.autosave.log_path])
+    assert rows(cells, codec) == [1, 3]
+    assert cells[(4, 1)] == painter.journal.codec.encode(painter.viewport.get((4, 1)))
+
+
+def test_checkpoint(session, tmp_path, monkeypatch):
+    monkeypatch.setattr(autosave, "MIN_CHECKPOINT_BYTES", 0)
+    painter = recorded(session, tmp_path)
+    session.drag([(1, 1), (8, 1)])
+    while painter.journal.undo():
+        pass
+    session.drag([(1, 3), (8, 3)])
+    painter.autosave.close()
+    assert painter.autosave.checkpoints
+    [(cells, _)], codec = autosave.load([painter.autosave.checkpoint_path, painter.autosave.log_path])
+    assert rows(cells, codec) == [3]
+
+
+def test_cut_short_record_is_ignored(session, tmp_path):
+    painter = recorded(session, tmp_path)
+    session.drag([(1, 1), (8, 1)])
+    painter.autosave.close()
+    log_path = painter.autosave.log_path
+    cell = painter.journal.codec.encode(painter.viewport.get((4, 1)))
+    record = autosave._pack(b"C", autosave.CELL.pack(4, 5, *cell))
+    with open(log_path, "ab") as file:
+        file.write(record[:-1])
+    [(cells, _)], codec = autosave.load([painter.autosave.checkpoint_path, log_path])
+    assert rows(cells, codec) == [1]
+    with open(log_path, "ab") as file:
+        file.write(record[-1:])
+    [(cells, _)], codec = autosave.load([painter.autosave.checkpoint_path, log_path])
+    assert rows(cells, codec) == [1, 5]
+
+
+def test_recovers_frames(session, tmp_path):
+    painter = recorded(session, tmp_path)
+    session.drag([(1, 1), (8, 1)])
+    painter.duplicate_frame()
+    session.drag([(1, 3), (8, 3)])
+    painter.new_frame()
+    session.drag([(1, 5), (8, 5)])
+    painter.step_frame(-2)
+    while painter.journal.undo():
+        pass
+    painter.autosave.close()
+    drawing, codec = autosave.load([painter.autosave.checkpoint_path, painter.autosave.log_path])
+    assert [rows(cells, codec) for cells, _ in drawing] == [[], [1, 3], [5]]
+    assert [settings for _, settings in drawing] == [None, None, None]
+
+    restored = Session((40, 12)).painter
+    restored._restore(drawing, codec)
+    animation = restored.animation
+    assert len(animation) == 3
+    assert [sorted({y for x, y in animation.frame_cells(frame)}) for frame in animation.frames] == [[], [1, 3], [5]]
+
+
+def test_recovers_layers(session, tmp_path):
+    painter = recorded(session, tmp_path)
+    session.drag([(1, 1), (8, 1)])
+    painter.new_layer()
+    session.drag([(1, 3), (8, 3)])
+    painter.layers.configure(opacity=0.5)
+    painter._layers_changed()
+    painter.move_layer(-1)
+    painter.autosave.close()
+    drawing, codec = autosave.load([painter.autosave.checkpoint_path, painter.autosave.log_path])
+    assert [rows(cells, codec) for cells, _ in drawing] == [[3], [1]]
+    assert [(settings["name"], settings["opacity"]) for _, settings in drawing] == [("layer 2", 0.5), ("layer 1", 1.0)]
+
+    restored = Session((40, 12)).painter
+    restored._restore(drawing, codec)
+    restored.viewport.sync()
+    layers = restored.layers.layers
+    assert [(layer.name, layer.opacity) for layer in layers] == [("layer 2", 0.5), ("layer 1", 1.0)]
+    assert layers[0].canvas.get((3, 3))[0] != " "
+    assert layers[1].canvas.get((3, 1))[0] != " "
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+import terminedia as TM
+
+from terminedia_paint import broadcast
+from terminedia_paint.broadcast import HEADER, Broadcaster, Receiver
+
+SIZE = (30, 8)
+
+
+@pytest.fixture
+def painter_shape(tmp_path):
+    shape = TM.shape(SIZE)
+    sender = Broadcaster(shape, str(tmp_path / "paint.sock"))
+    yield shape, sender
+    sender.close()
+
+
+def apply(receiver, data):
+    """Feeds all messages in 'data' to 'receiver'"""
+    offset = 0
+    while offset < len(data):
+        kind, size = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        receiver.apply(kind, data[offset: offset + size])
+        offset += size
+    assert offset == len(data)
+
+
+def cells(shape):
+    return [tuple(map(str, shape.get_raw((x, y)))) for y in range(shape.height) for x in range(shape.width)]
+
+
+def draw(shape):
+    shape.context.color = (255, 128, 0)
+    shape.context.background = (0, 0, 80)
+    shape.context.effects = TM.Effects.bold
+    shape.text[1].at((2, 1), "hello")
+    shape[10, 3] = "é"
+    shape[12, 3] = "🙂"
+
+
+def test_keyframe(painter_shape):
+    shape, sender = painter_shape
+    draw(shape)
+    view = TM.shape(SIZE)
+    receiver = Receiver(view)
+    apply(receiver, sender.keyframe())
+    assert receiver.frames == 1
+    assert cells(view) == cells(shape)
+
+
+def test_delta(painter_shape):
+    shape, sender = painter_shape
+    draw(shape)
+    view = TM.shape(SIZE)
+    receiver = Receiver(view)
+    apply(receiver, sender.keyframe())
+    sender.touched.clear()
+    shape.context.color = (0, 255, 0)
+    shape[5, 5] = "x"
+    shape.text[1].at((2, 1), "world")
+    data = sender.delta(sender.touched)
+    # only the changed cells are sent
+    assert len(data) < 20 * broadcast.DELTA_CELL.size
+    apply(receiver, data)
+    assert receiver.frames == 2
+    assert cells(view) == cells(shape)
+
+
+def test_delta_off_screen(painter_shape):
+    shape, sender = painter_shape
+    assert sender.delta({(SIZE[0], 0), (0, SIZE[1])}) is None
+
+
+def test_viewer(painter_shape):
+    shape, sender = painter_shape
+
+    async def watch():
+        sender.tick()
+        reader, writer = await broadcast.connect(sender.address)
+        view = TM.shape(SIZE)
+        receiver = Receiver(view)
+        task = asyncio.create_task(broadcast.receive(reader, receiver))
+        for step in range(40):
+            if step == 2:
+                draw(shape)
+            if step == 4:
+                shape[0, 7] = "z"
+            sender.tick()
+            await asyncio.sleep(0.01)
+            if step > 4 and cells(view) == cells(shape):
+                break
+        writer.close()
+        task.cancel()
+        sender.close()
+        return view, receiver
+
+    view, receiver = asyncio.run(watch())
+    assert cells(view) == cells(shape)
+    assert receiver.frames >= 2
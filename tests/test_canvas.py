@@ -0,0 +1,164 @@
+import pickle
+
+import terminedia as TM
+from terminedia.utils import Rect
+
+from terminedia_paint.canvas import EMPTY_CELL, MAX_SIZE, TILE_SIZE, Canvas, CellGrid, Viewport
+
+RED = TM.Color((255, 0, 0))
+
+
+def cell(char):
+    return (char, RED, TM.DEFAULT_BG, TM.Effects.none)
+
+
+def test_canvas_is_sparse():
+    canvas = Canvas()
+    assert canvas.get((1000, 2000)) == EMPTY_CELL
+    canvas.set((1000, 2000), cell("x"))
+    assert canvas.get((1000, 2000)) == cell("x")
+    assert list(canvas.tiles) == [(1000 // TILE_SIZE.x, 2000 // TILE_SIZE.y)]
+    assert canvas.extent == (1001, 2001)
+    # setting an empty cell where there is no tile creates none
+    canvas.set((0, 0), EMPTY_CELL)
+    assert len(canvas.tiles) == 1
+
+
+def test_prune():
+    canvas = Canvas()
+    canvas.set((1, 1), cell("x"))
+    canvas.set((100, 1), cell("y"))
+    canvas.set((1, 1), EMPTY_CELL)
+    canvas.prune()
+    assert list(canvas.tiles) == [(100 // TILE_SIZE.x, 0)]
+    assert canvas.extent == (101, 2)
+
+
+def make_viewport(size=(20, 10)):
+    shape = TM.shape(size)
+    return shape, Viewport(shape)
+
+
+def test_sync_writes_back_screen_changes():
+    shape, viewport = make_viewport()
+    shape[3, 4] = "a"
+    assert viewport.canvas.get((3, 4)) == EMPTY_CELL
+    viewport.sync()
+    assert viewport.canvas.get((3, 4))[0] == "a"
+    shape[3, 4] = " "
+    viewport.sync()
+    assert not viewport.canvas.tiles
+
+
+def test_scroll():
+    shape, viewport = make_viewport()
+    shape[3, 4] = "a"
+    viewport.scroll_to((100, 50))
+    assert viewport.origin == (100, 50)
+    assert shape[3, 4][0] == " "
+    assert viewport.get((3, 4))[0] == "a"
+    shape[0, 0] = "b"
+    assert viewport.get((100, 50))[0] == "b"
+    viewport.scroll_to((95, 48))
+    assert shape[5, 2][0] == "b"
+    viewport.scroll_to((0, 0))
+    assert shape[3, 4][0] == "a"
+    assert viewport.canvas.get((100, 50))[0] == "b"
+
+
+def test_scroll_is_clamped():
+    shape, viewport = make_viewport()
+    viewport.scroll_to((-5, 2 ** 20))
+    assert viewport.origin == (0, 2 ** 16 - 10)
+
+
+def test_set_out_of_view():
+    shape, viewport = make_viewport()
+    viewport.set((50, 50), cell("z"))
+    assert viewport.canvas.get((50, 50)) == cell("z")
+    viewport.set((2, 2), cell("y"))
+    assert shape[2, 2][0] == "y"
+
+
+def test_blit_off_screen():
+    shape, viewport = make_viewport()
+    source = TM.shape((30, 3))
+    source.context.color = RED
+    source.draw.line((0, 1), (29, 1))
+    viewport.scroll_to((5, 0))
+    viewport.blit((0, 0), source)
+    viewport.sync()
+    canvas = viewport.canvas
+    # the part left of the screen, the one on it and the one right of it
+    assert all(canvas.get((x, 1))[0] == "█" for x in range(30))
+    assert canvas.get((30, 1)) == EMPTY_CELL
+    assert canvas.get((2, 0)) == EMPTY_CELL
+    assert shape[0, 1][0] == "█"
+
+
+def test_read_region():
+    canvas = Canvas()
+    canvas.set((31, 15), cell("a"))
+    canvas.set((32, 16), cell("b"))
+    grid = canvas.read_region(Rect((30, 14), (34, 18)))
+    assert grid.size == (4, 4)
+    assert tuple(grid.get((1, 1))) == cell("a")
+    assert tuple(grid.get((2, 2))) == cell("b")
+    assert tuple(grid.get((0, 0))) == EMPTY_CELL
+    assert grid.codec is canvas.codec
+
+
+def test_write_region():
+    canvas = Canvas()
+    grid = CellGrid((3, 2), canvas.codec)
+    grid.set((0, 0), cell("a"))
+    grid.set((2, 1), cell("b"))
+    canvas.write_region((31, 15), grid)
+    assert canvas.get((31, 15)) == cell("a")
+    assert canvas.get((33, 16)) == cell("b")
+    assert canvas.get((32, 15)) == EMPTY_CELL
+    # tiles left empty are dropped
+    canvas.write_region((31, 15), CellGrid((3, 2), canvas.codec))
+    assert not canvas.tiles
+
+
+def test_write_region_past_the_edge():
+    canvas = Canvas()
+    grid = CellGrid((4, 1), canvas.codec)
+    grid.set((0, 0), cell("a"))
+    grid.set((3, 0), cell("b"))
+    canvas.write_region((MAX_SIZE.x - 2, 0), grid)
+    assert canvas.get((MAX_SIZE.x - 2, 0)) == cell("a")
+    assert canvas.extent == (MAX_SIZE.x - 1, 1)
+
+
+def test_cell_grid():
+    grid = CellGrid((3, 2))
+    assert tuple(grid.get((2, 1))) == EMPTY_CELL
+    grid.set((1, 0), cell("a"))
+    grid.set((2, 1), cell("é"))
+    assert tuple(grid.get((1, 0))) == cell("a")
+    assert grid.get((2, 1))[0] == "é"
+    assert list(grid.cells())[1] == grid.get_encoded((1, 0))
+    part = grid.copy(Rect((1, 0), (5, 2)))
+    assert part.size == (2, 2)
+    assert tuple(part.get((0, 0))) == cell("a")
+    assert part.get((1, 1))[0] == "é"
+    assert not grid.copy(Rect((5, 5), (6, 6))).size.x
+
+
+def test_cell_grid_pickles():
+    grid = CellGrid((2, 1))
+    grid.set((0, 0), cell("🙂"))
+    copy = pickle.loads(pickle.dumps(grid))
+    assert tuple(copy.get((0, 0))) == tuple(grid.get((0, 0)))
+    assert copy.get_encoded((1, 0)) == grid.get_encoded((1, 0))
+
+
+def test_to_planes():
+    grid = CellGrid((2, 2))
+    grid.set((1, 0), cell("a"))
+    chars, fg, bg, effects = grid.to_planes()
+    assert chars == [[" ", "a"], [" ", " "]]
+    assert fg[1] == RED
+    assert len(bg) == len(effects) == 4
@@ -0,0 +1,73 @@
+import unicodedata
+from array import array
+
+import pytest
+
+from terminedia_paint import charsearch
+from terminedia_paint.charsearch import CharIndex
+
+CHARS = "aAbɐ█▀▌─│╭⠀⠁🙂\U000e0061"
+
+
+def small_index(chars=CHARS):
+    codes = array("I")
+    names = []
+    words = {}
+    for ordinal, char in enumerate(chars):
+        name = unicodedata.name(char)
+        codes.append(ord(char))
+        names.append(name)
+        for word in set(charsearch._words(name)):
+            words.setdefault(word, array("I")).append(ordinal)
+    return CharIndex(codes, names, words)
+
+
+def found(index, query, limit=20, offset=0):
+    return "".join(char for char, name in index.search(query, limit, offset)[1])
+
+
+def test_words_match_by_prefix():
+    index = small_index()
+    assert found(index, "bl") == "█▌▀⠀"
+    assert found(index, "BLOCK") == "█▌▀"
+    assert found(index, "lat sm") == "ab\U000e0061ɐ"
+    assert found(index, "box dr li ho") == "─"
+
+
+def test_no_match():
+    index = small_index()
+    assert index.search("zebra") == (0, [])
+    assert index.search("") == (0, [])
+    assert index.search("block zebra") == (0, [])
+
+
+def test_ranking():
+    index = small_index()
+    # whole words before partial ones, then drawing symbols, then shorter names
+    assert found(index, "latin small letter a") == "a\U000e0061ɐ"
+    assert found(index, "b") == "b█▌▀│─╭⠀⠁"
+
+
+def test_pages():
+    index = small_index()
+    total, page = index.search("latin", limit=2)
+    assert total == 5
+    assert found(index, "latin", 2) + found(index, "latin", 2, 2) + found(index, "latin", 2, 4) == found(index, "latin")
+
+
+def test_cached_index(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(charsearch, "_index", None)
+    total, results = charsearch.search("box li", 3)
+    assert total > 50
+    assert all(name.startswith("BOX DRAWINGS LIGHT") for _, name in results)
+    path = tmp_path / "terminedia-paint" / f"charnames-{unicodedata.unidata_version}.pickle"
+    assert path.exists()
+    loaded = CharIndex.load(path)
+    assert loaded.search("full block") == (1, [("█", "FULL BLOCK")])
+
+
+@pytest.mark.parametrize("query", ["box-drawings", "BOX  drawings"])
+def test_query_words(query):
+    index = small_index()
+    assert found(index, query) == "│─╭"
@@ -0,0 +1,96 @@
+import pytest
+
+from terminedia_paint import ansi, clips
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def colored(value, size=(8, 4)):
+    return Image.new("RGB", size, (value, 0, 255 - value))
+
+
+def frame_colors(frames):
+    return [frame.getpixel((0, 0))[0] for frame in frames]
+
+
+@pytest.fixture
+def gif(tmp_path):
+    path = tmp_path / "clip.gif"
+    frames = [colored(value * 20) for value in range(10)]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=50, loop=0)
+    return path
+
+
+@pytest.fixture
+def directory(tmp_path):
+    path = tmp_path / "frames"
+    path.mkdir()
+    for index in range(12):
+        colored(index * 20).save(path / f"frame{index}.png")
+    return path
+
+
+def test_iter_frames_from_a_directory(directory):
+    # numbered files are read in numeric order: frame10 after frame9
+    assert frame_colors(clips.iter_frames(directory)) == [index * 20 for index in range(12)]
+
+
+def test_iter_frames_step_and_limit(directory):
+    assert frame_colors(clips.iter_frames(directory, step=5)) == [0, 100, 200]
+    assert frame_colors(clips.iter_frames(directory, step=2, limit=3)) == [0, 40, 80]
+    assert frame_colors(clips.iter_frames(directory, limit=1)) == [0]
+
+
+def test_animated_image(gif):
+    assert clips.is_clip(gif)
+    assert len(list(clips.iter_frames(gif, step=3))) == 4
+    assert clips.clip_fps(gif) == 20
+
+
+def test_single_image_is_not_a_clip(tmp_path):
+    path = tmp_path / "still.png"
+    colored(0).save(path)
+    assert not clips.is_clip(path)
+
+
+def test_deltas():
+    a, b, c = ("a", 1, 0), ("b", 1, 0), ("c", 2, 0)
+    frames = [
+        [(a, b), (b, b)],
+        [(a, c), (b, b)],
+        [(a, c), (b, b)],
+        [(c, c), (b, a)],
+    ]
+    assert list(clips.deltas(frames)) == [
+        [((0, 0), a), ((1, 0), b), ((0, 1), b), ((1, 1), b)],
+        [((1, 0), c)],
+        [],
+        [((0, 0), c), ((1, 1), a)],
+    ]
+
+
+def test_deltas_of_growing_frames():
+    a, b = ("a", 1, 0), ("b", 1, 0)
+    changes = list(clips.deltas([[(a,)], [(a, b), (b,)]]))
+    assert changes[1] == [((1, 0), b), ((0, 1), b)]
+
+
+def test_convert_and_write(directory, tmp_path):
+    frames = clips.convert(clips.iter_frames(directory, limit=3), 4, "square", workers=1)
+    path = tmp_path / "clip.ans"
+    assert clips.write_animation(frames, path) == 3
+    text = path.read_text(encoding="utf-8")
+    assert text.count(ansi.FRAME_START) == 3
+
+
+def test_bad_step(directory):
+    with pytest.raises(ValueError):
+        next(clips.iter_frames(directory, step=0))
+
+
+@pytest.mark.parametrize("option", ["--width", "--step", "--limit", "--jobs"])
+@pytest.mark.parametrize("value", ["0", "-2", "x"])
+def test_bad_counts_are_rejected(option, value, tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        clips.main(["clip.gif", "-o", str(tmp_path / "clip.ans"), option, value])
+    assert "1 or more" in capsys.readouterr().err
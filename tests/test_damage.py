@@ -0,0 +1,61 @@
+import io
+
+import terminedia as TM
+from terminedia.utils import Rect, V2
+
+from terminedia_paint.damage import DamageTracker, cells_to_rects
+
+
+def make_tracker():
+    screen = TM.Screen(size=V2(20, 6), interactive=False)
+    return screen, DamageTracker(screen)
+
+
+def render(tracker, rects=()):
+    file = io.StringIO()
+    tracker.render(tracker.screen.shape, list(rects), file=file)
+    return file.getvalue()
+
+
+def test_cells_to_rects():
+    cells = {(1, 1), (2, 1), (3, 1), (5, 1), (0, 2)}
+    assert cells_to_rects(cells) == [Rect((1, 1), (4, 2)), Rect((5, 1), (6, 2)), Rect((0, 2), (1, 3))]
+    assert cells_to_rects(set()) == []
+
+
+def test_only_touched_cells_are_rendered():
+    screen, tracker = make_tracker()
+    screen.shape[3, 2] = "x"
+    screen.shape[4, 2] = "y"
+    screen.shape[10, 5] = "z"
+    output = render(tracker)
+    assert tracker.last_cells == 3
+    assert tracker.last_bytes == len(output)
+    assert "xy" in output and "z" in output
+
+
+def test_nothing_to_render():
+    screen, tracker = make_tracker()
+    screen.shape[3, 2] = "x"
+    render(tracker)
+    assert render(tracker) == ""
+    assert tracker.history[-1] == (0, 0)
+    assert tracker.frames == 2
+
+
+def test_rects_are_clipped_to_the_screen():
+    screen, tracker = make_tracker()
+    render(tracker, [Rect((18, 4), (30, 30))])
+    assert tracker.last_cells == 4
+
+
+def test_blank_screen_skips_the_full_repaint():
+    screen, tracker = make_tracker()
+    assert tracker.is_empty()
+    # as left by clearing an empty screen: the terminal only needs what is drawn next
+    tracker.blank = True
+    screen.shape[1, 1] = "x"
+    render(tracker, [Rect((0, 0), (20, 6))])
+    assert tracker.last_cells == 1
+    assert not tracker.blank
+    assert not tracker.is_empty()
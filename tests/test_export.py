@@ -0,0 +1,16 @@
+import pytest
+
+from terminedia_paint import _parse_args
+
+
+def test_jobs():
+    args = _parse_args(["--export", "drawing.snapshot", "-j", "3"])
+    assert args.jobs == 3
+    assert _parse_args(["--export", "drawing.snapshot"]).jobs is None
+
+
+@pytest.mark.parametrize("value", ["0", "-2", "x"])
+def test_bad_jobs_are_rejected(value, capsys):
+    with pytest.raises(SystemExit):
+        _parse_args(["--export", "drawing.snapshot", "-j", value])
+    assert "1 or more" in capsys.readouterr().err
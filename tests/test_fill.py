@@ -0,0 +1,87 @@
+import random
+
+import pytest
+import terminedia as TM
+
+from terminedia_paint.fill import SpanFill
+from terminedia_paint.subcells import LAYOUTS, BitPlane
+
+SIZE = (24, 10)
+VIEWS = ("block", "square", "high", "sextant", "braille")
+
+
+def dotted(name, seed):
+    """A shape with random dots drawn on the 'name' view of it"""
+    rnd = random.Random(seed)
+    shape = TM.shape(SIZE)
+    view = shape if name == "block" else getattr(shape, name)
+    view.context.color = (255, 0, 0)
+    width, height = view.size
+    for _ in range(width * height // 3):
+        view.draw.set((rnd.randrange(width), rnd.randrange(height)))
+    return shape
+
+
+def drawable(shape, name):
+    if name == "block":
+        return shape
+    if name == "square":
+        return shape.square
+    return BitPlane(shape, name)
+
+
+def cells(shape, name):
+    # terminedia recolors whole cells around sub-cell fills: only the characters match
+    if name in ("block", "square"):
+        return [tuple(map(str, shape[x, y])) for y in range(shape.height) for x in range(shape.width)]
+    return [shape[x, y][0] for y in range(shape.height) for x in range(shape.width)]
+
+
+def expected(name, seed, pos):
+    shape = dotted(name, seed)
+    view = shape if name == "block" else getattr(shape, name)
+    view.context.color = (0, 0, 255)
+    view.draw.floodfill(pos)
+    return cells(shape, name)
+
+
+@pytest.mark.parametrize("name", VIEWS)
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_floodfill(name, seed):
+    pos = (3, 3)
+    shape = dotted(name, seed)
+    target = drawable(shape, name)
+    target.context.color = (0, 0, 255)
+    SpanFill(target, pos).run()
+    assert cells(shape, name) == expected(name, seed, pos)
+
+
+@pytest.mark.parametrize("name", VIEWS)
+def test_steps_with_few_pending_spans(name):
+    pos = (5, 2)
+    shape = dotted(name, 7)
+    target = drawable(shape, name)
+    target.context.color = (0, 0, 255)
+    fill = SpanFill(target, pos, max_pending=4)
+    while not fill.step(0.0001):
+        pass
+    assert cells(shape, name) == expected(name, 7, pos)
+
+
+@pytest.mark.parametrize("name", ("high", "sextant", "braille"))
+def test_seed_in_a_text_cell(name):
+    def text_shape():
+        shape = dotted(name, 3)
+        shape[2, 1] = "A"
+        shape[3, 1] = "B"
+        shape[9, 5] = "C"
+        return shape
+
+    pos = (4, LAYOUTS[name][2])
+    reference = text_shape()
+    getattr(reference, name).draw.floodfill(pos)
+    shape = text_shape()
+    fill = SpanFill(BitPlane(shape, name), pos)
+    assert fill.run() == 2 * LAYOUTS[name][1] * LAYOUTS[name][2]
+    assert cells(shape, name) == cells(reference, name)
+    assert shape[9, 5][0] == "C"
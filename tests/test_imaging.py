@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from terminedia_paint import imaging
+
+pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+WHITE = (255, 255, 255)
+NAVY = (0, 0, 128)
+
+
+def one_row(resolution, colors, width=6, seed=2):
+    """An image converted to a single row of 'width' cells, without any resizing"""
+    res = imaging.RESOLUTIONS[resolution]
+    img = Image.new("RGB", (width * res.block_width, res.block_height))
+    rnd = random.Random(seed)
+    data = [rnd.choice(colors) for _ in range(img.width * img.height)]
+    img.putdata(data)
+    return img, data
+
+
+def pixels(shape, resolution):
+    """The color each sub-cell pixel of a single row shape shows"""
+    res = imaging.RESOLUTIONS[resolution]
+    masks = {char: mask for mask, char in res.chars.items()}
+    result = []
+    for y in range(res.block_height):
+        for x in range(shape.width * res.block_width):
+            char, fg, bg, _ = shape[x // res.block_width, 0]
+            lit = masks[char] & res.bits[y][x % res.block_width]
+            result.append(tuple(fg if lit else bg)[:3])
+    return result
+
+
+@pytest.mark.parametrize("resolution", list(imaging.RESOLUTIONS))
+def test_two_colors_are_kept_exactly(resolution):
+    img, data = one_row(resolution, [WHITE, NAVY])
+    shape = imaging.pil_to_shape(img, 6, resolution)
+    assert shape.size == (6, 1)
+    assert pixels(shape, resolution) == data
+
+
+@pytest.mark.parametrize("resolution", ["block", "square"])
+def test_same_as_terminedia_conversion(resolution):
+    # at these resolutions terminedia also keeps a color for each pixel
+    img, _ = one_row(resolution, [WHITE, NAVY, (200, 30, 30)])
+    fast = imaging.pil_to_shape(img, 6, resolution)
+    slow = imaging._fallback_image_to_shape(img, 6, resolution)
+    assert pixels(fast, resolution) == pixels(slow, resolution)
+
+
+def test_luminance_split():
+    img = Image.new("RGB", (2, 2))
+    # two bright pixels, averaged into the foreground, two dark ones into the background
+    img.putdata([(250, 250, 250), (20, 0, 0), (0, 0, 40), (200, 220, 240)])
+    chars, fg, bg = imaging.pil_to_cells(img, 1, "high")
+    res = imaging.RESOLUTIONS["high"]
+    assert chars == [[res.chars[res.bits[0][0] | res.bits[1][1]]]]
+    assert fg[0][0].tolist() == [225, 235, 245]
+    assert bg[0][0].tolist() == [10, 0, 20]
+
+
+def test_flat_cells_are_full_blocks():
+    img = Image.new("RGB", (4, 4), (10, 100, 200))
+    chars, fg, bg = imaging.pil_to_cells(img, 2, "high", dither=True)
+    assert chars == [["█", "█"]]
+    assert fg.tolist() == bg.tolist() == [[[10, 100, 200]] * 2]
+
+
+def test_dither():
+    # the same ramp in every cell: plain thresholds split them all the same way,
+    # dithering by where each cell falls in the threshold map
+    img = Image.new("RGB", (64, 48))
+    img.putdata([((x % 2) * 120 + (y % 3) * 40,) * 3 for y in range(48) for x in range(64)])
+    plain, _, _ = imaging.pil_to_cells(img, 32, "sextant")
+    dithered, fg, bg = imaging.pil_to_cells(img, 32, "sextant", dither=True)
+    assert len({char for row in plain for char in row}) == 1
+    assert len({char for row in dithered for char in row}) > 1
+    assert dithered == imaging.pil_to_cells(img, 32, "sextant", dither=True)[0]
+    assert (fg.astype(int).sum(axis=2) >= bg.astype(int).sum(axis=2)).all()
+
+
+def test_image_to_shape_is_cached(tmp_path):
+    path = tmp_path / "image.png"
+    one_row("square", [WHITE, NAVY])[0].save(path)
+    imaging.cache_clear()
+    first = imaging.image_to_shape(path, 6)
+    assert imaging.image_to_shape(path, 6) is first
+    assert imaging.image_to_shape(path, 6, dither=True) is not first
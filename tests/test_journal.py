@@ -0,0 +1,114 @@
+import terminedia as TM
+
+from terminedia_paint.journal import RECORD, UndoJournal
+
+
+def make_journal(**kwargs):
+    shape = TM.shape((10, 5))
+    return shape, UndoJournal(shape, **kwargs)
+
+
+def chars(shape, y=0):
+    return "".join(shape[x, y][0] for x in range(shape.width))
+
+
+def test_undo_redo():
+    shape, journal = make_journal()
+    shape[1, 0] = "a"
+    journal.tick()
+    shape[2, 0] = "b"
+    journal.tick()
+    assert len(journal) == 2
+    assert journal.undo()
+    assert chars(shape) == " a        "
+    assert journal.undo()
+    assert chars(shape) == " " * 10
+    assert not journal.undo()
+    assert journal.redo()
+    assert journal.redo()
+    assert chars(shape) == " ab       "
+    assert not journal.redo()
+
+
+def test_new_change_drops_redo():
+    shape, journal = make_journal()
+    shape[1, 0] = "a"
+    journal.tick()
+    journal.undo()
+    shape[3, 0] = "c"
+    journal.tick()
+    assert not journal.redo()
+    assert chars(shape) == "   c      "
+
+
+def test_action_groups_changes():
+    shape, journal = make_journal()
+    journal.begin()
+    shape[1, 0] = "a"
+    journal.tick()
+    journal.begin()
+    shape[2, 0] = "b"
+    journal.end()
+    journal.tick()
+    shape[3, 0] = "c"
+    journal.end()
+    assert len(journal) == 1
+    journal.undo()
+    assert chars(shape) == " " * 10
+
+
+def test_unchanged_cells_are_not_recorded():
+    shape, journal = make_journal()
+    shape[1, 0] = " "
+    journal.tick()
+    assert len(journal) == 0
+
+
+def test_undo_restores_colors():
+    shape, journal = make_journal()
+    shape.context.color = (255, 0, 0)
+    shape[1, 1] = "a"
+    journal.tick()
+    shape.context.color = (0, 0, 255)
+    shape[1, 1] = "b"
+    journal.tick()
+    journal.undo()
+    char, fg, *_ = shape[1, 1]
+    assert (char, tuple(fg)) == ("a", (255, 0, 0))
+
+
+def test_max_bytes_drops_oldest():
+    shape, journal = make_journal(max_bytes=3 * RECORD.size)
+    for x in range(6):
+        shape[x, 0] = "x"
+        journal.tick()
+    assert len(journal) == 3
+    while journal.undo():
+        pass
+    assert chars(shape) == "xxx       "
+
+
+def test_suspended_changes_are_not_recorded():
+    shape, journal = make_journal()
+    with journal.suspended():
+        shape[1, 0] = "a"
+    journal.tick()
+    assert len(journal) == 0
+
+
+def test_swap_history():
+    shape, journal = make_journal()
+    shape[1, 0] = "a"
+    first = journal.swap_history(None, journal.new_target())
+    assert len(journal) == 0
+    assert journal.parked == RECORD.size
+    shape[2, 0] = "b"
+    journal.tick()
+    second = journal.swap_history(first, 0)
+    assert journal.target == 0
+    assert journal.parked == RECORD.size
+    assert journal.undo()
+    assert not journal.undo()
+    assert chars(shape) == "  b       "
+    journal.drop_history(second)
+    assert journal.parked == 0
@@ -0,0 +1,106 @@
+import terminedia as TM
+
+from terminedia_paint.canvas import CellGrid
+from terminedia_paint.cells import CellCodec
+from terminedia_paint.layers import EMPTY_ENCODED, compose, flatten_grids, mix
+
+codec = CellCodec()
+RED = TM.Color((255, 0, 0))
+BLUE = TM.Color((0, 0, 255))
+GREEN = TM.Color((0, 255, 0))
+BLACK = TM.Color((0, 0, 0))
+
+
+def cell(char, fg=RED, bg=BLACK):
+    return codec.encode((char, fg, bg, TM.Effects.none))
+
+
+def test_opaque_cell_covers_below():
+    top, bottom = cell("a"), cell("b", BLUE, GREEN)
+    assert compose(top, bottom) == top
+
+
+def test_empty_cell_shows_below():
+    bottom = cell("b")
+    assert compose(EMPTY_ENCODED, bottom) == bottom
+    assert compose(cell(" ", RED, TM.DEFAULT_BG), bottom) == bottom
+
+
+def test_character_on_default_background_keeps_background_below():
+    top, bottom = cell("a", RED, TM.DEFAULT_BG), cell("b", BLUE, GREEN)
+    assert compose(top, bottom) == cell("a", RED, GREEN)
+
+
+def test_key_color():
+    key = codec.encode_color(GREEN)
+    bottom = cell("b", BLUE, RED)
+    # on a key background: the character is drawn over what is below
+    assert compose(cell("a", BLUE, GREEN), bottom, key=key) == cell("a", BLUE, RED)
+    # in the key color: the character is not shown
+    assert compose(cell("a", GREEN, BLACK), bottom, key=key) == cell(" ", GREEN, BLACK)
+    assert compose(cell("a", GREEN, GREEN), bottom, key=key) == bottom
+
+
+def test_opacity():
+    top, bottom = cell("a", RED, BLUE), cell("b", BLUE, GREEN)
+    assert compose(top, bottom, 0) == bottom
+    char, fg, bg, effects = compose(top, bottom, 0.5)
+    assert char == ord("a")
+    assert bg == mix(codec.encode_color(GREEN), codec.encode_color(BLUE), 0.5) == 0x008080
+    assert fg == mix(bg, codec.encode_color(RED), 0.5)
+
+
+def test_flatten_grids():
+    grids = [CellGrid((4, 1), codec, EMPTY_ENCODED) for _ in range(3)]
+    grids[0].set_encoded((0, 0), cell("a"))
+    grids[0].set_encoded((1, 0), cell("a"))
+    grids[1].set_encoded((1, 0), cell("b"))
+    grids[1].set_encoded((2, 0), cell("b"))
+    grids[2].set_encoded((3, 0), cell("c"))
+    settings = [(True, 1.0, None), (True, 1.0, None), (False, 1.0, None)]
+    result = flatten_grids(grids, settings)
+    assert [result.get_encoded((x, 0)) for x in range(4)] == [cell("a"), cell("b"), cell("b"), EMPTY_ENCODED]
+    for grid, expected in zip(grids, ["aa  ", " bb ", "   c"]):
+        # the inputs are left alone
+        assert "".join(grid.get((x, 0))[0] for x in range(4)) == expected
+
+
+def screen_char(session, pos):
+    return session.screen.shape[pos][0]
+
+
+def test_per_layer_undo(session):
+    painter = session.painter
+    session.drag([(1, 1), (8, 1)])
+    painter.new_layer()
+    session.drag([(1, 5), (8, 5)])
+    assert screen_char(session, (3, 1)) != " "
+    assert screen_char(session, (3, 5)) != " "
+    painter.select_layer(-1)
+    # undoes the stroke on the first layer, not the one just drawn on the second
+    while painter.journal.undo():
+        pass
+    painter.viewport.sync()
+    assert painter.viewport.get((3, 1))[0] == " "
+    assert screen_char(session, (3, 5)) != " "
+    painter.select_layer(1)
+    assert painter.journal.undo()
+    painter.viewport.sync()
+    assert painter.viewport.get((3, 5))[0] == " "
+    painter.select_layer(-1)
+    while painter.journal.redo():
+        pass
+    painter.viewport.sync()
+    assert painter.viewport.get((3, 1))[0] != " "
+
+
+def test_removed_layer_drops_its_history(session):
+    painter = session.painter
+    session.drag([(1, 1), (8, 1)])
+    painter.new_layer()
+    session.drag([(1, 5), (8, 5)])
+    assert painter.journal.parked
+    painter.remove_layer()
+    assert len(painter.layers) == 1
+    assert painter.journal.parked == 0
+    assert len(painter.journal)
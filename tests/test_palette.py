@@ -0,0 +1,99 @@
+import random
+
+import pytest
+import terminedia as TM
+
+from terminedia_paint import palette
+from terminedia_paint.canvas import Canvas
+
+
+def brute_force(rgb, mode):
+    colors = palette.PALETTES[mode]
+    return min(palette.CANDIDATES[mode], key=lambda index: palette._distance(rgb, colors[index]))
+
+
+def distance(rgb, index, mode):
+    return palette._distance(rgb, palette.PALETTES[mode][index])
+
+
+def random_colors(count=2000, seed=1):
+    rnd = random.Random(seed)
+    return [tuple(rnd.randrange(256) for _ in range(3)) for _ in range(count)]
+
+
+def test_xterm_colors():
+    assert palette.xterm_color(1) == (205, 0, 0)
+    assert palette.xterm_color(16) == (0, 0, 0)
+    assert palette.xterm_color(196) == (255, 0, 0)
+    assert palette.xterm_color(231) == (255, 255, 255)
+    assert palette.xterm_color(232) == (8, 8, 8)
+    assert palette.xterm_color(255) == (238, 238, 238)
+
+
+@pytest.mark.parametrize("mode", ["256", "16"])
+def test_nearest_is_close_to_brute_force(mode):
+    # colors are looked up by the center of their grid box, up to 4 units
+    # away per component: the pick can be off by twice that distance
+    slack = 2 * (3 * 4 ** 2) ** 0.5
+    for rgb in random_colors():
+        index = palette.nearest(rgb, mode)
+        assert index in palette.CANDIDATES[mode]
+        best = brute_force(rgb, mode)
+        assert distance(rgb, index, mode) ** 0.5 <= distance(rgb, best, mode) ** 0.5 + slack
+
+
+@pytest.mark.parametrize("mode", ["256", "16"])
+def test_lookup_table_at_box_centers(mode):
+    table = palette.lookup_table(mode)
+    centers = palette._box_centers()
+    for center in random.Random(2).sample(centers, 500):
+        index = table[palette._table_index(*center)]
+        assert distance(center, index, mode) == distance(center, brute_force(center, mode), mode)
+
+
+@pytest.mark.parametrize("mode", ["256", "16"])
+def test_palette_colors_are_kept(mode):
+    for index in palette.CANDIDATES[mode]:
+        assert palette.nearest(palette.PALETTES[mode][index], mode) == index
+
+
+@pytest.mark.parametrize("mode", ["256", "16"])
+def test_quantize_color(mode):
+    assert palette.quantize_color(TM.DEFAULT_FG, mode) is TM.DEFAULT_FG
+    color = TM.Color((250, 10, 10))
+    assert palette.quantize_color(color, "truecolor") is color
+    assert tuple(palette.quantize_color(color, mode)) == palette.PALETTES[mode][palette.nearest((250, 10, 10), mode)]
+
+
+@pytest.mark.parametrize("mode", ["256", "16"])
+def test_quantize_array(mode):
+    np = pytest.importorskip("numpy")
+    colors = random_colors(500)
+    result = palette.quantize_array(np.array(colors, dtype=np.uint8).reshape(20, 25, 3), mode)
+    assert result.shape == (20, 25, 3)
+    expected = [palette.PALETTES[mode][palette.nearest(rgb, mode)] for rgb in colors]
+    assert [tuple(rgb) for rgb in result.reshape(-1, 3).tolist()] == expected
+
+
+@pytest.mark.parametrize("mode", ["256", "16"])
+def test_quantize_shape(mode):
+    shape = TM.shape((4, 1))
+    shape.context.color = (250, 10, 10)
+    shape[1, 0] = "x"
+    palette.quantize_shape(shape, mode)
+    assert tuple(shape[1, 0][1]) == palette.PALETTES[mode][palette.nearest((250, 10, 10), mode)]
+    assert shape[0, 0][1] == TM.DEFAULT_FG
+
+
+def test_quantize_canvas():
+    canvas = Canvas()
+    canvas.set((1, 1), ("x", TM.Color((250, 10, 10)), TM.Color((0, 0, 0)), TM.Effects.none))
+    canvas.set((100, 1), ("y", TM.DEFAULT_FG, TM.Color((255, 0, 0)), TM.Effects.none))
+    changes = palette.quantize_canvas(canvas, "256")
+    # the other colors are in the palette already
+    assert list(changes) == [(1, 1)]
+    char, fg, bg, effects = changes[1, 1]
+    assert fg == 0xff0000
+    assert bg == canvas.get_encoded((1, 1))[2]
+    assert canvas.get((1, 1))[1] == TM.Color((250, 10, 10))
+    assert palette.quantize_canvas(canvas, "truecolor") == {}
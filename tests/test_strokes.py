@@ -0,0 +1,65 @@
+import terminedia as TM
+from terminedia.events import Event, MouseClick, MouseMove
+from terminedia.utils import V2
+
+from terminedia_paint.strokes import StrokeBuffer, line_points, polyline_points
+
+
+def drawn_by_terminedia(pos1, pos2):
+    shape = TM.shape((30, 30))
+    shape.draw.line(pos1, pos2)
+    return {(x, y) for y in range(30) for x in range(30) if shape[x, y][0] != " "}
+
+
+def test_line_points_follow_terminedia():
+    for pos1, pos2 in [((2, 3), (20, 9)), ((25, 1), (4, 28)), ((5, 5), (5, 20)), ((0, 7), (29, 7)), ((3, 3), (3, 3))]:
+        points = line_points(pos1, pos2)
+        assert points[0] == pos1
+        assert set(points) == drawn_by_terminedia(pos1, pos2)
+
+
+def test_polyline_points_are_listed_once():
+    points = polyline_points([(0, 0), (4, 0), (4, 2), (0, 0)])
+    assert len(points) == len(set(points))
+    assert points[:5] == [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)]
+    assert set(points) == set(line_points((0, 0), (4, 0)) + line_points((4, 0), (4, 2)) + line_points((4, 2), (0, 0)))
+
+
+def test_polyline_continues_a_stroke():
+    assert polyline_points([(3, 0)], start=(0, 0)) == [(1, 0), (2, 0), (3, 0)]
+    assert polyline_points([(0, 0)], start=(0, 0)) == []
+    assert polyline_points([(2, 2)]) == [(2, 2)]
+
+
+def test_stroke_buffer():
+    buffer = StrokeBuffer(history_size=2)
+    assert not buffer
+    for tick, pos in enumerate([(1, 1), (1, 1), (2, 1), (1, 1)]):
+        buffer.add(pos, tick)
+    assert buffer
+    assert (buffer.first_tick, buffer.last_tick) == (0, 3)
+    assert buffer.take() == [(1, 1), (2, 1), (1, 1)]
+    assert not buffer
+    assert buffer.take() == []
+    buffer.add((5, 5), 4)
+    buffer.take()
+    buffer.add((6, 6), 5)
+    buffer.take()
+    assert list(buffer.history) == [1, 1]
+    assert buffer.summary.startswith("events/stroke op: last 1")
+
+
+def test_stroke_closed_when_the_release_is_lost(session):
+    painter = session.painter
+    painter.mouse_click(Event(MouseClick, dispatch=False, pos=V2(1, 1), buttons=1, tick=session.tick))
+    for x in range(2, 8):
+        painter.mouse_move(Event(MouseMove, dispatch=False, pos=V2(x, 1), buttons=1, tick=session.tick))
+        session.frame()
+    assert painter.journal.depth
+    # the release happened outside the terminal: a key press comes next
+    session.key("<")
+    assert painter.journal.depth == 0
+    assert painter.viewport.get((3, 1))[0] != " "
+    while painter.journal.undo():
+        pass
+    assert painter.viewport.get((3, 1))[0] == " "
@@ -0,0 +1,99 @@
+import pytest
+import terminedia as TM
+
+from terminedia_paint.subcells import LAYOUTS, BitPlane
+
+SIZE = (16, 8)
+
+
+def chars(shape):
+    return [[shape[x, y][0] for x in range(shape.width)] for y in range(shape.height)]
+
+
+def both(name):
+    """A shape drawn on through a BitPlane, and one drawn on by terminedia"""
+    shape = TM.shape(SIZE)
+    reference = TM.shape(SIZE)
+    return shape, BitPlane(shape, name), reference, getattr(reference, name)
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_size(name):
+    shape, plane, reference, view = both(name)
+    assert plane.size == view.size
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_lines(name):
+    shape, plane, reference, view = both(name)
+    width, height = view.size
+    for pos1, pos2 in [((0, 0), (width - 1, height - 1)), ((3, height - 2), (width - 5, 1)), ((1, 4), (1, height - 1))]:
+        plane.draw.line(pos1, pos2)
+        view.draw.line(pos1, pos2)
+        assert chars(shape) == chars(reference)
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_rects_and_ellipses(name):
+    shape, plane, reference, view = both(name)
+    for drawing in (plane.draw, view.draw):
+        drawing.rect((2, 1), (13, 9))
+        drawing.rect((5, 3), (9, 6), fill=True)
+        drawing.ellipse((14, 2), (29, 14))
+    assert chars(shape) == chars(reference)
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_erasing(name):
+    shape, plane, reference, view = both(name)
+    for drawing in (plane.draw, view.draw):
+        drawing.rect((0, 0), (12, 8), fill=True)
+        drawing.context.color = TM.DEFAULT_FG
+        drawing.line((0, 0), (11, 7), erase=True)
+    assert chars(shape) == chars(reference)
+
+
+def test_set_get_reset():
+    shape = TM.shape(SIZE)
+    plane = BitPlane(shape, "high")
+    plane.set((3, 1))
+    assert shape[1, 0][0] == "▗"
+    assert plane.get((3, 1)) is True
+    assert plane.get((2, 1)) is False
+    plane.reset((3, 1))
+    assert shape[1, 0][0] == " "
+    # off the shape
+    assert plane.get((100, 100)) is False
+    plane.set((100, 100))
+
+
+def test_batched_writes():
+    shape = TM.shape(SIZE)
+    plane = BitPlane(shape, "braille")
+    with plane:
+        plane.set((0, 0))
+        plane.set((1, 0))
+        assert shape[0, 0][0] == " "
+    assert shape[0, 0][0] == "⠉"
+
+
+def test_other_characters():
+    shape = TM.shape(SIZE)
+    plane = BitPlane(shape, "sextant")
+    shape[2, 1] = "A"
+    assert plane.get((4, 3)) is None
+    # cells changed on the shape are read again
+    shape[2, 1] = "▌"
+    assert plane.get((4, 3)) is True
+    assert plane.get((5, 3)) is False
+    shape.clear()
+    assert plane.get((4, 3)) is False
+
+
+def test_span():
+    shape = TM.shape(SIZE)
+    plane = BitPlane(shape, "high")
+    plane.set_span(1, 6, 0)
+    assert [shape[x, 0][0] for x in range(5)] == ["▝", "▀", "▀", "▘", " "]
+    plane.set_span(2, 3, 0, erase=True)
+    assert [shape[x, 0][0] for x in range(5)] == ["▝", " ", "▀", "▘", " "]
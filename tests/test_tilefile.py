@@ -0,0 +1,124 @@
+import pytest
+import terminedia as TM
+
+from terminedia_paint import tilefile
+from terminedia_paint.canvas import Canvas
+from terminedia_paint.cells import CellCodec
+
+RED = TM.Color((255, 0, 0))
+BLUE = TM.Color((0, 0, 255))
+BLACK = TM.Color((0, 0, 0))
+
+
+def raw(shape, pos):
+    return tuple(map(str, shape.get_raw(pos)))
+
+
+def test_shape_round_trip(tmp_path):
+    shape = TM.shape((100, 40))
+    shape.context.color = RED
+    shape.draw.line((0, 0), (99, 39))
+    shape.context.color = BLUE
+    shape.context.background = (10, 20, 30)
+    shape.context.effects = TM.Effects.underline
+    shape.text[1].at((3, 30), "hello, wörld")
+    path = tmp_path / "drawing.tpaint"
+    tilefile.save_shape(shape, path)
+    loaded = tilefile.load_shape(path)
+    assert loaded.size == shape.size
+    for y in range(shape.height):
+        for x in range(shape.width):
+            assert raw(loaded, (x, y)) == raw(shape, (x, y)), (x, y)
+
+
+def save_two_layers(path, top_settings):
+    codec = CellCodec()
+    bottom, top = Canvas(codec=codec), Canvas(codec=codec)
+    for x in range(2, 8):
+        bottom.set((x, 2), ("#", RED, BLACK, TM.Effects.none))
+    top.set((5, 2), ("@", BLUE, BLACK, TM.Effects.none))
+    # far away, in a tile the bottom layer doesn't have
+    top.set((70, 50), ("@", BLUE, BLACK, TM.Effects.none))
+    settings = {"name": "bottom", "visible": True, "opacity": 1.0, "key": None}
+    layers = [(settings, bottom.tiles), ({"name": "top", **top_settings}, top.tiles)]
+    tilefile.save_layers(layers, codec.strings, bottom.tile_size, (80, 60), path)
+
+
+def cells(tile_file, layer=None):
+    return {
+        (x, y): cell[0]
+        for key, layers in tile_file.directory.items()
+        if layer is None or layer in layers
+        for x, y, cell in tile_file.iter_cells(key, layer)
+        if cell[0] != " "
+    }
+
+
+def test_layers_round_trip(tmp_path):
+    path = tmp_path / "layers.tpaint"
+    key = CellCodec.encode_color(BLACK)
+    save_two_layers(path, {"visible": True, "opacity": 0.5, "key": key})
+    with tilefile.TileFile(path) as tile_file:
+        assert [settings["name"] for settings in tile_file.layers] == ["bottom", "top"]
+        assert tile_file.layers[1]["opacity"] == 0.5
+        assert tile_file.layers[1]["key"] == key
+        assert tile_file.size == (80, 60)
+        assert cells(tile_file, 0) == {(x, 2): "#" for x in range(2, 8)}
+        assert cells(tile_file, 1) == {(5, 2): "@", (70, 50): "@"}
+
+
+def test_layers_are_composited(tmp_path):
+    path = tmp_path / "layers.tpaint"
+    save_two_layers(path, {"visible": True, "opacity": 1.0, "key": None})
+    with tilefile.TileFile(path) as tile_file:
+        flat = cells(tile_file)
+        shape = tile_file.to_shape()
+    assert flat == {**{(x, 2): "#" for x in range(2, 8)}, (5, 2): "@", (70, 50): "@"}
+    assert shape[5, 2][0] == "@"
+    assert shape[6, 2][0] == "#"
+
+
+def test_hidden_layers_are_left_out(tmp_path):
+    path = tmp_path / "layers.tpaint"
+    save_two_layers(path, {"visible": False, "opacity": 1.0, "key": None})
+    with tilefile.TileFile(path) as tile_file:
+        assert cells(tile_file) == {(x, 2): "#" for x in range(2, 8)}
+
+
+BOTTOM_LAYER = b'{"name": "bottom", "visible": true, "opacity": 1.0, "key": null}'
+
+
+@pytest.mark.parametrize("replacement", [
+    BOTTOM_LAYER.replace(b"null", b"1234"),
+    b"[]".ljust(len(BOTTOM_LAYER)),
+    b"17".ljust(len(BOTTOM_LAYER)),
+], ids=["key", "list", "number"])
+def test_bad_layer_settings(tmp_path, replacement):
+    path = tmp_path / "layers.tpaint"
+    save_two_layers(path, {"visible": True, "opacity": 1.0, "key": None})
+    data = path.read_bytes()
+    assert data.count(BOTTOM_LAYER) == 1
+    path.write_bytes(data.replace(BOTTOM_LAYER, replacement))
+    with pytest.raises(tilefile.FormatError):
+        tilefile.TileFile(path)
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.tpaint"
+    path.write_bytes(b"")
+    with pytest.raises(tilefile.FormatError):
+        tilefile.TileFile(path)
+
+
+def test_corrupt_tile(tmp_path):
+    shape = TM.shape((60, 20))
+    shape.draw.line((0, 0), (59, 19))
+    path = tmp_path / "drawing.tpaint"
+    tilefile.save_shape(shape, path)
+    with tilefile.TileFile(path) as tile_file:
+        first = min(offset for layers in tile_file.directory.values() for offset, _ in layers.values())
+    data = bytearray(path.read_bytes())
+    data[first: first + 8] = b"\xff" * 8
+    path.write_bytes(data)
+    with pytest.raises(tilefile.FormatError):
+        tilefile.load_shape(path)